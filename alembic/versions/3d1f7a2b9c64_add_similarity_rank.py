@@ -0,0 +1,30 @@
+"""add rank and score to movie_similarities
+
+Revision ID: 3d1f7a2b9c64
+Revises: c497c0bd4bcb
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d1f7a2b9c64'
+down_revision: Union[str, Sequence[str], None] = 'c497c0bd4bcb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('movie_similarities', sa.Column('rank', sa.Integer(), nullable=True))
+    op.add_column('movie_similarities', sa.Column('score', sa.Float(), nullable=True))
+    op.create_index('ix_movie_similarities_movie_id_rank', 'movie_similarities', ['movie_id', 'rank'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movie_similarities_movie_id_rank', table_name='movie_similarities')
+    op.drop_column('movie_similarities', 'score')
+    op.drop_column('movie_similarities', 'rank')
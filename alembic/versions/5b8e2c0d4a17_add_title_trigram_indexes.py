@@ -0,0 +1,35 @@
+"""add trigram indexes on movie titles
+
+Revision ID: 5b8e2c0d4a17
+Revises: 3d1f7a2b9c64
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e2c0d4a17'
+down_revision: Union[str, Sequence[str], None] = '3d1f7a2b9c64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_movies_title_trgm', 'movies', ['title'], unique=False,
+        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'},
+    )
+    op.create_index(
+        'ix_movies_english_title_trgm', 'movies', ['english_title'], unique=False,
+        postgresql_using='gin', postgresql_ops={'english_title': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movies_english_title_trgm', table_name='movies')
+    op.drop_index('ix_movies_title_trgm', table_name='movies')
@@ -0,0 +1,39 @@
+"""lowercase genres and add GIN index on movies.genres
+
+Revision ID: 8a4c6e1f2b93
+Revises: 5b8e2c0d4a17
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4c6e1f2b93'
+down_revision: Union[str, Sequence[str], None] = '5b8e2c0d4a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Фильтр сравнивает жанры точно, поэтому приводим уже сохраненные к нижнему регистру (порядок сохраняется)
+    op.execute("""
+        UPDATE movies SET genres = ARRAY(
+            SELECT genre FROM (
+                SELECT lower(btrim(value)) AS genre, min(position) AS position
+                FROM unnest(movies.genres) WITH ORDINALITY AS t(value, position)
+                WHERE btrim(value) <> ''
+                GROUP BY 1
+            ) AS normalized
+            ORDER BY position
+        )
+        WHERE genres IS NOT NULL
+    """)
+    op.create_index('ix_movies_genres_gin', 'movies', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movies_genres_gin', table_name='movies')
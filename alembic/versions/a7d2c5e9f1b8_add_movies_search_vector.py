@@ -0,0 +1,51 @@
+"""add full-text search_vector on movies maintained by trigger
+
+Revision ID: a7d2c5e9f1b8
+Revises: f6a3d8b2c7e4
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2c5e9f1b8'
+down_revision: Union[str, Sequence[str], None] = 'f6a3d8b2c7e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('ALTER TABLE movies ADD COLUMN search_vector tsvector')
+    # Веса: названия - A, режиссер и актеры - B, описание - C (ts_rank ставит совпадения в названии выше)
+    op.execute("""
+        CREATE FUNCTION movies_search_vector_update() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(NEW.english_title, '')), 'A') ||
+                setweight(to_tsvector('simple',
+                    coalesce(NEW.director, '') || ' ' || coalesce(array_to_string(NEW.persons, ' '), '')), 'B') ||
+                setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'C');
+            RETURN NEW;
+        END
+        $$
+    """)
+    op.execute("""
+        CREATE TRIGGER movies_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF title, english_title, description, director, persons ON movies
+        FOR EACH ROW EXECUTE FUNCTION movies_search_vector_update()
+    """)
+    # Заполняем для уже загруженных фильмов тем же триггером
+    op.execute('UPDATE movies SET title = title')
+    op.create_index('ix_movies_search_vector', 'movies', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movies_search_vector', table_name='movies')
+    op.execute('DROP TRIGGER movies_search_vector_trigger ON movies')
+    op.execute('DROP FUNCTION movies_search_vector_update()')
+    op.execute('ALTER TABLE movies DROP COLUMN search_vector')
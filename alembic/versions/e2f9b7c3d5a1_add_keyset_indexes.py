@@ -0,0 +1,35 @@
+"""add composite indexes for keyset pagination
+
+Revision ID: e2f9b7c3d5a1
+Revises: 8a4c6e1f2b93
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f9b7c3d5a1'
+down_revision: Union[str, Sequence[str], None] = '8a4c6e1f2b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_movies_keyset_rating', 'movies',
+        [sa.text('coalesce(combined_rating, -1)'), 'sum_votes', 'id'], unique=False,
+    )
+    op.create_index('ix_movies_keyset_year', 'movies', [sa.text('coalesce(year_release, 0)'), 'id'], unique=False)
+    op.create_index('ix_movies_keyset_votes', 'movies', ['sum_votes', 'id'], unique=False)
+    op.create_index('ix_movies_keyset_title', 'movies', ['title', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movies_keyset_title', table_name='movies')
+    op.drop_index('ix_movies_keyset_votes', table_name='movies')
+    op.drop_index('ix_movies_keyset_year', table_name='movies')
+    op.drop_index('ix_movies_keyset_rating', table_name='movies')
@@ -0,0 +1,36 @@
+"""add movie_top_ranking materialized view
+
+Revision ID: f6a3d8b2c7e4
+Revises: e2f9b7c3d5a1
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a3d8b2c7e4'
+down_revision: Union[str, Sequence[str], None] = 'e2f9b7c3d5a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Тот же отбор и порядок, что у /api/movies/top без фильтров; id - для однозначного порядка
+    op.execute("""
+        CREATE MATERIALIZED VIEW movie_top_ranking AS
+        SELECT id AS movie_id,
+               row_number() OVER (ORDER BY combined_rating DESC, sum_votes DESC, id) AS position
+        FROM movies
+        WHERE sum_votes >= 50000
+    """)
+    # Уникальный индекс нужен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.execute("CREATE UNIQUE INDEX ix_movie_top_ranking_movie_id ON movie_top_ranking (movie_id)")
+    op.execute("CREATE INDEX ix_movie_top_ranking_position ON movie_top_ranking (position)")
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS movie_top_ranking")
@@ -110,6 +110,14 @@ def user_stats(
         raise HTTPException(status_code=404, detail=str(exc))
 
 
+@router.get("/recommender_stats")
+def recommender_stats(service: AdminStatsService = Depends(get_service)):
+    """
+    /recommender_stats - Кэш, очередь и время этапов рекомендаций бота вопрос-ответ
+    """
+    return service.get_recommender_stats()
+
+
 @router.get("/full_report")
 async def full_report(service: AdminStatsService = Depends(get_service)):
     """
@@ -1,62 +1,147 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from app.api import deps
+from app.core.cursor import InvalidCursorError
 from app.models.user import User
-from app.schemas.movie import MovieResponse, MovieCreate, MovieRecommendationRequest
+from app.recommender.executor import RecommenderBusyError
+from app.recommender.tracing import traced
+from app.schemas.movie import (
+    MovieCard, MovieFacets, MovieList, MovieResponse, MovieSearchList, MovieSuggestion, MovieCreate,
+    MovieRecommendationRequest,
+)
 from app.services import MovieService
 
 router = APIRouter(tags=["Movies"])
 
+CURSOR_DESCRIPTION = (
+    "постраничный вывод по курсору вместо skip: пустое значение - первая страница, "
+    "дальше - значение заголовка X-Next-Cursor"
+)
+FIELDS_DESCRIPTION = "только эти поля MovieResponse через запятую (id есть всегда)"
+VIEW_DESCRIPTION = "full - MovieResponse, card - MovieCard для сетки каталога"
+FUZZY_DESCRIPTION = "нечеткий поиск с учетом опечаток (PostgreSQL)"
+CATALOG_FUZZY_DESCRIPTION = f"{FUZZY_DESCRIPTION}; подстрока названия находится всегда, false - только она"
 
-@router.get("/", response_model=List[MovieResponse])
+
+# Больше id за раз - уже выгрузка, а не список на странице
+BATCH_MAX_IDS = 200
+
+
+def set_next_cursor(response: Response, cursor: Optional[str]) -> None:
+    # Без заголовка - это последняя страница
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+
+
+def select_fields(fields: Optional[str], view: str) -> Optional[List[str]]:
+    """Колонки для выборки или None, если нужен полный MovieResponse"""
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in MovieResponse.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        return list(dict.fromkeys(["id", *names]))
+    if view == "card":
+        return list(MovieCard.model_fields)
+    return None
+
+
+def movies_response(response: Response, movies, columns: Optional[List[str]]):
+    """Выбранные колонки отдаются как есть, без валидации response_model на каждую строку.
+
+    В OpenAPI их форма описана вариантами MovieList: MovieCard для view=card, MovieFields для fields.
+    """
+    if columns is None:
+        return movies
+    content = [{name: getattr(movie, name) for name in columns} for movie in movies]
+    return JSONResponse(jsonable_encoder(content), headers=dict(response.headers))
+
+
+@router.get("/", response_model=MovieList)
 def get_movies(
+    response: Response,
     skip: int = 0,
     limit: int = 250,
-    genre: Optional[str] = Query(None),
+    genre: Optional[List[str]] = Query(None, description="жанр; несколько - повтором параметра или через запятую"),
+    genre_mode: Literal["and", "or"] = Query("and", description="and - все жанры, or - любой из них"),
     year: Optional[int] = Query(None),
     min_rating: Optional[float] = Query(None),
     sort_by: Optional[str] = Query(None, description="rating|year|title|votes"),
     q: Optional[str] = Query(None, description="поиск по названию"),
+    fuzzy: bool = Query(True, description=CATALOG_FUZZY_DESCRIPTION),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    view: Literal["full", "card"] = Query("full", description=VIEW_DESCRIPTION),
     db: Session = Depends(deps.get_db),
 ):
     """Получение списка фильмов для главной страницы и поиска"""
+    columns = select_fields(fields, view)
     service = MovieService(db)
-    return service.get_movies(
-        skip=skip,
-        limit=limit,
-        genre=genre,
-        year=year,
-        min_rating=min_rating,
-        sort_by=sort_by,
-        q=q,
-    )
+    try:
+        movies = service.get_movies(
+            skip=skip,
+            limit=limit,
+            genre=genre,
+            genre_mode=genre_mode,
+            year=year,
+            min_rating=min_rating,
+            sort_by=sort_by,
+            q=q,
+            fuzzy=fuzzy,
+            cursor=cursor,
+            columns=columns,
+        )
+    except InvalidCursorError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if cursor is not None:
+        set_next_cursor(response, service.next_cursor(movies, limit=limit, sort_by=sort_by))
+    return movies_response(response, movies, columns)
 
 
-@router.get("/top", response_model=List[MovieResponse])
+@router.get("/top", response_model=MovieList)
 def get_top_250_movies(
+    response: Response,
     skip: int = 0,
     limit: int = 250,
-    genre: Optional[str] = Query(None),
+    genre: Optional[List[str]] = Query(None, description="жанр; несколько - повтором параметра или через запятую"),
+    genre_mode: Literal["and", "or"] = Query("and", description="and - все жанры, or - любой из них"),
     year: Optional[int] = Query(None),
     min_rating: Optional[float] = Query(None),
     sort_by: Optional[str] = Query("rating", description="rating|year|title|votes"),
     q: Optional[str] = Query(None, description="поиск по названию"),
+    fuzzy: bool = Query(True, description=CATALOG_FUZZY_DESCRIPTION),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    view: Literal["full", "card"] = Query("full", description=VIEW_DESCRIPTION),
     db: Session = Depends(deps.get_db),
     current_user: User | None = Depends(deps.get_optional_user)
 ):
     """Эндпоинт для получения лучших 250 фильмов"""
+    columns = select_fields(fields, view)
     service = MovieService(db)
-    return service.get_top_movies(
-        skip=skip,
-        limit=limit,
-        genre=genre,
-        year=year,
-        min_rating=min_rating,
-        sort_by=sort_by,
-        q=q,
-        current_user=current_user
-    )
+    try:
+        movies = service.get_top_movies(
+            skip=skip,
+            limit=limit,
+            genre=genre,
+            genre_mode=genre_mode,
+            year=year,
+            min_rating=min_rating,
+            sort_by=sort_by,
+            q=q,
+            fuzzy=fuzzy,
+            cursor=cursor,
+            columns=columns,
+            current_user=current_user
+        )
+    except InvalidCursorError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if cursor is not None:
+        set_next_cursor(response, service.next_cursor(movies, limit=limit, sort_by=sort_by, top=True))
+    return movies_response(response, movies, columns)
 
 
 @router.post("/", response_model=MovieResponse, status_code=201)
@@ -73,18 +158,76 @@ def create_movie(
         raise HTTPException(status_code=400, detail=str(exc))
 
 
-@router.get("/search", response_model=List[MovieResponse])
+@router.get("/search", response_model=MovieSearchList)
 def search_movies(
+    response: Response,
     q: str = Query(..., min_length=1),
     skip: int = 0,
     limit: int = 50,
+    fuzzy: bool = Query(True, description=FUZZY_DESCRIPTION),
+    mode: Literal["title", "fulltext"] = Query(
+        "title", description="title - по названию, fulltext - по названиям, описанию, режиссеру и актерам"
+    ),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    view: Literal["full", "card"] = Query("full", description=VIEW_DESCRIPTION),
     db: Session = Depends(deps.get_db),
     current_user: User | None = Depends(deps.get_optional_user),
 ):
     """Эндпоинт для поиска фильма"""
+    columns = select_fields(fields, view)
+    service = MovieService(db)
+    movies = service.search(
+        q=q, skip=skip, limit=limit, fuzzy=fuzzy, mode=mode, columns=columns, current_user=current_user
+    )
+    if columns is not None and mode == "fulltext":
+        # Фрагменты с подсветкой - смысл этого режима, они есть при любом наборе полей
+        columns = [*columns, "headline"]
+    return movies_response(response, movies, columns)
+
 
+@router.get("/batch", response_model=List[MovieResponse])
+def get_movies_batch(
+    ids: List[str] = Query(..., description=f"id фильмов через запятую или повтором параметра, до {BATCH_MAX_IDS}"),
+    log_views: bool = Query(False, description="записать просмотр каждого найденного фильма"),
+    db: Session = Depends(deps.get_db),
+    current_user: User | None = Depends(deps.get_optional_user),
+):
+    """Несколько фильмов одним запросом по первичному ключу, в порядке ids; ненайденные пропускаются"""
+    try:
+        movie_ids = [int(part) for value in ids for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be integers")
+    movie_ids = list(dict.fromkeys(movie_ids))
+    if len(movie_ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids: at most {BATCH_MAX_IDS}")
+    service = MovieService(db)
+    return service.get_movies_batch(movie_ids, log_views=log_views, current_user=current_user)
+
+
+@router.get("/facets", response_model=MovieFacets)
+def get_movie_facets(
+    genre: Optional[List[str]] = Query(None, description="жанр; несколько - повтором параметра или через запятую"),
+    genre_mode: Literal["and", "or"] = Query("and", description="and - все жанры, or - любой из них"),
+    year: Optional[int] = Query(None),
+    min_rating: Optional[float] = Query(None),
+    q: Optional[str] = Query(None, description="поиск по названию"),
+    fuzzy: bool = Query(True, description=CATALOG_FUZZY_DESCRIPTION),
+    db: Session = Depends(deps.get_db),
+):
+    """Счетчики жанров, стран, годов и рейтинга для панели фильтров - те же фильтры, что у списка"""
+    service = MovieService(db)
+    return service.get_facets(genre=genre, genre_mode=genre_mode, year=year, min_rating=min_rating, q=q, fuzzy=fuzzy)
+
+
+@router.get("/suggest", response_model=List[MovieSuggestion])
+def suggest_movies(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=20),
+    db: Session = Depends(deps.get_db),
+):
+    """Подсказки названий для строки поиска (из памяти, без записи в журнал поиска)"""
     service = MovieService(db)
-    return service.search(q=q, skip=skip, limit=limit, current_user=current_user)
+    return [suggestion._asdict() for suggestion in service.suggest(q, limit)]
 
 
 @router.get("/{movie_id}", response_model=MovieResponse)
@@ -114,17 +257,29 @@ def get_similar_movies(movie_id: int, limit: int = 10, db: Session = Depends(dep
 @router.post("/recommend", response_model=List[MovieResponse])
 def recommend_movies(
     request: MovieRecommendationRequest,
+    response: Response,
     db: Session = Depends(deps.get_db),
 ):
     """
     Рекомендует фильмы на основе ответов пользователя из бота вопрос-ответ.
+    Время этапов подбора отдается в заголовке Server-Timing.
     """
     service = MovieService(db)
-    movies = service.recommend_movies(
-        main_genre=request.main_genre,
-        subgenre=request.subgenre,
-        subgenre_detail=request.subgenre_detail,
-        time_period=request.time_period,
-        limit=request.limit,
-    )
+    try:
+        with traced() as trace:
+            movies = service.recommend_movies(
+                main_genre=request.main_genre,
+                subgenre=request.subgenre,
+                subgenre_detail=request.subgenre_detail,
+                time_period=request.time_period,
+                limit=request.limit,
+            )
+    except RecommenderBusyError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail="Сервис рекомендаций перегружен, попробуйте позже",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    if trace is not None:
+        response.headers["Server-Timing"] = trace.server_timing()
     return movies
@@ -1,7 +1,10 @@
+import numpy as np
 import pandas as pd
 import os
 
 EXPECTED_COLUMNS = 10
+# Сколько фильмов отдает recommend_movies по умолчанию
+RECOMMENDATIONS_COUNT = 10
 
 def is_excel_file(file_path):
     """Проверяет, является ли файл Excel-файлом по сигнатуре"""
@@ -63,249 +66,219 @@ def safe_str_clean(value):
     except:
         return ""
 
-def load_genre_data(file_path):
-    """Загружает данные жанра, автоматически определяя формат файла"""
+def calculate_average_ratings(df):
+    """Векторный вариант calculate_average_rating для всего DataFrame сразу"""
+    total = np.zeros(len(df), dtype=np.float64)
+    count = np.zeros(len(df), dtype=np.int64)
+
+    # Складываем колонки по очереди, как sum() в calculate_average_rating
+    for col_idx in (5, 8, 9):
+        if col_idx < len(df.columns):
+            values = df.iloc[:, col_idx].astype(str).str.strip().str.replace(',', '.', regex=False)
+            numeric = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+            valid = numeric > 0
+            total = np.where(valid, total + numeric, total)
+            count += valid
+
+    means = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+    # round() из Python, чтобы результат совпадал с calculate_average_rating до последнего знака
+    return np.array([round(float(value), 1) for value in means], dtype=np.float64)
+
+def read_genre_table(file_path, verbose=True):
+    """Читает файл жанра как есть: EXPECTED_COLUMNS строковых колонок без вычислений"""
     if not os.path.exists(file_path):
         print(f"Файл {file_path} не найден")
         return None
-    
-    try:
-        if is_excel_file(file_path):
+
+    if is_excel_file(file_path):
+        if verbose:
             print(f"Обнаружен Excel-файл: {os.path.basename(file_path)}")
-            # Читаем Excel-файл
-            df = pd.read_excel(file_path, header=0)
-            
-            # Если данные в одной колонке, разделяем их
-            if len(df.columns) == 1:
+        # Читаем Excel-файл
+        df = pd.read_excel(file_path, header=0)
+
+        # Если данные в одной колонке, разделяем их
+        if len(df.columns) == 1:
+            if verbose:
                 print("Данные в одной колонке, разделяем...")
-                # Разделяем первую колонку по запятым
-                expanded = df.iloc[:, 0].astype(str).str.split(',', expand=True, n=EXPECTED_COLUMNS-1)
-                # Заменяем исходный DataFrame
-                df = expanded
-            
-            # Обрезаем или дополняем до нужного количества колонок
-            if len(df.columns) > EXPECTED_COLUMNS:
-                df = df.iloc[:, :EXPECTED_COLUMNS]
-            elif len(df.columns) < EXPECTED_COLUMNS:
-                for i in range(EXPECTED_COLUMNS - len(df.columns)):
-                    df[f'empty_{i}'] = ''
-        else:
-            print(f"Читаем как CSV-файл: {os.path.basename(file_path)}")
-            
-            # Пробуем разные кодировки для CSV
-            encodings = ['utf-8', 'cp1251', 'windows-1251', 'iso-8859-1']
-            df = None
-            
-            for encoding in encodings:
-                try:
-                    # Читаем весь файл как текст
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    
-                    # Разбиваем на строки и убираем пустые
-                    lines = [line.strip() for line in content.split('\n') if line.strip()]
-                    
-                    # Разбиваем каждую строку по точке с запятой
-                    data = []
-                    for line in lines:
-                        # Убираем лишние пробелы вокруг точек с запятой
-                        line = line.replace(' ;', ';').replace('; ', ';')
-                        parts = line.split(';')
-                        
-                        # Очищаем каждую часть
-                        cleaned_parts = [part.strip() for part in parts]
-                        
-                        # Если частей меньше, чем ожидаемых колонок, дополняем
-                        if len(cleaned_parts) < EXPECTED_COLUMNS:
-                            cleaned_parts.extend([''] * (EXPECTED_COLUMNS - len(cleaned_parts)))
-                        # Если больше - обрезаем
-                        elif len(cleaned_parts) > EXPECTED_COLUMNS:
-                            cleaned_parts = cleaned_parts[:EXPECTED_COLUMNS]
-                        
-                        data.append(cleaned_parts)
-                    
-                    if data:  # Если есть данные
-                        df = pd.DataFrame(data)
-                        print(f"Успешно прочитано с кодировкой: {encoding}")
-                        print(f"Загружено {len(df)} строк, {len(df.columns)} колонок")
-                        break
-                        
-                except UnicodeDecodeError:
-                    continue
-                except Exception as e:
-                    print(f"Ошибка с кодировкой {encoding}: {e}")
-                    continue
-            
-            if df is None:
-                print("Не удалось прочитать файл ни с одной кодировкой")
-                return None
-        
+            # Разделяем первую колонку по запятым
+            expanded = df.iloc[:, 0].astype(str).str.split(',', expand=True, n=EXPECTED_COLUMNS-1)
+            # Заменяем исходный DataFrame
+            df = expanded
+
+        # Обрезаем или дополняем до нужного количества колонок
+        if len(df.columns) > EXPECTED_COLUMNS:
+            df = df.iloc[:, :EXPECTED_COLUMNS]
+        elif len(df.columns) < EXPECTED_COLUMNS:
+            for i in range(EXPECTED_COLUMNS - len(df.columns)):
+                df[f'empty_{i}'] = ''
+        return df.fillna('')
+
+    if verbose:
+        print(f"Читаем как CSV-файл: {os.path.basename(file_path)}")
+
+    # Пробуем разные кодировки для CSV
+    encodings = ['utf-8', 'cp1251', 'windows-1251', 'iso-8859-1']
+
+    for encoding in encodings:
+        try:
+            # Читаем весь файл как текст
+            with open(file_path, 'r', encoding=encoding) as f:
+                content = f.read()
+
+            # Разбиваем на строки и убираем пустые
+            lines = [line.strip() for line in content.split('\n') if line.strip()]
+
+            # Разбиваем каждую строку по точке с запятой
+            data = []
+            for line in lines:
+                # Убираем лишние пробелы вокруг точек с запятой
+                line = line.replace(' ;', ';').replace('; ', ';')
+                parts = line.split(';')
+
+                # Очищаем каждую часть
+                cleaned_parts = [part.strip() for part in parts]
+
+                # Если частей меньше, чем ожидаемых колонок, дополняем
+                if len(cleaned_parts) < EXPECTED_COLUMNS:
+                    cleaned_parts.extend([''] * (EXPECTED_COLUMNS - len(cleaned_parts)))
+                # Если больше - обрезаем
+                elif len(cleaned_parts) > EXPECTED_COLUMNS:
+                    cleaned_parts = cleaned_parts[:EXPECTED_COLUMNS]
+
+                data.append(cleaned_parts)
+
+            if data:  # Если есть данные
+                df = pd.DataFrame(data)
+                if verbose:
+                    print(f"Успешно прочитано с кодировкой: {encoding}")
+                    print(f"Загружено {len(df)} строк, {len(df.columns)} колонок")
+                return df.fillna('')
+
+        except UnicodeDecodeError:
+            continue
+        except Exception as e:
+            print(f"Ошибка с кодировкой {encoding}: {e}")
+            continue
+
+    print("Не удалось прочитать файл ни с одной кодировкой")
+    return None
+
+def load_genre_data(file_path):
+    """Загружает данные жанра, автоматически определяя формат файла"""
+    try:
+        df = read_genre_table(file_path)
+        if df is None:
+            return None
+
         # Убеждаемся, что у нас достаточно колонок
         if len(df.columns) < 6:
             print(f"Недостаточно колонок: {len(df.columns)}")
             return None
-        
-        # Заполняем NaN значения
-        df = df.fillna('')
-        
+
         # Для отладки: выведем первые 3 строки
         if not df.empty:
             print("\nПервые 3 строки данных:")
             for i in range(min(3, len(df))):
                 print(f"  Строка {i+1}: {df.iloc[i].tolist()}")
-        
-        # Вычисляем среднюю оценку для каждой строки
-        avg_ratings = []
-        for _, row in df.iterrows():
-            avg_ratings.append(calculate_average_rating(row))
-        
+
         # Создаем новый DataFrame с нужными колонками
         result_df = df.iloc[:, :6].copy()
-        result_df['Средняя оценка'] = avg_ratings
-        
+        result_df['Средняя оценка'] = calculate_average_ratings(df)
+
         # Безопасно очищаем строковые данные в первых 6 колонках
         for i in range(6):
             if i < len(result_df.columns):
                 result_df.iloc[:, i] = result_df.iloc[:, i].apply(safe_str_clean)
-        
+
         print(f"\nУспешно загружено {len(result_df)} фильмов")
         return result_df
-        
+
     except Exception as e:
         print(f"Ошибка при чтении {file_path}: {e}")
         import traceback
         traceback.print_exc()
         return None
 
-def recommend_movies(user_input):
-    if not user_input or len(user_input) == 0:
-        return []
-    
-    # Определяем жанр и путь к файлу
-    genre = user_input[0]
-    base_path = r"app/genre_with_info/"
-    file_path = os.path.join(base_path, f"{genre}.csv")
-    print(file_path)
-    # Загружаем данные
-    df = load_genre_data(file_path)
-    if df is None or df.empty:
-        print(f"Не удалось загрузить данные из {file_path}")
-        return []
-    
-    # Проверяем структуру данных
-    if len(df.columns) < 7:
-        print(f"Неверная структура данных. Колонок: {len(df.columns)}, ожидалось: 7")
-        return df.iloc[:, 0].head(5).tolist() if len(df.columns) > 0 else []
-    
-    # Рассчитываем паттерн совпадений для каждого фильма
-    match_patterns = []
-    exact_matches_counts = []
-    
-    for _, row in df.iterrows():
-        pattern = ""
-        exact_matches = 0
-        
-        # user_input[0] - это жанр, который должен совпадать с колонкой 1 в данных
-        # user_input[1] - сравниваем с колонкой 2
-        # user_input[2] - сравниваем с колонкой 3
-        # user_input[3] - сравниваем с колонкой 4
-        
-        # Сначала проверим жанр (колонка 1)
-        movie_genre = ""
-        if pd.notna(row[1]):
-            movie_genre = str(row[1]).strip().strip('"')
-        
-        # Первая цифра паттерна - всегда 1, так как файл загружен по жанру
-        pattern += "1"
-        if movie_genre == user_input[0].strip():
-            exact_matches += 1
-        
-        # Теперь проверяем остальные критерии
-        for i in range(1, min(len(user_input), 5)):  # максимум 4 критерия (включая жанр)
-            user_val = user_input[i].strip()
-            col_idx = i + 1  # Колонки 2-4 в DataFrame (индексы 2,3,4)
-            
-            if col_idx < len(row):
-                # Получаем значение из фильма и очищаем его
-                movie_val_raw = row[col_idx]
-                movie_val = ""
-                if pd.notna(movie_val_raw):
-                    movie_val = str(movie_val_raw).strip().strip('"')
-                
-                # Сравниваем
-                if movie_val == user_val:
-                    pattern += "1"
-                    exact_matches += 1
-                else:
-                    pattern += "2"
-            else:
-                pattern += "2"
-        
-        # Дополняем паттерн до 4 символов если нужно
-        while len(pattern) < 4:
-            pattern += "2"
-        
-        match_patterns.append(pattern)
-        exact_matches_counts.append(exact_matches - 1)  # Вычитаем 1, так как жанр не считается в exact_matches
-    
-    df['match_pattern'] = match_patterns
-    df['exact_matches'] = exact_matches_counts
-    
-    # Отладочный вывод: покажем первые 20 фильмов с их паттернами
+def display_title(value):
+    """Название фильма для вывода: без кавычек, пустое заменяется заглушкой"""
+    title = str(value).strip().strip('"')
+    return title or "Без названия"
+
+def short_title(value):
+    title = display_title(value)
+    return title[:36] + "..." if len(title) > 39 else title
+
+def print_debug_tables(dataset, user_input, masks, ranking):
+    """Отладочный вывод: первые 20 фильмов жанра с паттернами и топ-5 рекомендаций"""
+    from app.recommender.scoring import clean_value, exact_matches_for, patterns_for
+
     print("\nПервые 20 фильмов с паттернами для отладки:")
     print(f"{'Название':<40} | {'Жанр':<15} | {'Крит2':<20} | {'Крит3':<25} | {'Крит4':<30} | {'Паттерн':<6}")
     print("-" * 140)
-    
-    for idx, row in df.head(20).iterrows():
-        title = ""
-        if pd.notna(row.iloc[0]):
-            title = str(row.iloc[0]).strip().strip('"')
-        if not title:
-            title = "Без названия"
-        if len(title) > 39:
-            title = title[:36] + "..."
-        
-        # Получаем значения критериев
-        genre_val = str(row[1]).strip().strip('"') if pd.notna(row[1]) else ""
-        crit2_val = str(row[2]).strip().strip('"') if len(row) > 2 and pd.notna(row[2]) else ""
-        crit3_val = str(row[3]).strip().strip('"') if len(row) > 3 and pd.notna(row[3]) else ""
-        crit4_val = str(row[4]).strip().strip('"') if len(row) > 4 and pd.notna(row[4]) else ""
-        
-        print(f"{title:<40} | {genre_val:<15} | {crit2_val:<20} | {crit3_val:<25} | {crit4_val:<30} | {row['match_pattern']:<6}")
-    
-    # Создаем числовую оценку для сортировки
-    # Паттерны сортируем по алфавиту: "1111" < "1112" < "1121" < "1122" < ... < "2222"
-    df_sorted = df.sort_values(
-        by=['exact_matches', 'match_pattern', 'Средняя оценка'],
-        ascending=[False, True, False]  # exact_matches по убыванию, паттерн по возрастанию, оценка по убыванию
-    )
-    
-    # Выводим результаты для отладки
+
+    head = min(20, len(dataset))
+    genre_col, crit2_col, crit3_col, crit4_col = dataset.criteria
+    for idx, pattern in zip(range(head), patterns_for(masks[:head])):
+        print(
+            f"{short_title(dataset.titles[idx]):<40} | {clean_value(genre_col[idx]):<15} | "
+            f"{clean_value(crit2_col[idx]):<20} | {clean_value(crit3_col[idx]):<25} | "
+            f"{clean_value(crit4_col[idx]):<30} | {pattern:<6}"
+        )
+
     print(f"\nТоп-5 фильмов для запроса {user_input}:")
     print(f"{'Название':<40} | {'Совпадений':>10} | {'Паттерн':>6} | {'Средняя оценка':>12}")
     print("-" * 78)
-    
-    for idx, row in df_sorted.head(5).iterrows():  # Покажем 10 для отладки
-        title = ""
-        if pd.notna(row.iloc[0]):
-            title = str(row.iloc[0]).strip().strip('"')
-        if not title:
-            title = "Без названия"
-        if len(title) > 39:
-            title = title[:36] + "..."
-        print(f"{title:<40} | {row['exact_matches']:>10} | {row['match_pattern']:>6} | {row['Средняя оценка']:>12.1f}")
-    
-    # Возвращаем топ-5 названий
-    result = []
-    for idx, row in df_sorted.head(10).iterrows():
-        title = ""
-        if pd.notna(row.iloc[0]):
-            title = str(row.iloc[0]).strip().strip('"')
-        if not title:
-            title = "Без названия"
-        result.append(title)
-    
-    return result
+
+    top = ranking[:5]
+    for idx, exact, pattern in zip(top, exact_matches_for(masks[top]), patterns_for(masks[top])):
+        print(f"{short_title(dataset.titles[idx]):<40} | {exact:>10} | {pattern:>6} | {dataset.ratings[idx]:>12.1f}")
+
+def rank_genre(user_input, top_n=RECOMMENDATIONS_COUNT, with_kp_id=False):
+    """Датасет жанра и индексы строк топ-N фильмов для ответов пользователя.
+
+    with_kp_id - ранжировать только строки с kp_id, чтобы топ-N не сократился после их отсева
+    """
+    if not user_input or len(user_input) == 0:
+        return None, []
+
+    from app.recommender.registry import genre_registry
+    from app.recommender.scoring import match_masks, rank_movies
+    from app.recommender.tracing import stage, verbose_enabled
+
+    # Данные жанра берем из реестра в памяти, файл перечитывается только при изменении
+    genre = user_input[0]
+    with stage("load"):
+        dataset = genre_registry.get(genre)
+    if dataset is None or len(dataset) == 0:
+        print(f"Не удалось загрузить данные жанра {genre}")
+        return None, []
+
+    # Маска совпадений по всем фильмам жанра за один проход и частичная сортировка топ-N.
+    # Порядок: exact_matches по убыванию, паттерн по возрастанию, оценка по убыванию
+    with stage("score"):
+        masks = match_masks(dataset.encoded, user_input)
+    with stage("sort"):
+        rows = dataset.rows_with_kp_id if with_kp_id else None
+        ranking = rank_movies(dataset.encoded, masks, top_n, rows)
+
+    # Отладочные таблицы только в подробном режиме трассировки
+    if verbose_enabled():
+        print_debug_tables(dataset, user_input, masks, ranking)
+    return dataset, ranking
+
+def recommend_movies(user_input, top_n=RECOMMENDATIONS_COUNT):
+    """Названия топ-N рекомендованных фильмов"""
+    dataset, ranking = rank_genre(user_input, top_n)
+    if dataset is None:
+        return []
+    return [display_title(dataset.titles[idx]) for idx in ranking]
+
+def recommend_kp_ids(user_input, top_n=RECOMMENDATIONS_COUNT):
+    """kp_id топ-N рекомендованных фильмов (строки без kp_id в ранжирование не попадают)"""
+    dataset, ranking = rank_genre(user_input, top_n, with_kp_id=True)
+    if dataset is None:
+        return []
+    return [int(kp_id) for kp_id in dataset.kp_ids[ranking]]
 
 # #Пример использования
 # if __name__ == "__main__":
@@ -20,3 +20,26 @@ YANDEX_CLIENT_ID: str = env.str("YANDEX_CLIENT_ID", "")
 YANDEX_CLIENT_SECRET: str = env.str("YANDEX_CLIENT_SECRET", "")
 YANDEX_REDIRECT_URI: str = env.str("YANDEX_REDIRECT_URI", "http://localhost:8000/api/auth/yandex/callback")
 FRONTEND_URL: str = env.str("FRONTEND_URL", "http://localhost:5173")
+
+# Recommender (бот вопрос-ответ)
+GENRE_DATA_DIR: str = env.str("GENRE_DATA_DIR", "app/genre_with_info")
+RECOMMENDER_PRELOAD: bool = env.bool("RECOMMENDER_PRELOAD", False)
+ANSWER_TABLE_PATH: str = env.str("ANSWER_TABLE_PATH", "app/genre_with_info/answer_table.npz")
+DATA_SNAPSHOT_DIR: str = env.str("DATA_SNAPSHOT_DIR", "app/data_snapshot")
+KP_ID_MAP_TTL: int = env.int("KP_ID_MAP_TTL", 600)
+TOP_RANKING_REFRESH_INTERVAL: int = env.int("TOP_RANKING_REFRESH_INTERVAL", 3600)
+LEADERBOARD_SIZE: int = env.int("LEADERBOARD_SIZE", 100)
+LEADERBOARD_TTL: int = env.int("LEADERBOARD_TTL", 600)
+SUGGEST_TTL: int = env.int("SUGGEST_TTL", 600)
+FACETS_CACHE_SIZE: int = env.int("FACETS_CACHE_SIZE", 256)
+FACETS_CACHE_TTL: int = env.int("FACETS_CACHE_TTL", 60)
+RECOMMEND_CACHE_SIZE: int = env.int("RECOMMEND_CACHE_SIZE", 1024)
+RECOMMEND_CACHE_TTL: int = env.int("RECOMMEND_CACHE_TTL", 300)
+RECOMMENDER_WORKERS: int = env.int("RECOMMENDER_WORKERS", 2)
+RECOMMENDER_QUEUE_DEPTH: int = env.int("RECOMMENDER_QUEUE_DEPTH", 8)
+RECOMMENDER_RETRY_AFTER: int = env.int("RECOMMENDER_RETRY_AFTER", 1)
+RECOMMENDER_TRACE_SAMPLE_RATE: float = env.float("RECOMMENDER_TRACE_SAMPLE_RATE", 1.0)
+RECOMMENDER_TRACE_VERBOSE: bool = env.bool("RECOMMENDER_TRACE_VERBOSE", False)
+CONTENT_SIMILAR_K: int = env.int("CONTENT_SIMILAR_K", 20)
+CONTENT_SIMILAR_BLOCK_SIZE: int = env.int("CONTENT_SIMILAR_BLOCK_SIZE", 512)
+CONTENT_SIMILAR_ON_CREATE: bool = env.bool("CONTENT_SIMILAR_ON_CREATE", True)
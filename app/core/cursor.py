@@ -0,0 +1,33 @@
+"""
+Непрозрачный курсор для постраничного вывода по ключу (keyset).
+
+Курсор - base64url от JSON с именем сортировки и значениями ключа последней строки страницы.
+Клиент не разбирает его, а только передает обратно; курсор от другой сортировки отклоняется.
+"""
+import base64
+import binascii
+import json
+from typing import Any, List
+
+
+class InvalidCursorError(ValueError):
+    """Курсор поврежден или выдан для другой сортировки"""
+
+
+def encode_cursor(sort: str, key: List[Any]) -> str:
+    payload = json.dumps({"sort": sort, "key": key}, separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, size: int) -> List[Any]:
+    """Значения ключа из курсора; size - сколько колонок в ключе этой сортировки"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursorError("Invalid cursor") from exc
+    if not isinstance(payload, dict) or payload.get("sort") != sort:
+        raise InvalidCursorError("Cursor does not match sort order")
+    key = payload.get("key")
+    if not isinstance(key, list) or len(key) != size:
+        raise InvalidCursorError("Invalid cursor")
+    return key
@@ -0,0 +1,6 @@
+from sqlalchemy.orm import Session
+
+
+def is_postgresql(db: Session) -> bool:
+    """Сессия работает с PostgreSQL (в тестах используется SQLite)"""
+    return db.get_bind().dialect.name == "postgresql"
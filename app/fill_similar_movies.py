@@ -1,20 +1,25 @@
 """
 Скрипт для заполнения таблицы movie_similarities из CSV файлов в папке update_films.
-Формат CSV: первая строка - заголовки, вторая колонка (индекс 1) - название фильма,
-последняя колонка (индекс 20) - список похожих фильмов через точку с запятой.
+Формат CSV: первая строка - заголовки, первая колонка (индекс 0) - название фильма,
+колонка 20_похожих - список похожих фильмов через точку с запятой,
+колонка 20_похожих_сходство (если есть) - сходство этих фильмов в том же порядке.
+Колонки ищутся по заголовку: в разных файлах у них разные номера.
 """
 import os
 import csv
 import sys
+import argparse
 from pathlib import Path
+from typing import Dict, List, NamedTuple
 
 # Добавляем корневую директорию проекта в путь
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from app.database import SessionLocal
-from app.models.movie import Movie, movie_similarities
-from sqlalchemy import insert, select
+from app.models.movie import Movie
+from app.repositories.similarities import SimilarityEdge, SimilarityRepository, unique_edges
+from sqlalchemy import select
 
 
 def normalize_title(title: str) -> str:
@@ -25,109 +30,171 @@ def normalize_title(title: str) -> str:
     return title.strip().lower()
 
 
-def find_movie_by_title(db, title: str) -> Movie | None:
+class IndexedMovie(NamedTuple):
+    """Фильм из индекса: только то, что нужно для связей (не истекает после commit)."""
+    id: int
+    title: str
+
+
+class MovieTitleIndex:
+    """Нормализованное название и english_title -> фильм, строится одним запросом на запуск.
+
+    При совпадении ключей у разных фильмов остается первый по id - так же, как прежний
+    перебор всех фильмов находил первый подходящий. Такие совпадения считаются в collisions.
+    """
+
+    def __init__(self):
+        self._movies: Dict[str, IndexedMovie] = {}
+        self.collisions = 0
+        self.collision_examples: List[str] = []
+
+    def add(self, key: str, movie: IndexedMovie) -> None:
+        if not key:
+            return
+        existing = self._movies.setdefault(key, movie)
+        if existing.id != movie.id:
+            self.collisions += 1
+            if len(self.collision_examples) < 5:
+                self.collision_examples.append(f"{key}: {existing.id} / {movie.id}")
+
+    @classmethod
+    def build(cls, db) -> "MovieTitleIndex":
+        index = cls()
+        rows = db.execute(select(Movie.id, Movie.title, Movie.english_title).order_by(Movie.id))
+        for movie_id, title, english_title in rows:
+            movie = IndexedMovie(movie_id, title)
+            index.add(normalize_title(title), movie)
+            # Также индексируем english_title
+            if english_title:
+                index.add(normalize_title(english_title), movie)
+        return index
+
+    def find(self, title: str) -> IndexedMovie | None:
+        return self._movies.get(normalize_title(title))
+
+    def __len__(self) -> int:
+        return len(self._movies)
+
+
+def find_movie_by_title(index: MovieTitleIndex, title: str) -> IndexedMovie | None:
     """Находит фильм по названию (с учетом нормализации)."""
-    normalized = normalize_title(title)
-    movies = db.query(Movie).all()
-    for movie in movies:
-        if normalize_title(movie.title) == normalized:
-            return movie
-        # Также проверяем english_title
-        if movie.english_title and normalize_title(movie.english_title) == normalized:
-            return movie
-    return None
-
-
-def process_csv_file(db, file_path: Path):
-    """Обрабатывает один CSV файл и добавляет похожие фильмы в БД."""
-    print(f"Обработка файла: {file_path.name}")
-    
-    added_count = 0
-    skipped_count = 0
+    return index.find(title)
+
+
+def read_csv_rows(file_path: Path, encoding: str = 'windows-1251'):
+    """Все строки CSV файла как есть, включая заголовок."""
+    with open(file_path, 'r', encoding=encoding) as f:
+        yield from csv.reader(f, delimiter=';')
+
+
+# Название - первая колонка файла жанра, за ней жанр и остальные колонки исходника
+TITLE_INDEX = 0
+SIMILAR_COLUMN = "20_похожих"
+SCORES_COLUMN = "20_похожих_сходство"
+
+
+def parse_scores(value: str, count: int) -> List[float | None]:
+    """Сходство похожих фильмов из колонки 20_похожих_сходство; без нее или при расхождении - None."""
+    try:
+        scores = [float(score) for score in value.split(';') if score.strip()]
+    except ValueError:
+        scores = []
+    return scores if len(scores) == count else [None] * count
+
+
+def read_similar_rows(rows):
+    """Строки с похожими фильмами: (номер строки, название, список похожих названий, их сходство)."""
+    rows = iter(rows)
+
+    # Номера колонок берем из заголовка
+    header = [name.strip().lstrip('\ufeff') for name in next(rows, [])]
+    if SIMILAR_COLUMN not in header:
+        return
+    similar_index = header.index(SIMILAR_COLUMN)
+    scores_index = header.index(SCORES_COLUMN) if SCORES_COLUMN in header else None
+
+    for row_num, row in enumerate(rows, start=2):
+        if len(row) <= similar_index:
+            continue
+
+        movie_title = row[TITLE_INDEX].strip()
+        if not movie_title:
+            continue
+
+        similar_movies_str = row[similar_index].strip()
+        if not similar_movies_str:
+            continue
+
+        # Разбиваем список похожих фильмов
+        similar_titles = [t.strip() for t in similar_movies_str.split(';') if t.strip()]
+        scores_str = row[scores_index] if scores_index is not None and len(row) > scores_index else ""
+        scores = parse_scores(scores_str, len(similar_titles))
+        yield row_num, movie_title, similar_titles, scores
+
+
+def collect_similar_edges(rows, index: MovieTitleIndex):
+    """Связи (movie_id, similar_movie_id, rank, score) из строк файла и количество не найденных фильмов.
+
+    rank - место похожего фильма в списке (с 1), score - его сходство, если оно записано в файле.
+    """
+    edges: List[SimilarityEdge] = []
     not_found_count = 0
-    
+
+    for row_num, movie_title, similar_titles, scores in read_similar_rows(rows):
+        # Находим основной фильм
+        main_movie = find_movie_by_title(index, movie_title)
+        if not main_movie:
+            not_found_count += 1
+            if not_found_count <= 5:  # Показываем первые 5 не найденных
+                print(f"  Не найден фильм: {movie_title}")
+            continue
+
+        for rank, (similar_title, score) in enumerate(zip(similar_titles, scores), start=1):
+            similar_movie = find_movie_by_title(index, similar_title)
+            if similar_movie:
+                edges.append((main_movie.id, similar_movie.id, rank, score))
+
+    return edges, not_found_count
+
+
+def process_csv_file(db, file_path: Path, rows=None, index: MovieTitleIndex | None = None,
+                     encoding: str = 'windows-1251'):
+    """Обрабатывает один CSV файл и добавляет похожие фильмы в БД.
+
+    rows - уже разобранные строки файла (например, из бинарного снимка), иначе читается CSV.
+    index - индекс названий на весь запуск; если не передан, строится для этого файла.
+    Связи пишутся пачкой, уже существующие пропускаются самой БД (ON CONFLICT DO NOTHING).
+    """
+    print(f"Обработка файла: {file_path.name}")
+
     try:
-        with open(file_path, 'r', encoding='windows-1251') as f:
-            reader = csv.reader(f, delimiter=';')
-            
-            # Пропускаем заголовок
-            next(reader, None)
-            
-            for row_num, row in enumerate(reader, start=2):
-                if len(row) < 21:
-                    continue
-                
-                # Название фильма во второй колонке (индекс 1)
-                movie_title = row[1].strip() if len(row) > 1 else ""
-                if not movie_title:
-                    continue
-                
-                # Похожие фильмы в последней колонке (индекс 20)
-                similar_movies_str = row[20].strip() if len(row) > 20 else ""
-                if not similar_movies_str:
-                    continue
-                
-                # Находим основной фильм
-                main_movie = find_movie_by_title(db, movie_title)
-                if not main_movie:
-                    not_found_count += 1
-                    if not_found_count <= 5:  # Показываем первые 5 не найденных
-                        print(f"  Не найден фильм: {movie_title}")
-                    continue
-                
-                # Разбиваем список похожих фильмов
-                similar_titles = [t.strip() for t in similar_movies_str.split(';') if t.strip()]
-                
-                # Добавляем связи
-                for similar_title in similar_titles:
-                    similar_movie = find_movie_by_title(db, similar_title)
-                    if not similar_movie:
-                        continue
-                    
-                    # Проверяем, нет ли уже такой связи
-                    existing = db.execute(
-                        select(movie_similarities).where(
-                            movie_similarities.c.movie_id == main_movie.id,
-                            movie_similarities.c.similar_movie_id == similar_movie.id
-                        )
-                    ).first()
-                    
-                    if existing:
-                        skipped_count += 1
-                        continue
-                    
-                    # Добавляем связь
-                    try:
-                        db.execute(
-                            insert(movie_similarities).values(
-                                movie_id=main_movie.id,
-                                similar_movie_id=similar_movie.id
-                            )
-                        )
-                        added_count += 1
-                    except Exception as e:
-                        # Игнорируем ошибки дубликатов (если связь уже существует)
-                        if "duplicate" not in str(e).lower() and "unique" not in str(e).lower():
-                            print(f"  Ошибка при добавлении связи {main_movie.title} -> {similar_title}: {e}")
-                        skipped_count += 1
-                
-                # Коммитим каждые 100 фильмов
-                if (row_num - 1) % 100 == 0:
-                    db.commit()
-                    print(f"  Обработано {row_num - 1} строк, добавлено {added_count} связей")
-    
+        if index is None:
+            index = MovieTitleIndex.build(db)
+        if rows is None:
+            rows = read_csv_rows(file_path, encoding)
+
+        edges, not_found_count = collect_similar_edges(rows, index)
+        added_count = SimilarityRepository(db).insert_edges(edges)
     except Exception as e:
         print(f"Ошибка при обработке файла {file_path.name}: {e}")
         db.rollback()
         return
-    
-    # Финальный коммит
-    db.commit()
+
+    skipped_count = len(edges) - added_count
     print(f"  Файл {file_path.name}: добавлено {added_count} связей, пропущено {skipped_count}, не найдено фильмов {not_found_count}")
 
 
-def main():
-    """Основная функция для заполнения похожих фильмов."""
+def main(use_snapshot: bool = False, encoding: str = 'windows-1251', replace: bool = False):
+    """Основная функция для заполнения похожих фильмов.
+
+    Связи из всех файлов собираются в памяти, повторы убираются, и запись идет одной
+    транзакцией: COPY в PostgreSQL или пачки INSERT ... ON CONFLICT DO NOTHING.
+
+    use_snapshot - брать разобранные строки из бинарного снимка (app.recommender.snapshot)
+    для файлов, которые не менялись после его сборки.
+    encoding - кодировка CSV файлов.
+    replace - заменить весь набор связей новым (в той же транзакции), а не дополнять его.
+    """
     update_films_dir = project_root / "create_data" / "update_films"
     
     if not update_films_dir.exists():
@@ -145,16 +212,44 @@ def main():
             return
         
         print(f"Найдено {len(csv_files)} CSV файлов")
+
+        # Индекс названий строится один раз, все поиски фильмов идут через него
+        index = MovieTitleIndex.build(db)
+        print(f"Проиндексировано названий: {len(index)}, совпадений у разных фильмов: {index.collisions}")
+        for example in index.collision_examples:
+            print(f"  Одинаковое название: {example}")
+
+        snapshot = None
+        if use_snapshot:
+            from app.recommender.snapshot import load_snapshot
+            snapshot = load_snapshot()
+            if snapshot is None:
+                print("Снимок не найден, читаем CSV")
         
-        # Очищаем существующие связи (опционально, раскомментируйте если нужно)
-        # print("Очистка существующих связей...")
-        # db.execute(movie_similarities.delete())
-        # db.commit()
-        
-        # Обрабатываем каждый файл
+        # Собираем связи из всех файлов
+        edges = []
         for csv_file in csv_files:
-            process_csv_file(db, csv_file)
-        
+            rows = None
+            if snapshot is not None:
+                # Снимок собирается из другой папки, поэтому сверяем файлы по содержимому
+                entry = snapshot.entry("similar", csv_file.name, str(csv_file), check_hash=True)
+                if entry is not None:
+                    rows = snapshot.table_rows(entry)
+            if rows is None:
+                rows = read_csv_rows(csv_file, encoding)
+            file_edges, not_found_count = collect_similar_edges(rows, index)
+            print(f"  {csv_file.name}: связей {len(file_edges)}, не найдено фильмов {not_found_count}")
+            edges.extend(file_edges)
+
+        edges = unique_edges(edges)
+        repository = SimilarityRepository(db)
+        if replace:
+            total = repository.replace_edges(edges)
+            print(f"Набор связей заменен: {total} связей")
+        else:
+            added_count = repository.insert_edges(edges)
+            print(f"Уникальных связей {len(edges)}, добавлено {added_count}, уже были {len(edges) - added_count}")
+
         print("\nГотово! Все похожие фильмы добавлены в БД.")
         
     except Exception as e:
@@ -165,4 +260,8 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Заполнение таблицы movie_similarities из CSV")
+    parser.add_argument("--snapshot", action="store_true", help="читать строки из бинарного снимка")
+    parser.add_argument("--replace", action="store_true", help="заменить все связи одной транзакцией")
+    args = parser.parse_args()
+    main(use_snapshot=args.snapshot, replace=args.replace)
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from typing import Callable
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
@@ -12,8 +13,40 @@ from app.api.routers.reviews import router as reviews_router
 from app.api.routers.lists import router as lists_router
 from app.api.routers.admin_stats import router as admin_stats_router
 from app.api.routers.oauth import router as oauth_router
-from app.db.session import get_db
+from app.core.config import CONTENT_SIMILAR_ON_CREATE, RECOMMENDER_PRELOAD
+from app.db.session import SessionLocal, get_db
 from app.log_to_db import log_page_view, log_error
+from app.recommender import genre_registry
+from app.recommender.content import content_index
+from app.recommender.executor import recommender_executor
+from app.recommender.leaderboards import genre_leaderboards
+from app.recommender.movie_ids import kp_id_map
+from app.recommender.suggest import movie_suggest
+from app.services.top_ranking import top_ranking_refresher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Прогрев in-memory структур и запуск фоновых задач при старте, их остановка при завершении"""
+    if RECOMMENDER_PRELOAD:
+        loaded = genre_registry.preload()
+        print(f"Загружено жанров для рекомендаций: {loaded}")
+        try:
+            with SessionLocal() as db:
+                print(f"Загружено kp_id фильмов: {kp_id_map.load(db)}")
+                print(f"Загружено жанров для похожих фильмов: {genre_leaderboards.load(db)}")
+                print(f"Загружено фильмов для подсказок поиска: {movie_suggest.load(db)}")
+        except Exception as e:
+            # Карта и таблицы жанров построятся при первом обращении
+            print(f"Не удалось загрузить kp_id фильмов: {e}")
+        if CONTENT_SIMILAR_ON_CREATE:
+            # Индекс всего каталога строится в фоне: старт не ждет его, а создание фильма - не строит
+            content_index.load_in_background()
+    top_ranking_refresher.start()
+    yield
+    top_ranking_refresher.stop()
+    recommender_executor.shutdown()
+
 
 app = FastAPI(
     title="MovieHub API",
@@ -22,6 +55,7 @@ app = FastAPI(
     docs_url="/api/docs",
     redoc_url="/api/redoc",
     openapi_url="/api/openapi.json",
+    lifespan=lifespan,
 )
 
 
@@ -35,6 +69,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -3,19 +3,31 @@ from typing import Optional, List
 from app.db.base import Base
 from sqlalchemy import (
     String, Text, Date,
-    Table, Column, Integer, ForeignKey
+    Table, Column, Integer, Float, ForeignKey, Index,
+    func, literal_column
 )
 from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy.orm import relationship, mapped_column, Mapped
+from sqlalchemy.orm import relationship, mapped_column, Mapped, validates
 
 movie_similarities = Table(
     "movie_similarities",
     Base.metadata,
     Column("movie_id", Integer, ForeignKey("movies.id"), primary_key=True),
-    Column("similar_movie_id", Integer, ForeignKey("movies.id"), primary_key=True)
+    Column("similar_movie_id", Integer, ForeignKey("movies.id"), primary_key=True),
+    # Место в списке похожих (1 - самый похожий) и сходство из similar_to_csv
+    Column("rank", Integer, nullable=True),
+    Column("score", Float, nullable=True),
+    Index("ix_movie_similarities_movie_id_rank", "movie_id", "rank"),
 )
 
 
+def normalize_genres(genres: Optional[List[str]]) -> Optional[List[str]]:
+    """Жанры в нижнем регистре без пробелов по краям и повторов: фильтр сравнивает их точно"""
+    if genres is None:
+        return None
+    return list(dict.fromkeys(genre.strip().lower() for genre in genres if genre and genre.strip()))
+
+
 class Movie(Base):
     __tablename__ = "movies"
 
@@ -47,4 +59,30 @@ class Movie(Base):
 
     combined_rating: Mapped[Optional[float]] = mapped_column(nullable=True)
 
-    reviews = relationship("Review", back_populates="movie")
\ No newline at end of file
+    reviews = relationship("Review", back_populates="movie")
+
+    @validates("genres")
+    def validate_genres(self, key, genres):
+        return normalize_genres(genres)
+
+    __table_args__ = (
+        # Фильтр по жанрам через @> и && (PostgreSQL)
+        Index("ix_movies_genres_gin", "genres", postgresql_using="gin"),
+        # Нечеткий поиск по названию (pg_trgm), на других БД - обычный индекс
+        Index("ix_movies_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+        Index(
+            "ix_movies_english_title_trgm", "english_title",
+            postgresql_using="gin", postgresql_ops={"english_title": "gin_trgm_ops"},
+        ),
+    )
+
+
+# Ключи постраничного вывода по курсору: (значение сортировки, ..., id) для каждого sort_by.
+# Пустые рейтинг и год заменяются константой, чтобы сравнение кортежей работало и шло по индексу
+KEYSET_RATING = func.coalesce(Movie.combined_rating, literal_column("-1"))
+KEYSET_YEAR = func.coalesce(Movie.year_release, literal_column("0"))
+
+Index("ix_movies_keyset_rating", KEYSET_RATING, Movie.sum_votes, Movie.id)
+Index("ix_movies_keyset_year", KEYSET_YEAR, Movie.id)
+Index("ix_movies_keyset_votes", Movie.sum_votes, Movie.id)
+Index("ix_movies_keyset_title", Movie.title, Movie.id)
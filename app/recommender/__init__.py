@@ -0,0 +1,3 @@
+from app.recommender.registry import GenreDataset, GenreRegistry, genre_registry
+
+__all__ = ["GenreDataset", "GenreRegistry", "genre_registry"]
@@ -0,0 +1,224 @@
+"""
+Таблица готовых ответов для бота вопрос-ответ.
+
+Пространство ответов конечное: жанр x поджанр x детализация x период. Офлайн-сборка перебирает
+все комбинации значений из файлов жанров и сохраняет для каждой ранжированный список kp_id
+в один .npz файл. На запрос остается поиск по словарю и один запрос к БД по id.
+
+Сборка инкрементальная: жанр пересчитывается, только если изменился его CSV (sha1 содержимого).
+Неизвестные комбинации и жанры с устаревшими данными обрабатываются живым алгоритмом.
+
+Запуск: python -m app.recommender.answer_table [--force]
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.basic_algorithm import RECOMMENDATIONS_COUNT
+from app.core.config import ANSWER_TABLE_PATH
+from app.recommender.registry import GenreDataset, GenreRegistry, genre_registry
+from app.recommender.scoring import masks_for_codes, rank_movies
+
+TABLE_FORMAT_VERSION = 2
+META_KEY = "__meta__"
+
+
+def file_sha1(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def vocabulary_values(dataset: GenreDataset, column: int) -> List[str]:
+    """Значения колонки в порядке их кодов"""
+    vocabulary = dataset.encoded.vocabularies[column]
+    values = [""] * len(vocabulary)
+    for value, code in vocabulary.items():
+        values[code] = value
+    return values
+
+
+def build_genre_answers(dataset: GenreDataset, top_n: int) -> np.ndarray:
+    """Ранжированные kp_id для всех комбинаций (поджанр, детализация, период) жанра"""
+    encoded = dataset.encoded
+    genre_code = encoded.lookup(0, dataset.name)
+    shape = tuple(len(vocabulary) for vocabulary in encoded.vocabularies[1:])
+    answers = np.full(shape + (top_n,), -1, dtype=np.int32)
+
+    for combo in np.ndindex(*shape):
+        masks = masks_for_codes(encoded, (genre_code,) + combo)
+        # Как и живой подсчет, только строки с kp_id: иначе после их отсева ответ короче top_n
+        ranking = rank_movies(encoded, masks, top_n, dataset.rows_with_kp_id)
+        answers[combo][:len(ranking)] = dataset.kp_ids[ranking]
+    return answers
+
+
+def read_table(path: str) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """Читает файл таблицы: метаданные и массивы ответов по ключам"""
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data[META_KEY]))
+        arrays = {key: data[key] for key in data.files if key != META_KEY}
+    if meta.get("version") != TABLE_FORMAT_VERSION:
+        return {"genres": {}}, {}
+    return meta, arrays
+
+
+def write_table(path: str, meta: dict, arrays: Dict[str, np.ndarray]) -> None:
+    """Атомарно записывает таблицу: сначала во временный файл, затем переименование"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **{META_KEY: np.array(json.dumps(meta, ensure_ascii=False))}, **arrays)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def build_answer_table(
+    path: str = ANSWER_TABLE_PATH,
+    registry: GenreRegistry = genre_registry,
+    top_n: int = RECOMMENDATIONS_COUNT,
+    force: bool = False,
+) -> Dict[str, int]:
+    """Собирает (или дособирает) таблицу ответов, возвращает статистику по жанрам"""
+    meta, arrays = {"genres": {}}, {}
+    if not force and os.path.exists(path):
+        meta, arrays = read_table(path)
+
+    new_meta = {"version": TABLE_FORMAT_VERSION, "top_n": top_n, "genres": {}}
+    new_arrays = {}
+    stats = {"rebuilt": 0, "kept": 0, "skipped": 0}
+
+    for index, genre in enumerate(registry.genres()):
+        key = f"g{index}"
+        digest = file_sha1(registry.path_for(genre))
+        entry = meta["genres"].get(genre)
+        if entry is not None and entry["sha1"] == digest and meta.get("top_n") == top_n:
+            new_meta["genres"][genre] = {**entry, "key": key}
+            new_arrays[key] = arrays[entry["key"]]
+            stats["kept"] += 1
+            continue
+
+        dataset = registry.get(genre)
+        if dataset is None or len(dataset) == 0:
+            stats["skipped"] += 1
+            continue
+
+        print(f"Собираю ответы для жанра {genre}")
+        new_meta["genres"][genre] = {
+            "sha1": digest,
+            "key": key,
+            "vocabularies": [vocabulary_values(dataset, column) for column in range(1, 4)],
+        }
+        new_arrays[key] = build_genre_answers(dataset, top_n)
+        stats["rebuilt"] += 1
+
+    write_table(path, new_meta, new_arrays)
+    return stats
+
+
+class GenreAnswers:
+    """Ответы одного жанра в памяти"""
+
+    def __init__(self, entry: dict, answers: np.ndarray):
+        self.sha1 = entry["sha1"]
+        self.indexes = tuple(
+            {value: code for code, value in enumerate(values)}
+            for values in entry["vocabularies"]
+        )
+        self.answers = answers
+
+
+class AnswerTable:
+    """Поиск готового ответа; файл перечитывается при изменении mtime"""
+
+    def __init__(self, path: str = ANSWER_TABLE_PATH, registry: GenreRegistry = genre_registry):
+        self.path = path
+        self.registry = registry
+        self._mtime_ns: Optional[int] = None
+        self._genres: Dict[str, GenreAnswers] = {}
+        # Результат сверки sha1 с исходным CSV для его текущего mtime
+        self._verified: Dict[str, Tuple[int, bool]] = {}
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self) -> None:
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self._mtime_ns, self._genres, self._verified = None, {}, {}
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return
+            meta, arrays = read_table(self.path)
+            self._genres = {
+                genre: GenreAnswers(entry, arrays[entry["key"]])
+                for genre, entry in meta["genres"].items()
+            }
+            self._verified = {}
+            self._mtime_ns = mtime_ns
+
+    def _is_fresh(self, genre: str, answers: GenreAnswers) -> bool:
+        """Таблица собрана из текущей версии CSV жанра"""
+        path = self.registry.path_for(genre)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            return False
+        checked = self._verified.get(genre)
+        if checked is None or checked[0] != mtime_ns:
+            checked = (mtime_ns, file_sha1(path) == answers.sha1)
+            self._verified[genre] = checked
+        return checked[1]
+
+    def lookup(
+        self,
+        main_genre: str,
+        subgenre: str,
+        subgenre_detail: str,
+        time_period: str,
+    ) -> Optional[List[int]]:
+        """Ранжированные kp_id или None, если комбинации нет в таблице"""
+        self._ensure_loaded()
+        answers = self._genres.get(main_genre)
+        if answers is None or not self._is_fresh(main_genre, answers):
+            return None
+
+        position = []
+        for index, value in zip(answers.indexes, (subgenre, subgenre_detail, time_period)):
+            code = index.get(value.strip())
+            if code is None:
+                return None
+            position.append(code)
+        return [int(kp_id) for kp_id in answers.answers[tuple(position)] if kp_id >= 0]
+
+
+answer_table = AnswerTable()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сборка таблицы готовых ответов для бота вопрос-ответ")
+    parser.add_argument("--output", default=ANSWER_TABLE_PATH, help="путь к файлу таблицы")
+    parser.add_argument("--force", action="store_true", help="пересобрать все жанры")
+    args = parser.parse_args()
+
+    result = build_answer_table(args.output, force=args.force)
+    print(
+        f"Готово: пересобрано {result['rebuilt']}, без изменений {result['kept']}, "
+        f"пропущено {result['skipped']} -> {args.output}"
+    )
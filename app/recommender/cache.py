@@ -0,0 +1,25 @@
+"""
+Кэш результатов /api/movies/recommend.
+
+Бот и фронтенд присылают одни и те же наборы ответов, поэтому готовый список фильмов
+кэшируется по нормализованному кортежу ответов и limit. Версия записи - mtime файла жанра:
+после обновления датасета записи этого жанра перестают отдаваться.
+"""
+from typing import Tuple
+
+from app.core.cache import LRUCache
+from app.core.config import RECOMMEND_CACHE_SIZE, RECOMMEND_CACHE_TTL
+
+
+def cache_key(
+    main_genre: str,
+    subgenre: str,
+    subgenre_detail: str,
+    time_period: str,
+    limit: int,
+) -> Tuple[str, str, str, str, int]:
+    # Сравнение с данными идет после strip(), поэтому ответы, отличающиеся пробелами, одинаковы
+    return (main_genre.strip(), subgenre.strip(), subgenre_detail.strip(), time_period.strip(), limit)
+
+
+recommendation_cache = LRUCache(maxsize=RECOMMEND_CACHE_SIZE, ttl=RECOMMEND_CACHE_TTL)
@@ -0,0 +1,293 @@
+"""
+Похожие фильмы по содержанию для всего каталога.
+
+Файлы update_films дают похожие только внутри одного жанра, и у многих фильмов связей нет.
+Здесь каждый фильм из таблицы movies превращается в разреженный вектор признаков: жанры,
+страны, персоны, режиссер и десятилетие выхода. Веса - TF-IDF (редкий признак значит больше),
+строки нормированы, поэтому скалярное произведение - косинусное сходство.
+
+Соседи всего каталога считаются блоками строк: X[block] @ X.T дает разреженную матрицу сходств
+блока, из каждой строки берутся k лучших. Блоки раздаются процессам (jobs), матрица передается
+им один раз при старте. Результат пишется в movie_similarities (rank, score) через
+SimilarityRepository: по умолчанию только для фильмов без связей, с --replace - весь набор.
+
+Новый фильм из API получает соседей по уже построенному индексу (словарь и IDF не пересчитываются,
+неизвестные признаки ни с чем не совпадают) и сам добавляется в индекс. Сам индекс строится
+в фоновом потоке, не в запросе.
+
+Запуск: python -m app.recommender.content [--k 20] [--jobs N] [--replace]
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy.orm import Session
+
+from app.core.config import CONTENT_SIMILAR_BLOCK_SIZE, CONTENT_SIMILAR_K
+from app.repositories.movies import MovieRepository
+from app.repositories.similarities import SimilarityEdge, SimilarityRepository
+
+
+def movie_tokens(genres, countries, persons, director, year_release) -> List[str]:
+    """Признаки фильма; префикс не дает совпасть, например, стране и жанру с одним названием"""
+    tokens = []
+    for prefix, values in (("genre", genres), ("country", countries), ("person", persons), ("director", [director])):
+        for value in values or ():
+            value = str(value or "").strip().lower()
+            if value:
+                tokens.append(f"{prefix}:{value}")
+    if year_release:
+        tokens.append(f"decade:{year_release // 10 * 10}")
+    return list(dict.fromkeys(tokens))
+
+
+def normalize_rows(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix)
+
+
+class ContentIndex:
+    """Нормированные TF-IDF векторы фильмов: строка i - фильм ids[i]"""
+
+    def __init__(self, ids: np.ndarray, matrix: sparse.csr_matrix, vocabulary: Dict[str, int], idf: np.ndarray):
+        self.ids = ids
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+        self.idf = idf
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, features: Iterable[Sequence]) -> "ContentIndex":
+        """features - строки (id, genres, countries, persons, director, year_release)"""
+        ids, rows, vocabulary = [], [], {}
+        for movie_id, *fields in features:
+            ids.append(movie_id)
+            rows.append([vocabulary.setdefault(token, len(vocabulary)) for token in movie_tokens(*fields)])
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=indptr[1:])
+        indices = np.fromiter((column for row in rows for column in row), dtype=np.int32, count=int(indptr[-1]))
+        counts = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr), shape=(len(rows), len(vocabulary))
+        )
+
+        # Сглаженный IDF, как в sklearn: признак, который есть у всех, все равно имеет вес 1
+        document_frequency = np.bincount(indices, minlength=len(vocabulary))
+        idf = (np.log((1 + len(rows)) / (1 + document_frequency)) + 1).astype(np.float32)
+        matrix = normalize_rows(counts @ sparse.diags(idf))
+        return cls(np.asarray(ids, dtype=np.int64), matrix.astype(np.float32), vocabulary, idf)
+
+    def vectorize(self, fields: Sequence) -> sparse.csr_matrix:
+        columns = sorted({self.vocabulary[token] for token in movie_tokens(*fields) if token in self.vocabulary})
+        vector = sparse.csr_matrix(
+            (self.idf[columns], (np.zeros(len(columns), dtype=np.int32), columns)),
+            shape=(1, len(self.vocabulary)),
+        )
+        return normalize_rows(vector).astype(np.float32)
+
+    def append(self, movie_id: int, vector: sparse.csr_matrix) -> None:
+        self.ids = np.append(self.ids, movie_id)
+        self.matrix = sparse.vstack([self.matrix, vector], format="csr")
+
+
+def top_k_rows(similarities: sparse.csr_matrix, k: int, skip_columns: Optional[Sequence[int]] = None):
+    """Для каждой строки - (номера колонок, сходства) k лучших по убыванию, ничьи по номеру колонки"""
+    similarities = sparse.csr_matrix(similarities)
+    result = []
+    for row in range(similarities.shape[0]):
+        start, stop = similarities.indptr[row], similarities.indptr[row + 1]
+        columns = similarities.indices[start:stop]
+        scores = similarities.data[start:stop]
+        keep = scores > 0
+        if skip_columns is not None:
+            keep &= columns != skip_columns[row]
+        columns, scores = columns[keep], scores[keep]
+        if len(columns) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            columns, scores = columns[top], scores[top]
+        order = np.lexsort((columns, -scores))
+        result.append((columns[order], scores[order]))
+    return result
+
+
+_worker_matrix: Optional[sparse.csr_matrix] = None
+
+
+def _init_worker(matrix: sparse.csr_matrix) -> None:
+    global _worker_matrix
+    _worker_matrix = matrix
+
+
+def block_neighbours(matrix: sparse.csr_matrix, start: int, stop: int, k: int):
+    similarities = matrix[start:stop] @ matrix.T
+    return start, top_k_rows(similarities, k, skip_columns=range(start, stop))
+
+
+def _block_task(start: int, stop: int, k: int):
+    return block_neighbours(_worker_matrix, start, stop, k)
+
+
+def compute_neighbours(
+    index: ContentIndex,
+    k: int = CONTENT_SIMILAR_K,
+    block_size: int = CONTENT_SIMILAR_BLOCK_SIZE,
+    jobs: int = 1,
+) -> List[SimilarityEdge]:
+    """Связи (movie_id, similar_movie_id, rank, score) к k самым похожим фильмам для всего каталога"""
+    blocks = [(start, min(start + block_size, len(index))) for start in range(0, len(index), block_size)]
+    if jobs > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(index.matrix,)) as pool:
+            results = list(pool.map(_block_task, *zip(*blocks), [k] * len(blocks)))
+    else:
+        results = [block_neighbours(index.matrix, start, stop, k) for start, stop in blocks]
+
+    edges = []
+    for start, rows in results:
+        for offset, (columns, scores) in enumerate(rows):
+            movie_id = int(index.ids[start + offset])
+            for rank, (column, score) in enumerate(zip(columns.tolist(), scores.tolist()), start=1):
+                edges.append((movie_id, int(index.ids[column]), rank, round(score, 4)))
+    return edges
+
+
+def build_content_similarities(
+    db: Session,
+    k: int = CONTENT_SIMILAR_K,
+    block_size: int = CONTENT_SIMILAR_BLOCK_SIZE,
+    jobs: int = 1,
+    replace: bool = False,
+) -> Dict[str, int]:
+    """Считает соседей всего каталога и пишет их в movie_similarities.
+
+    Без replace связи добавляются только фильмам, у которых их еще нет (связи из CSV остаются).
+    """
+    index = ContentIndex.build(MovieRepository(db).get_content_features())
+    content_index.set(index)
+    edges = compute_neighbours(index, k=k, block_size=block_size, jobs=jobs)
+
+    repository = SimilarityRepository(db)
+    if replace:
+        written = repository.replace_edges(edges)
+    else:
+        existing = repository.movie_ids_with_edges()
+        written = repository.insert_edges(edge for edge in edges if edge[0] not in existing)
+    return {"movies": len(index), "features": len(index.vocabulary), "edges": len(edges), "written": written}
+
+
+class ContentIndexHolder:
+    """Индекс процесса для новых фильмов.
+
+    Индекс всего каталога строится в фоновом потоке (при старте с RECOMMENDER_PRELOAD или после
+    первого созданного фильма), а не в запросе админа. Фильмы, созданные до его готовности,
+    получают соседей сразу после сборки; в самом запросе остается только top-k по готовому индексу.
+    """
+
+    def __init__(self):
+        self._index: Optional[ContentIndex] = None
+        # (id, признаки) фильмов, созданных, пока индекс строился
+        self._pending: List[tuple] = []
+        self._loader: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def set(self, index: Optional[ContentIndex]) -> None:
+        with self._lock:
+            self._index = index
+
+    def clear(self) -> None:
+        with self._lock:
+            self._index = None
+            self._pending = []
+
+    def load(self, db: Session, k: int = CONTENT_SIMILAR_K) -> int:
+        """Строит индекс каталога и пишет соседей отложенных фильмов; возвращает размер индекса"""
+        index = ContentIndex.build(MovieRepository(db).get_content_features())
+        with self._lock:
+            self._index = index
+            pending, self._pending = self._pending, []
+        for movie_id, fields in pending:
+            self._write_neighbours(db, movie_id, fields, k)
+        return len(index)
+
+    def _load_with_session(self) -> None:
+        from app.db.session import SessionLocal
+
+        try:
+            with SessionLocal() as db:
+                print(f"Построен индекс похожих по содержанию: {self.load(db)} фильмов")
+        except Exception as e:
+            print(f"Не удалось построить индекс похожих по содержанию: {e}")
+
+    def load_in_background(self) -> None:
+        with self._lock:
+            if self._index is not None or (self._loader is not None and self._loader.is_alive()):
+                return
+            self._loader = threading.Thread(target=self._load_with_session, name="content-index", daemon=True)
+            self._loader.start()
+
+    def _write_neighbours(self, db: Session, movie_id: int, fields: tuple, k: int) -> int:
+        with self._lock:
+            index = self._index
+            if index is None:
+                return 0
+            vector = index.vectorize(fields)
+            # Фильм мог попасть в индекс при сборке: тогда он не сосед сам себе и не добавляется второй раз
+            positions = np.flatnonzero(index.ids == movie_id)
+            if len(index) == 0:
+                edges = []
+            else:
+                skip = [int(positions[0])] if len(positions) else None
+                columns, scores = top_k_rows(vector @ index.matrix.T, k, skip_columns=skip)[0]
+                edges = [
+                    (movie_id, int(index.ids[column]), rank, round(score, 4))
+                    for rank, (column, score) in enumerate(zip(columns.tolist(), scores.tolist()), start=1)
+                ]
+            if not len(positions):
+                index.append(movie_id, vector)
+        return SimilarityRepository(db).insert_edges(edges)
+
+    def add_movie(self, db: Session, movie, k: int = CONTENT_SIMILAR_K) -> int:
+        """Пишет соседей нового фильма и добавляет его в индекс; возвращает количество связей.
+
+        Если индекс еще не готов, фильм откладывается до конца фоновой сборки и возвращается 0.
+        """
+        fields = (movie.genres, movie.countries, movie.persons, movie.director, movie.year_release)
+        with self._lock:
+            ready = self._index is not None
+            if not ready:
+                self._pending.append((movie.id, fields))
+        if not ready:
+            self.load_in_background()
+            return 0
+        return self._write_neighbours(db, movie.id, fields, k)
+
+
+content_index = ContentIndexHolder()
+
+
+if __name__ == "__main__":
+    from app.db.session import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Похожие фильмы по содержанию для всего каталога")
+    parser.add_argument("--k", type=int, default=CONTENT_SIMILAR_K, help="соседей на фильм")
+    parser.add_argument("--block-size", type=int, default=CONTENT_SIMILAR_BLOCK_SIZE, help="строк в блоке")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="число процессов")
+    parser.add_argument("--replace", action="store_true", help="заменить все связи одной транзакцией")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        result = build_content_similarities(
+            db, k=args.k, block_size=args.block_size, jobs=args.jobs, replace=args.replace
+        )
+    print(
+        f"Готово за {time.perf_counter() - started:.1f} с: фильмов {result['movies']}, "
+        f"признаков {result['features']}, связей {result['edges']}, записано {result['written']}"
+    )
@@ -0,0 +1,140 @@
+"""
+Отдельный ограниченный пул для CPU-тяжелого подсчета рекомендаций.
+
+Живой подсчет рекомендаций (когда ответа нет в таблице) выполняется не в потоке запроса,
+а в собственном пуле из RECOMMENDER_WORKERS потоков. Одновременно в пуле может находиться
+не больше RECOMMENDER_WORKERS + RECOMMENDER_QUEUE_DEPTH задач; сверх этого запрос сразу
+получает отказ (503 с Retry-After), а не занимает потоки, нужные остальному API.
+
+Пул потоков, а не процессов: датасеты жанров и карта kp_id живут в памяти процесса,
+а основная работа идет в numpy, который отпускает GIL.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import RECOMMENDER_QUEUE_DEPTH, RECOMMENDER_RETRY_AFTER, RECOMMENDER_WORKERS
+from app.recommender.tracing import record
+
+# Сколько последних замеров хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+
+class RecommenderBusyError(Exception):
+    """Пул рекомендаций заполнен, повторить запрос через retry_after секунд"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Recommender is busy")
+        self.retry_after = retry_after
+
+
+def percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 2)
+
+
+class RecommenderExecutor:
+    def __init__(
+        self,
+        workers: int = RECOMMENDER_WORKERS,
+        queue_depth: int = RECOMMENDER_QUEUE_DEPTH,
+        retry_after: int = RECOMMENDER_RETRY_AFTER,
+    ):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_times = deque(maxlen=LATENCY_WINDOW)
+        self._run_times = deque(maxlen=LATENCY_WINDOW)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # Потоки создаются при первом живом подсчете, а не при импорте модуля
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="recommender"
+                    )
+        return self._pool
+
+    def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Выполняет func в пуле и ждет результат; при заполненной очереди - RecommenderBusyError"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise RecommenderBusyError(self.retry_after)
+
+        with self._lock:
+            self._in_flight += 1
+        submitted_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                self._wait_times.append(started_at - submitted_at)
+            record("queue", started_at - submitted_at)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._run_times.append(time.perf_counter() - started_at)
+
+        try:
+            # Задача выполняется в копии контекста запроса, чтобы этапы попали в его трассировку
+            context = contextvars.copy_context()
+            result = self._get_pool().submit(context.run, task).result()
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "in_flight": self._in_flight,
+                "running": self._running,
+                "queued": self._in_flight - self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "wait_ms_p50": percentile(wait_times, 0.5),
+                "wait_ms_p95": percentile(wait_times, 0.95),
+                "run_ms_p50": percentile(run_times, 0.5),
+                "run_ms_p95": percentile(run_times, 0.95),
+            }
+
+
+recommender_executor = RecommenderExecutor()
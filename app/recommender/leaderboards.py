@@ -0,0 +1,99 @@
+"""
+Лучшие фильмы каждого жанра в памяти процесса.
+
+Если у фильма нет связей в movie_similarities, похожими считаются лучшие фильмы его первого жанра.
+Вместо запроса genres.contains(...) с сортировкой по всей таблице на каждую страницу фильма
+держим для каждого жанра первые LEADERBOARD_SIZE id по combined_rating, затем sum_votes
+(пустые значения в конце). Ответ - первые k записей, кроме самого фильма.
+
+Как и карта kp_id, таблицы строятся одним запросом при первом обращении, дополняются
+при создании фильмов через API и целиком перечитываются раз в LEADERBOARD_TTL секунд.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import LEADERBOARD_SIZE, LEADERBOARD_TTL
+from app.repositories.movies import MovieRepository
+
+# Таблица по всем фильмам - для фильмов без жанров
+ALL_GENRES = ""
+
+SortKey = Tuple[int, float, int, float, int]
+
+
+def sort_key(movie_id: int, combined_rating: Optional[float], sum_votes: Optional[int]) -> SortKey:
+    """Меньше - выше в таблице: рейтинг и голоса по убыванию, пустые в конце, затем id"""
+    return (
+        combined_rating is None, -(combined_rating or 0.0),
+        sum_votes is None, -(sum_votes or 0),
+        movie_id,
+    )
+
+
+class GenreLeaderboards:
+    def __init__(self, size: int = LEADERBOARD_SIZE, ttl: int = LEADERBOARD_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._keys: Dict[str, List[SortKey]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def is_loaded(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return self.ttl <= 0 or time.monotonic() - self._loaded_at < self.ttl
+
+    def load(self, db: Session) -> int:
+        """Перечитывает таблицы из БД, возвращает количество жанров"""
+        boards: Dict[str, List[SortKey]] = {}
+        for movie_id, genres, combined_rating, sum_votes in MovieRepository(db).get_rating_rows():
+            key = sort_key(movie_id, combined_rating, sum_votes)
+            for genre in {ALL_GENRES, *(genres or ())}:
+                boards.setdefault(genre, []).append(key)
+        for genre, keys in boards.items():
+            keys.sort()
+            del keys[self.size:]
+        with self._lock:
+            self._keys = boards
+            self._loaded_at = time.monotonic()
+            return len(boards) - (ALL_GENRES in boards)
+
+    def add(self, movie) -> None:
+        """Ставит новый фильм на его место в таблицах его жанров"""
+        key = sort_key(movie.id, movie.combined_rating, movie.sum_votes)
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for genre in {ALL_GENRES, *(movie.genres or ())}:
+                # Новый список, а не вставка в старый: читатели без блокировки видят целую таблицу
+                keys = list(self._keys.get(genre, ()))
+                bisect.insort(keys, key)
+                self._keys[genre] = keys[:self.size]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys = {}
+            self._loaded_at = None
+
+    def top(self, db: Session, genre: Optional[str], k: int, exclude_id: Optional[int] = None) -> Optional[List[int]]:
+        """Первые k id жанра без exclude_id; None, если таблицы жанра нет или в ней не хватает фильмов"""
+        if not self.is_loaded():
+            self.load(db)
+        keys = self._keys.get(genre or ALL_GENRES)
+        if keys is None:
+            return None
+        ids = []
+        for key in keys:
+            if key[-1] != exclude_id:
+                ids.append(key[-1])
+                if len(ids) == k:
+                    return ids
+        # Таблица обрезана до size: если жанр больше, остальные фильмы в ней не видны
+        return ids if len(keys) < self.size else None
+
+
+genre_leaderboards = GenreLeaderboards()
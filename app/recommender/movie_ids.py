@@ -0,0 +1,60 @@
+"""
+Соответствие kp_id -> Movie.id в памяти процесса.
+
+Рекомендации считаются по kp_id из файлов жанров, а фильмы из БД достаются по первичному ключу.
+Карта строится одним запросом при старте (или при первом обращении), дополняется при создании
+фильмов через API и целиком перечитывается раз в KP_ID_MAP_TTL секунд, чтобы подхватить импорт скриптами.
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import KP_ID_MAP_TTL
+from app.repositories.movies import MovieRepository
+
+
+class KpIdMap:
+    def __init__(self, ttl: int = KP_ID_MAP_TTL):
+        self.ttl = ttl
+        self._ids: Dict[int, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def is_loaded(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return self.ttl <= 0 or time.monotonic() - self._loaded_at < self.ttl
+
+    def load(self, db: Session) -> int:
+        """Перечитывает карту из БД, возвращает количество фильмов"""
+        with self._lock:
+            self._ids = dict(MovieRepository(db).get_kp_id_pairs())
+            self._loaded_at = time.monotonic()
+            return len(self._ids)
+
+    def add(self, kp_id: int, movie_id: int) -> None:
+        self._ids[kp_id] = movie_id
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids = {}
+            self._loaded_at = None
+
+    def resolve(self, db: Session, kp_ids: List[int]) -> List[int]:
+        """Movie.id для списка kp_id в том же порядке, без повторов и неизвестных фильмов"""
+        if not self.is_loaded():
+            self.load(db)
+        ids = self._ids
+        result = []
+        seen = set()
+        for kp_id in kp_ids:
+            movie_id = ids.get(kp_id)
+            if movie_id is not None and movie_id not in seen:
+                seen.add(movie_id)
+                result.append(movie_id)
+        return result
+
+
+kp_id_map = KpIdMap()
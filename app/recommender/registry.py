@@ -0,0 +1,218 @@
+"""
+Реестр датасетов жанров для бота вопрос-ответ.
+
+Каждый файл <GENRE_DATA_DIR>/<жанр>.csv разбирается один раз на процесс и хранится
+в колоночном виде (numpy-массивы). Повторно файл читается только если изменился его mtime,
+поэтому запросы к /api/movies/recommend работают только с памятью.
+
+Если собран бинарный снимок (app.recommender.snapshot) и CSV с тех пор не менялся,
+датасет берется из снимка без разбора текста: коды критериев и порядок по оценке - прямо
+из общих для воркеров mmap-массивов, строковые колонки декодируются только при обращении.
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.basic_algorithm import calculate_average_ratings, read_genre_table
+from app.core.config import DATA_SNAPSHOT_DIR, GENRE_DATA_DIR
+from app.recommender.scoring import EncodedCriteria, encode_criteria
+
+if TYPE_CHECKING:
+    from app.recommender.snapshot import Snapshot
+
+# Колонка с ID фильма на Кинопоиске в файлах жанров
+KP_ID_COLUMN = 6
+RATING_COLUMN = "Средняя оценка"
+
+
+@dataclass(frozen=True)
+class GenreDataset:
+    """Данные одного жанра: первые 6 колонок файла, средняя оценка и kp_id"""
+    name: str
+    path: str
+    mtime_ns: int
+    ratings: np.ndarray
+    kp_ids: np.ndarray
+    encoded: EncodedCriteria
+    # Строковые колонки нужны только для названий и отладки, подсчет идет по encoded
+    load_columns: Callable[[], Tuple[np.ndarray, ...]] = field(repr=False, compare=False)
+
+    def __len__(self) -> int:
+        return len(self.ratings)
+
+    @cached_property
+    def columns(self) -> Tuple[np.ndarray, ...]:
+        return self.load_columns()
+
+    @cached_property
+    def rows_with_kp_id(self) -> np.ndarray:
+        """Строки, которые можно отдать в рекомендациях: без kp_id фильм не найти в БД"""
+        return np.flatnonzero(self.kp_ids >= 0)
+
+    @property
+    def titles(self) -> np.ndarray:
+        return self.columns[0]
+
+    @property
+    def criteria(self) -> Tuple[np.ndarray, ...]:
+        """Колонки 1-4: жанр, поджанр, детализация и временной период"""
+        return self.columns[1:5]
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame в том же виде, что возвращает load_genre_data"""
+        df = pd.DataFrame({i: column for i, column in enumerate(self.columns)})
+        df[RATING_COLUMN] = self.ratings
+        return df
+
+
+def build_dataset(name: str, path: str) -> Optional[GenreDataset]:
+    """Читает файл жанра и приводит его к колоночному виду"""
+    mtime_ns = os.stat(path).st_mtime_ns
+    df = read_genre_table(path, verbose=False)
+    if df is None or df.empty or len(df.columns) < 6:
+        return None
+
+    columns = tuple(
+        df.iloc[:, i].astype(str).str.strip().to_numpy(dtype=object)
+        for i in range(6)
+    )
+    kp_ids = (
+        pd.to_numeric(df.iloc[:, KP_ID_COLUMN].astype(str).str.strip(), errors="coerce")
+        .fillna(-1)
+        .to_numpy(dtype=np.int64)
+        if len(df.columns) > KP_ID_COLUMN
+        else np.full(len(df), -1, dtype=np.int64)
+    )
+    ratings = calculate_average_ratings(df)
+    return GenreDataset(
+        name=name,
+        path=path,
+        mtime_ns=mtime_ns,
+        ratings=ratings,
+        kp_ids=kp_ids,
+        encoded=encode_criteria(columns[1:5], ratings),
+        load_columns=lambda: columns,
+    )
+
+
+def build_dataset_from_snapshot(
+    name: str, path: str, mtime_ns: int, snapshot: "Snapshot", entry: dict
+) -> GenreDataset:
+    """Датасет жанра из бинарного снимка: без декодирования строк и пересчета словарей"""
+    ratings, kp_ids = snapshot.genre_values(entry)
+    return GenreDataset(
+        name=name,
+        path=path,
+        mtime_ns=mtime_ns,
+        ratings=ratings,
+        kp_ids=kp_ids,
+        encoded=snapshot.genre_encoded(entry),
+        load_columns=lambda: snapshot.genre_columns(entry),
+    )
+
+
+class GenreRegistry:
+    """Процессный кэш датасетов жанров с перечитыванием по mtime"""
+
+    def __init__(self, base_path: str = GENRE_DATA_DIR, snapshot_path: Optional[str] = DATA_SNAPSHOT_DIR):
+        self.base_path = base_path
+        self.snapshot_path = snapshot_path
+        self._datasets: Dict[str, GenreDataset] = {}
+        self._snapshot: Optional["Snapshot"] = None
+        self._lock = threading.Lock()
+
+    def path_for(self, genre: str) -> Optional[str]:
+        # Жанр приходит от пользователя, поэтому не даем выйти за пределы папки
+        if not genre or os.path.basename(genre) != genre:
+            return None
+        return os.path.join(self.base_path, f"{genre}.csv")
+
+    def genres(self) -> List[str]:
+        if not os.path.isdir(self.base_path):
+            return []
+        return sorted(
+            file_name[:-len(".csv")]
+            for file_name in os.listdir(self.base_path)
+            if file_name.endswith(".csv")
+        )
+
+    def snapshot(self) -> Optional["Snapshot"]:
+        """Текущий снимок; открывается заново, если после загрузки его пересобрали"""
+        if self.snapshot_path is None:
+            return None
+        # Модуль снимка сам строит датасеты через этот модуль при сборке
+        from app.recommender.snapshot import MANIFEST_NAME, load_snapshot
+
+        try:
+            mtime_ns = os.stat(os.path.join(self.snapshot_path, MANIFEST_NAME)).st_mtime_ns
+        except OSError:
+            self._snapshot = None
+            return None
+        if self._snapshot is None or self._snapshot.mtime_ns != mtime_ns:
+            self._snapshot = load_snapshot(self.snapshot_path)
+        return self._snapshot
+
+    def _build(self, genre: str, path: str, mtime_ns: int) -> Optional[GenreDataset]:
+        snapshot = self.snapshot()
+        entry = snapshot.entry("genres", genre, path) if snapshot is not None else None
+        if entry is not None and entry["mtime_ns"] == mtime_ns:
+            return build_dataset_from_snapshot(genre, path, mtime_ns, snapshot, entry)
+        return build_dataset(genre, path)
+
+    def get(self, genre: str) -> Optional[GenreDataset]:
+        """Возвращает датасет жанра, при необходимости (пере)загружая его"""
+        path = self.path_for(genre)
+        if path is None:
+            return None
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            print(f"Файл {path} не найден")
+            return None
+
+        dataset = self._datasets.get(genre)
+        if dataset is not None and dataset.mtime_ns == mtime_ns:
+            return dataset
+
+        with self._lock:
+            # Пока ждали блокировку, датасет мог загрузить другой поток
+            dataset = self._datasets.get(genre)
+            if dataset is not None and dataset.mtime_ns == mtime_ns:
+                return dataset
+            dataset = self._build(genre, path, mtime_ns)
+            if dataset is None:
+                self._datasets.pop(genre, None)
+                return None
+            self._datasets[genre] = dataset
+            return dataset
+
+    def version(self, genre: str) -> Optional[int]:
+        """Версия датасета (mtime файла) или None, если жанра нет.
+
+        Только stat файла, без загрузки: разбор CSV идет в пуле рекомендаций вместе с подсчетом,
+        а не в потоке запроса, где его не ограничивает очередь пула.
+        """
+        path = self.path_for(genre)
+        if path is None:
+            return None
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def preload(self) -> int:
+        """Загружает все жанры сразу, возвращает количество загруженных"""
+        return sum(1 for genre in self.genres() if self.get(genre) is not None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._datasets.clear()
+            self._snapshot = None
+
+
+genre_registry = GenreRegistry()
@@ -0,0 +1,122 @@
+"""
+Векторный подсчет совпадений для recommend_movies.
+
+Колонки с критериями кодируются словарем в целые коды один раз при загрузке жанра.
+На запрос строится битовая маска совпадений по всему жанру за один проход numpy,
+а топ-N выбирается через argpartition без полной сортировки.
+
+Порядок совпадает с прежней сортировкой DataFrame:
+exact_matches по убыванию, паттерн "1/2" по возрастанию, средняя оценка по убыванию,
+при полном равенстве - порядок строк в файле.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Количество критериев в ответе бота: жанр, поджанр, детализация, период
+CRITERIA_COUNT = 4
+MASK_VALUES = 1 << CRITERIA_COUNT
+
+
+def _build_tables() -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Таблицы по всем 16 маскам: exact_matches, первичный ключ сортировки и паттерн"""
+    exact = np.zeros(MASK_VALUES, dtype=np.int64)
+    primary = np.zeros(MASK_VALUES, dtype=np.int64)
+    patterns = []
+    for mask in range(MASK_VALUES):
+        genre_match = mask & 1
+        criteria = [(mask >> i) & 1 for i in range(1, CRITERIA_COUNT)]
+        # Жанр не входит в exact_matches, но его несовпадение уменьшает счетчик на 1
+        exact[mask] = genre_match + sum(criteria) - 1
+        # Первая цифра паттерна всегда "1", так как файл загружен по жанру
+        pattern = "1" + "".join("1" if matched else "2" for matched in criteria)
+        pattern_rank = int("".join("0" if matched else "1" for matched in criteria), 2)
+        primary[mask] = (CRITERIA_COUNT - 1 - exact[mask]) << (CRITERIA_COUNT - 1) | pattern_rank
+        patterns.append(pattern)
+    return exact, primary, patterns
+
+
+EXACT_BY_MASK, PRIMARY_BY_MASK, PATTERN_BY_MASK = _build_tables()
+
+
+def clean_value(value: str) -> str:
+    """Та же очистка, что применялась к ячейкам при сравнении"""
+    return str(value).strip().strip('"')
+
+
+@dataclass(frozen=True)
+class EncodedCriteria:
+    """Колонки критериев в виде целых кодов и порядок строк по оценке"""
+    vocabularies: Tuple[Dict[str, int], ...]
+    codes: np.ndarray
+    rating_order: np.ndarray
+    rating_levels: int
+
+    def lookup(self, column: int, value: str) -> int:
+        return self.vocabularies[column].get(value.strip(), -1)
+
+
+def encode_criteria(criteria: Sequence[np.ndarray], ratings: np.ndarray) -> EncodedCriteria:
+    """Кодирует колонки критериев словарем и заранее ранжирует строки по оценке"""
+    size = len(ratings)
+    codes = np.empty((CRITERIA_COUNT, size), dtype=np.int32)
+    vocabularies = []
+    for i, column in enumerate(criteria[:CRITERIA_COUNT]):
+        cleaned = np.array([clean_value(value) for value in column], dtype=object)
+        values, inverse = np.unique(cleaned, return_inverse=True)
+        codes[i] = inverse
+        vocabularies.append({value: code for code, value in enumerate(values)})
+
+    # Плотный ранг оценки по убыванию, затем номер строки: ключ уникален для каждой строки
+    levels, rating_inverse = np.unique(ratings, return_inverse=True)
+    rating_rank = (len(levels) - 1) - rating_inverse.astype(np.int64)
+    rating_order = rating_rank * size + np.arange(size, dtype=np.int64)
+    return EncodedCriteria(
+        vocabularies=tuple(vocabularies),
+        codes=codes,
+        rating_order=rating_order,
+        rating_levels=max(len(levels), 1),
+    )
+
+
+def masks_for_codes(encoded: EncodedCriteria, codes: Sequence[int]) -> np.ndarray:
+    """Битовая маска совпадений для каждой строки: бит i - совпал i-й критерий (код -1 не совпадает ни с чем)"""
+    masks = np.zeros(encoded.codes.shape[1], dtype=np.uint8)
+    for i, code in enumerate(codes[:CRITERIA_COUNT]):
+        if code >= 0:
+            masks |= (encoded.codes[i] == code).astype(np.uint8) << i
+    return masks
+
+
+def match_masks(encoded: EncodedCriteria, user_input: Sequence[str]) -> np.ndarray:
+    """Маска совпадений для ответов пользователя"""
+    codes = [encoded.lookup(i, value) for i, value in enumerate(user_input[:CRITERIA_COUNT])]
+    return masks_for_codes(encoded, codes)
+
+
+def rank_movies(
+    encoded: EncodedCriteria, masks: np.ndarray, top_n: int, rows: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Индексы строк топ-N фильмов в порядке рекомендации; rows - ранжировать только эти строки"""
+    size = len(masks)
+    if size == 0 or top_n <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    keys = PRIMARY_BY_MASK[masks] * (encoded.rating_levels * size) + encoded.rating_order
+    if rows is not None:
+        keys = keys[rows]
+    if top_n < len(keys):
+        candidates = np.argpartition(keys, top_n - 1)[:top_n]
+    else:
+        candidates = np.arange(len(keys))
+    ranking = candidates[np.argsort(keys[candidates])]
+    return ranking if rows is None else rows[ranking]
+
+
+def patterns_for(masks: np.ndarray) -> List[str]:
+    return [PATTERN_BY_MASK[mask] for mask in masks]
+
+
+def exact_matches_for(masks: np.ndarray) -> np.ndarray:
+    return EXACT_BY_MASK[masks]
@@ -0,0 +1,316 @@
+"""
+Бинарный снимок файлов жанров и файлов похожих фильмов.
+
+CSV в app/genre_with_info и app/update_films записаны в разных кодировках и с разным числом
+колонок, поэтому каждый процесс разбирает их заново. Конвертер один раз собирает их
+в папку с .npy файлами и manifest.json:
+
+- все строки хранятся в одном словаре: UTF-8 блоб + смещения, колонки - int32 коды строк;
+- средняя оценка - float32, kp_id - int32 (-1, если нет);
+- для подсчета рекомендаций - готовые коды критериев каждого жанра (как у encode_criteria),
+  порядок строк по оценке и значения словаря критериев (коды строк в порядке их номеров);
+- файлы похожих фильмов хранятся целиком как есть: у строк разное число ячеек,
+  поэтому ячейки лежат подряд, а границы строк - в массиве смещений.
+
+Загрузчик открывает массивы через np.load(mmap_mode="r"), поэтому воркеры uvicorn делят
+одни и те же страницы файлов. Подсчет идет прямо по сохраненным кодам, а из словаря строк
+декодируются только значения критериев жанра и строки, которые действительно читают.
+Для каждого исходного CSV в манифесте записаны размер, mtime и sha1: если файл изменился
+после сборки, используется сам CSV.
+
+Файлы сборки имеют уникальный префикс, manifest.json заменяется атомарно последним,
+а старые файлы удаляются уже после него. Открытый снимок отображает в память все свои
+массивы сразу при загрузке, поэтому удаленные файлы остаются доступны ему (и датасетам,
+которые лениво декодируют из него строки), пока он жив.
+
+Запуск: python -m app.recommender.snapshot
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import DATA_SNAPSHOT_DIR, GENRE_DATA_DIR
+from app.recommender.scoring import CRITERIA_COUNT, EncodedCriteria
+
+SNAPSHOT_FORMAT_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+SIMILAR_DATA_DIR = "app/update_films"
+# Строковые колонки файла жанра, которые хранит GenreDataset
+GENRE_STRING_COLUMNS = 6
+
+
+def file_info(path: str) -> Dict[str, object]:
+    from app.recommender.answer_table import file_sha1
+
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": file_sha1(path)}
+
+
+class StringPool:
+    """Словарь строк снимка: одинаковые строки всех файлов хранятся один раз"""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+
+    def encode(self, values) -> np.ndarray:
+        codes = self._codes
+        return np.fromiter(
+            (codes.setdefault(value, len(codes)) for value in values),
+            dtype=np.int32,
+            count=len(values),
+        )
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        encoded = [value.encode("utf-8") for value in self._codes]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return blob, offsets
+
+
+def build_genre_tables(genres_dir: str, pool: StringPool):
+    """Колонки всех файлов жанров подряд и границы каждого жанра"""
+    from app.recommender.registry import GenreRegistry, build_dataset
+
+    registry = GenreRegistry(genres_dir, snapshot_path=None)
+    tables, codes, ratings, kp_ids, criteria, rating_order, vocab = {}, [], [], [], [], [], []
+    start, vocab_start = 0, 0
+    for genre in registry.genres():
+        path = registry.path_for(genre)
+        info = file_info(path)
+        dataset = build_dataset(genre, path)
+        if dataset is None:
+            continue
+        encoded = dataset.encoded
+        codes.append(np.stack([pool.encode(column) for column in dataset.columns]))
+        ratings.append(dataset.ratings.astype(np.float32))
+        kp_ids.append(dataset.kp_ids.astype(np.int32))
+        criteria.append(encoded.codes)
+        rating_order.append(encoded.rating_order)
+        vocab_bounds = []
+        for vocabulary in encoded.vocabularies:
+            # Значения в порядке номеров: номер значения - его позиция
+            values = sorted(vocabulary, key=vocabulary.__getitem__)
+            vocab.append(pool.encode(values))
+            vocab_bounds.append([vocab_start, vocab_start + len(values)])
+            vocab_start += len(values)
+        tables[genre] = {
+            "file": os.path.basename(path), **info, "start": start, "stop": start + len(dataset),
+            "vocab": vocab_bounds, "rating_levels": encoded.rating_levels,
+        }
+        start += len(dataset)
+
+    arrays = {
+        "genre_codes": np.concatenate(codes, axis=1) if codes else np.empty((GENRE_STRING_COLUMNS, 0), np.int32),
+        "genre_ratings": np.concatenate(ratings) if ratings else np.empty(0, np.float32),
+        "genre_kp_ids": np.concatenate(kp_ids) if kp_ids else np.empty(0, np.int32),
+        "genre_criteria": np.concatenate(criteria, axis=1) if criteria else np.empty((CRITERIA_COUNT, 0), np.int32),
+        "genre_rating_order": np.concatenate(rating_order) if rating_order else np.empty(0, np.int64),
+        "genre_vocab": np.concatenate(vocab) if vocab else np.empty(0, np.int32),
+    }
+    return tables, arrays
+
+
+def build_similar_tables(similar_dir: str, pool: StringPool):
+    """Все строки файлов похожих фильмов: коды ячеек подряд и смещения начала строк"""
+    from app.fill_similar_movies import read_csv_rows
+
+    tables, cells, lengths = {}, [], []
+    start = 0
+    file_names = sorted(name for name in os.listdir(similar_dir) if name.endswith(".csv")) \
+        if os.path.isdir(similar_dir) else []
+    for file_name in file_names:
+        path = os.path.join(similar_dir, file_name)
+        rows = list(read_csv_rows(path))
+        cells.append(pool.encode([cell for row in rows for cell in row]))
+        lengths.extend(len(row) for row in rows)
+        tables[file_name] = {"file": file_name, **file_info(path), "start": start, "stop": start + len(rows)}
+        start += len(rows)
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    arrays = {
+        "similar_offsets": offsets,
+        "similar_cells": np.concatenate(cells) if cells else np.empty(0, np.int32),
+    }
+    return tables, arrays
+
+
+def write_atomic(path: str, write) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def build_snapshot(
+    output: str = DATA_SNAPSHOT_DIR,
+    genres_dir: str = GENRE_DATA_DIR,
+    similar_dir: str = SIMILAR_DATA_DIR,
+) -> Dict[str, int]:
+    """Собирает снимок в папку output, возвращает количество строк по таблицам"""
+    os.makedirs(output, exist_ok=True)
+    pool = StringPool()
+    genres, genre_arrays = build_genre_tables(genres_dir, pool)
+    similar, similar_arrays = build_similar_tables(similar_dir, pool)
+    blob, offsets = pool.to_arrays()
+    arrays = {"strings_blob": blob, "strings_offsets": offsets, **genre_arrays, **similar_arrays}
+
+    build = f"{time.time_ns():x}"
+    files = {name: f"{build}.{name}.npy" for name in arrays}
+    for name, array in arrays.items():
+        write_atomic(os.path.join(output, files[name]), lambda f, array=array: np.save(f, array))
+
+    manifest = {
+        "version": SNAPSHOT_FORMAT_VERSION,
+        "build": build,
+        "files": files,
+        "genres": genres,
+        "similar": similar,
+    }
+    write_atomic(
+        os.path.join(output, MANIFEST_NAME),
+        lambda f: f.write(json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8")),
+    )
+
+    # Файлы прошлых сборок больше не нужны новым читателям
+    current = set(files.values())
+    for file_name in os.listdir(output):
+        if file_name.endswith(".npy") and file_name not in current:
+            os.unlink(os.path.join(output, file_name))
+
+    return {
+        "genres": len(genres),
+        "genre_rows": int(genre_arrays["genre_ratings"].shape[0]),
+        "similar_files": len(similar),
+        "similar_rows": int(similar_arrays["similar_offsets"].shape[0] - 1),
+        "strings": int(offsets.shape[0] - 1),
+    }
+
+
+class Snapshot:
+    """Открытый снимок: массивы отображены в память, строки декодируются только по запросу"""
+
+    def __init__(self, path: str, manifest: dict, mtime_ns: int):
+        self.path = path
+        self.manifest = manifest
+        self.mtime_ns = mtime_ns
+        # Все файлы открываются сразу: отображение держит файл, даже когда следующая сборка его удалит.
+        # Страницы при этом не читаются, пока к ним не обратятся
+        self._arrays: Dict[str, np.ndarray] = {
+            name: np.load(os.path.join(path, file_name), mmap_mode="r", allow_pickle=False)
+            for name, file_name in manifest["files"].items()
+        }
+
+    def array(self, name: str) -> np.ndarray:
+        return self._arrays[name]
+
+    def strings_for(self, codes: np.ndarray) -> np.ndarray:
+        """Строки по их кодам (той же формы); декодируется каждый встретившийся код один раз"""
+        blob, offsets = self.array("strings_blob"), self.array("strings_offsets")
+        unique, inverse = np.unique(codes, return_inverse=True)
+        starts, stops = offsets[unique].tolist(), offsets[unique + 1].tolist()
+        values = np.empty(len(unique), dtype=object)
+        values[:] = [blob[start:stop].tobytes().decode("utf-8") for start, stop in zip(starts, stops)]
+        return values[inverse].reshape(np.shape(codes))
+
+    def entry(self, kind: str, name: str, path: str, check_hash: bool = False) -> Optional[dict]:
+        """Запись манифеста для исходного файла, если он не менялся после сборки"""
+        entry = self.manifest[kind].get(name)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size != entry["size"]:
+            return None
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return entry
+        if check_hash:
+            from app.recommender.answer_table import file_sha1
+
+            if file_sha1(path) == entry["sha1"]:
+                return entry
+        return None
+
+    def genre_columns(self, entry: dict) -> Tuple[np.ndarray, ...]:
+        """Строковые колонки жанра в том же виде, что дает build_dataset"""
+        start, stop = entry["start"], entry["stop"]
+        return tuple(self.strings_for(self.array("genre_codes")[:, start:stop]))
+
+    def genre_values(self, entry: dict) -> Tuple[np.ndarray, np.ndarray]:
+        """Средняя оценка и kp_id жанра; kp_id - срез отображенного массива без копии"""
+        start, stop = entry["start"], entry["stop"]
+        # Оценки округлены до 0.1, обратное округление восстанавливает то же значение float64
+        ratings = np.round(self.array("genre_ratings")[start:stop].astype(np.float64), 1)
+        return ratings, self.array("genre_kp_ids")[start:stop]
+
+    def genre_encoded(self, entry: dict) -> EncodedCriteria:
+        """Коды критериев и порядок по оценке из снимка; декодируются только значения словаря"""
+        start, stop = entry["start"], entry["stop"]
+        vocab = self.array("genre_vocab")
+        vocabularies = tuple(
+            {value: code for code, value in enumerate(self.strings_for(vocab[first:last]).tolist())}
+            for first, last in entry["vocab"]
+        )
+        return EncodedCriteria(
+            vocabularies=vocabularies,
+            codes=self.array("genre_criteria")[:, start:stop],
+            rating_order=self.array("genre_rating_order")[start:stop],
+            rating_levels=entry["rating_levels"],
+        )
+
+    def table_rows(self, entry: dict) -> Iterator[List[str]]:
+        """Строки файла похожих фильмов в том виде, в каком их дает csv.reader"""
+        start, stop = entry["start"], entry["stop"]
+        offsets = self.array("similar_offsets")[start:stop + 1].tolist()
+        cells = self.strings_for(self.array("similar_cells")[offsets[0]:offsets[-1]])
+        base = offsets[0]
+        for row_start, row_stop in zip(offsets[:-1], offsets[1:]):
+            yield cells[row_start - base:row_stop - base].tolist()
+
+
+def load_snapshot(path: str = DATA_SNAPSHOT_DIR) -> Optional[Snapshot]:
+    """Открывает снимок или возвращает None, если его нет или формат другой версии"""
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    try:
+        mtime_ns = os.stat(manifest_path).st_mtime_ns
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != SNAPSHOT_FORMAT_VERSION:
+        return None
+    try:
+        return Snapshot(path, manifest, mtime_ns)
+    except (OSError, ValueError):
+        # Манифест прочитан, а его файлы уже удалила следующая сборка
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сборка бинарного снимка файлов жанров и похожих фильмов")
+    parser.add_argument("--output", default=DATA_SNAPSHOT_DIR, help="папка снимка")
+    parser.add_argument("--genres-dir", default=GENRE_DATA_DIR, help="папка с файлами жанров")
+    parser.add_argument("--similar-dir", default=SIMILAR_DATA_DIR, help="папка с файлами похожих фильмов")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = build_snapshot(args.output, args.genres_dir, args.similar_dir)
+    print(
+        f"Готово за {time.perf_counter() - started:.1f} с: жанров {result['genres']} "
+        f"({result['genre_rows']} строк), файлов похожих {result['similar_files']} "
+        f"({result['similar_rows']} строк), строк в словаре {result['strings']} -> {args.output}"
+    )
@@ -0,0 +1,154 @@
+"""
+Подсказки названий для строки поиска в памяти процесса.
+
+Строка поиска запрашивает подсказки на каждое нажатие клавиши, поэтому они не ходят в БД
+и не пишут SearchLog. Ключи - нормализованные названия (нижний регистр, ё -> е, без пунктуации),
+английские названия и латинская транслитерация русских, причем с начала каждого слова:
+"перез" находит "Матрица: Перезагрузка". Ключи лежат в отсортированном списке, совпадения
+с префиксом - непрерывный отрезок, который находится бинарным поиском. Чем больше sum_votes,
+тем выше подсказка. Для префиксов до SHORT_PREFIX символов отрезки длинные (частое начало
+из трех букв - тысячи ключей), поэтому их лучшие фильмы считаются заранее, и на нажатие
+клавиши обходится только короткий отрезок длинного префикса.
+
+Как и карта kp_id, индекс строится одним запросом при первом обращении, дополняется
+при создании фильмов через API и целиком перечитывается раз в SUGGEST_TTL секунд.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import SUGGEST_TTL
+from app.repositories.movies import MovieRepository
+
+SHORT_PREFIX = 3
+# Сколько лучших фильмов хранить для короткого префикса: не меньше максимального limit подсказок
+SHORT_PREFIX_TOP = 20
+
+TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s",
+    "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+})
+
+NON_WORD = re.compile(r"[\W_]+")
+MAX_CHAR = chr(0x10FFFF)
+
+
+class Suggestion(NamedTuple):
+    id: int
+    title: str
+    english_title: Optional[str]
+    year_release: Optional[int]
+    poster_url: Optional[str]
+    sum_votes: Optional[int]
+
+
+def normalize(text: Optional[str]) -> str:
+    return NON_WORD.sub(" ", (text or "").lower().replace("ё", "е")).strip()
+
+
+def transliterate(text: str) -> str:
+    return text.translate(TRANSLIT)
+
+
+def suggest_keys(title: Optional[str], english_title: Optional[str]) -> set:
+    """Ключи фильма: каждое название с начала каждого своего слова"""
+    keys = set()
+    for name in {normalize(title), normalize(english_title), transliterate(normalize(title))}:
+        words = name.split()
+        keys.update(" ".join(words[i:]) for i in range(len(words)))
+    return keys
+
+
+def rank_key(suggestion: Suggestion) -> Tuple[int, int]:
+    """Меньше - выше: голоса по убыванию, затем id"""
+    return -(suggestion.sum_votes or 0), suggestion.id
+
+
+class SuggestIndex:
+    def __init__(self, ttl: int = SUGGEST_TTL):
+        self.ttl = ttl
+        # (ключи по возрастанию, id фильма каждого ключа, фильмы по id, лучшие id коротких префиксов):
+        # заменяются целиком одним присваиванием, чтобы читатель не видел их вперемешку
+        self._index: Tuple[List[str], List[int], Dict[int, Suggestion], Dict[str, List[int]]] = ([], [], {}, {})
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def is_loaded(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return self.ttl <= 0 or time.monotonic() - self._loaded_at < self.ttl
+
+    def load(self, db: Session) -> int:
+        """Перестраивает индекс из БД, возвращает количество фильмов"""
+        movies = {row[0]: Suggestion(*row) for row in MovieRepository(db).get_suggest_rows()}
+        entries = sorted(
+            (key, movie.id) for movie in movies.values() for key in suggest_keys(movie.title, movie.english_title)
+        )
+        keys = [key for key, _ in entries]
+        ids = [movie_id for _, movie_id in entries]
+        short = {}
+        for prefix in {key[:length] for key in keys for length in range(1, SHORT_PREFIX + 1)}:
+            short[prefix] = self._top(keys, ids, movies, prefix, SHORT_PREFIX_TOP)
+        with self._lock:
+            self._index = (keys, ids, movies, short)
+            self._loaded_at = time.monotonic()
+            return len(movies)
+
+    def add(self, movie) -> None:
+        """Добавляет новый фильм в индекс, не перестраивая его"""
+        suggestion = Suggestion(
+            movie.id, movie.title, movie.english_title, movie.year_release, movie.poster_url, movie.sum_votes
+        )
+        new_keys = suggest_keys(movie.title, movie.english_title)
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            # Новые списки, а не вставка в старые: читатели без блокировки видят целый индекс
+            keys, ids, movies, short = self._index
+            keys, ids = list(keys), list(ids)
+            for key in new_keys:
+                position = bisect.bisect_right(keys, key)
+                keys.insert(position, key)
+                ids.insert(position, movie.id)
+            movies = {**movies, movie.id: suggestion}
+            short = dict(short)
+            for prefix in {key[:length] for key in new_keys for length in range(1, SHORT_PREFIX + 1)}:
+                short[prefix] = self._top(keys, ids, movies, prefix, SHORT_PREFIX_TOP)
+            self._index = (keys, ids, movies, short)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._index = ([], [], {}, {})
+            self._loaded_at = None
+
+    @staticmethod
+    def _top(keys: List[str], ids: List[int], movies: Dict[int, Suggestion], prefix: str, limit: int) -> List[int]:
+        # Ключи с префиксом лежат подряд: от самого префикса до префикса с максимальным символом
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + MAX_CHAR, start)
+        found = set(ids[start:end])
+        return [movie.id for movie in heapq.nsmallest(limit, map(movies.__getitem__, found), key=rank_key)]
+
+    def suggest(self, db: Session, q: str, limit: int = 10) -> List[Suggestion]:
+        """До limit фильмов, название которых (или слово в нем) начинается с q"""
+        if not self.is_loaded():
+            self.load(db)
+        prefix = normalize(q)
+        if not prefix:
+            return []
+        keys, ids, movies, short = self._index
+        if len(prefix) <= SHORT_PREFIX and limit <= SHORT_PREFIX_TOP:
+            found = short.get(prefix, [])[:limit]
+        else:
+            found = self._top(keys, ids, movies, prefix, limit)
+        return [movies[movie_id] for movie_id in found]
+
+
+movie_suggest = SuggestIndex()
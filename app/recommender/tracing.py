@@ -0,0 +1,148 @@
+"""
+Трассировка этапов /api/movies/recommend.
+
+На каждый отобранный запрос (доля RECOMMENDER_TRACE_SAMPLE_RATE) заводится Trace,
+в который этапы конвейера добавляют свое время: load - загрузка датасета жанра,
+lookup - таблица готовых ответов, queue - ожидание в пуле, score - маска совпадений,
+sort - выбор топ-N, resolve - kp_id -> фильмы из БД. Итог отдается клиенту
+в заголовке Server-Timing и копится в гистограммах процесса (/api/admin/recommender_stats).
+
+Текущий Trace хранится в contextvars, поэтому этапы не передают его явно; пул рекомендаций
+запускает задачи в копии контекста запроса. Без Trace stage() ничего не замеряет.
+
+Отладочные таблицы recommend_movies печатаются только при RECOMMENDER_TRACE_VERBOSE.
+"""
+import bisect
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.core.config import RECOMMENDER_TRACE_SAMPLE_RATE, RECOMMENDER_TRACE_VERBOSE
+
+# Верхние границы корзин гистограммы, мс
+BUCKETS_MS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+TOTAL_STAGE = "total"
+
+
+def verbose_enabled() -> bool:
+    return RECOMMENDER_TRACE_VERBOSE
+
+
+class Trace:
+    """Время этапов одного запроса; повторный этап с тем же именем суммируется"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.total: Optional[float] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self) -> None:
+        self.total = time.perf_counter() - self.started_at
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing, длительности в миллисекундах"""
+        stages = dict(self.stages)
+        if self.total is not None:
+            stages[TOTAL_STAGE] = self.total
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in stages.items())
+
+
+class StageHistograms:
+    """Гистограммы длительности этапов за время жизни процесса"""
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, trace: Trace) -> None:
+        stages = dict(trace.stages)
+        if trace.total is not None:
+            stages[TOTAL_STAGE] = trace.total
+        with self._lock:
+            for name, seconds in stages.items():
+                ms = seconds * 1000
+                histogram = self._stages.get(name)
+                if histogram is None:
+                    histogram = self._stages[name] = {
+                        "count": 0,
+                        "sum_ms": 0.0,
+                        "counts": [0] * (len(self.buckets_ms) + 1),
+                    }
+                histogram["count"] += 1
+                histogram["sum_ms"] += ms
+                histogram["counts"][bisect.bisect_left(self.buckets_ms, ms)] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Количество, сумма, среднее и накопленные корзины (le) по каждому этапу"""
+        with self._lock:
+            result = {}
+            for name, histogram in self._stages.items():
+                buckets, cumulative = {}, 0
+                for bound, count in zip(self.buckets_ms + (float("inf"),), histogram["counts"]):
+                    cumulative += count
+                    buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+                result[name] = {
+                    "count": histogram["count"],
+                    "sum_ms": round(histogram["sum_ms"], 3),
+                    "mean_ms": round(histogram["sum_ms"] / histogram["count"], 3),
+                    "buckets": buckets,
+                }
+            return result
+
+
+stage_histograms = StageHistograms()
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("recommender_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def record(name: str, seconds: float) -> None:
+    """Добавляет уже измеренное время этапа в текущий Trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started_at)
+
+
+@contextmanager
+def traced(sample_rate: Optional[float] = None) -> Iterator[Optional[Trace]]:
+    """Трассировка запроса, если он попал в выборку; иначе отдает None"""
+    rate = RECOMMENDER_TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        yield None
+        return
+
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+        stage_histograms.observe(trace)
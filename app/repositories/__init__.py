@@ -2,5 +2,6 @@ from app.repositories.movies import MovieRepository
 from app.repositories.reviews import ReviewRepository
 from app.repositories.users import UserRepository
 from app.repositories.lists import ListRepository
+from app.repositories.similarities import SimilarityRepository
 
-__all__ = ["MovieRepository", "ReviewRepository", "UserRepository", "ListRepository"]
+__all__ = ["MovieRepository", "ReviewRepository", "UserRepository", "ListRepository", "SimilarityRepository"]
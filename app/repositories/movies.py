@@ -1,35 +1,225 @@
-from typing import List, Optional
+import time
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple, Union
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, TEXT
+from sqlalchemy import (
+    Integer, String, and_, cast, column, func, literal, literal_column, or_, select, table, text, true, tuple_, union_all
+)
 
-from app.models.movie import Movie
+from app.core.cursor import InvalidCursorError, decode_cursor, encode_cursor
+from app.db.utils import is_postgresql
+from app.models.movie import KEYSET_RATING, KEYSET_YEAR, Movie, normalize_genres
+
+
+class KeysetSort(NamedTuple):
+    """Колонки ключа сортировки (последняя - id), их значения у фильма и типы значений курсора"""
+    columns: tuple
+    values: Callable[[Movie], List[Any]]
+    types: tuple
+    descending: bool
+    # Поля фильма, нужные values: выбираются и при выборке только части колонок
+    fields: tuple
+
+
+# У каждой сортировки свой составной индекс ix_movies_keyset_*, "id" - первичный ключ
+KEYSET_SORTS = {
+    "rating": KeysetSort(
+        (KEYSET_RATING, Movie.sum_votes, Movie.id),
+        lambda movie: [movie.combined_rating if movie.combined_rating is not None else -1, movie.sum_votes, movie.id],
+        (float, int, int),
+        True,
+        ("combined_rating", "sum_votes", "id"),
+    ),
+    "year": KeysetSort(
+        (KEYSET_YEAR, Movie.id),
+        lambda movie: [movie.year_release or 0, movie.id],
+        (int, int),
+        True,
+        ("year_release", "id"),
+    ),
+    "votes": KeysetSort(
+        (Movie.sum_votes, Movie.id), lambda movie: [movie.sum_votes, movie.id], (int, int), True, ("sum_votes", "id"),
+    ),
+    "title": KeysetSort(
+        (Movie.title, Movie.id), lambda movie: [movie.title, movie.id], (str, int), False, ("title", "id"),
+    ),
+    "id": KeysetSort((Movie.id,), lambda movie: [movie.id], (int,), False, ("id",)),
+}
+
+
+def keyset_sort_name(sort_by: Optional[str], order_by_top: bool = False) -> str:
+    """Сортировка курсора для тех же sort_by, что и у постраничного вывода через skip"""
+    if sort_by in ("year", "title", "votes"):
+        return sort_by
+    return "rating" if order_by_top or sort_by else "id"
+
+
+def next_cursor(movies: List[Movie], limit: int, sort_by: Optional[str], order_by_top: bool = False) -> Optional[str]:
+    """Курсор следующей страницы или None, если страница неполная (дальше ничего нет)"""
+    if not movies or len(movies) < limit:
+        return None
+    name = keyset_sort_name(sort_by, order_by_top)
+    return encode_cursor(name, KEYSET_SORTS[name].values(movies[-1]))
+
+
+def apply_keyset(query, cursor: str, sort_by: Optional[str], order_by_top: bool):
+    """Условие "после последней строки прошлой страницы" и порядок по ключу; пустой курсор - первая страница"""
+    name = keyset_sort_name(sort_by, order_by_top)
+    sort = KEYSET_SORTS[name]
+    if cursor:
+        key = decode_cursor(cursor, name, len(sort.columns))
+        try:
+            key = [convert(value) for convert, value in zip(sort.types, key)]
+        except (TypeError, ValueError) as exc:
+            raise InvalidCursorError("Invalid cursor") from exc
+        after = tuple_(*sort.columns) < tuple_(*key) if sort.descending else tuple_(*sort.columns) > tuple_(*key)
+        query = query.filter(after)
+    return query.order_by(*(column.desc() if sort.descending else column.asc() for column in sort.columns))
+
+
+def select_columns(query, columns: Optional[List[str]]):
+    """Только перечисленные колонки Movie: строки Row вместо объектов ORM (без identity map и ленивых полей)"""
+    if columns is None:
+        return query
+    return query.with_entities(*(getattr(Movie, name) for name in columns))
+
+
+def parse_genres(genre: Union[str, List[str], None]) -> List[str]:
+    """Жанры фильтра: одна строка, строка через запятую или список; регистр как при записи"""
+    values = [genre] if isinstance(genre, str) else genre or []
+    return normalize_genres([part for value in values for part in value.split(",")]) or []
+
+
+def genre_filter(db: Session, genres: List[str], mode: str = "and"):
+    """Фильтр по жанрам: and - есть все (@>), or - есть хотя бы один (&&).
+
+    На PostgreSQL оба оператора идут по GIN индексу ix_movies_genres_gin. В тестах на SQLite
+    массив хранится как JSON, там элементы сравниваются через json_each - тоже точно,
+    без совпадения "драма" с "мелодрама".
+    """
+    if is_postgresql(db):
+        return Movie.genres.contains(genres) if mode == "and" else Movie.genres.overlap(genres)
+
+    def has_genre(genre: str):
+        values = func.json_each(func.json_extract(Movie.genres, "$")).table_valued("value")
+        return select(values.c.value).where(values.c.value == genre).exists()
+
+    conditions = [has_genre(genre) for genre in genres]
+    return and_(*conditions) if mode == "and" else or_(*conditions)
+
+
+def trigram_title_filter(q: str):
+    """Условие нечеткого поиска по названиям: word_similarity выше порога pg_trgm, по GIN индексам"""
+    return or_(Movie.title.op("%>")(q), Movie.english_title.op("%>")(q))
+
+
+def title_search_filter(db: Session, q: str, fuzzy: bool = True):
+    """Фильтр строки поиска каталога: подстрока title без учета регистра, как раньше, а при fuzzy
+    на PostgreSQL - еще и нечеткое совпадение. Опечатки находятся, подстроки и короткие запросы
+    не теряются; ILIKE тоже идет по триграммному GIN индексу
+    """
+    condition = Movie.title.ilike(f"%{q}%")
+    if fuzzy and is_postgresql(db):
+        return or_(trigram_title_filter(q), condition)
+    return condition
+
+
+def trigram_title_rank(q: str):
+    """Близость запроса к лучшему из названий: 1 - точное совпадение слова, регистр не важен"""
+    return func.greatest(
+        func.word_similarity(q, Movie.title),
+        func.coalesce(func.word_similarity(q, Movie.english_title), 0),
+    )
+
+
+# tsvector по названиям, описанию, режиссеру и актерам поддерживает триггер (миграция a7d2c5e9f1b8).
+# В модели колонки нет: ORM ее не пишет, а SQLite в тестах о ней не знает
+SEARCH_VECTOR = literal_column("movies.search_vector")
+# Названия и описание разбираются морфологией своего языка, имена - как есть ('simple')
+SEARCH_CONFIGS = ("russian", "english", "simple")
+HEADLINE_OPTIONS = "MaxFragments=2, MaxWords=25, MinWords=10, StartSel=<b>, StopSel=</b>"
+
+
+def fulltext_query(q: str):
+    """Запрос в синтаксисе websearch ("фраза", -слово, or) - совпадение в любой из конфигураций"""
+    queries = [func.websearch_to_tsquery(literal_column(f"'{config}'"), q) for config in SEARCH_CONFIGS]
+    query = queries[0]
+    for other in queries[1:]:
+        query = query.op("||")(other)
+    return query
+
+
+# Материализованное представление с готовым порядком /top (миграция f6a3d8b2c7e4), только на PostgreSQL
+top_ranking = table("movie_top_ranking", column("movie_id"), column("position"))
+# Через сколько секунд заново проверять, есть ли представление: его создает и удаляет миграция
+TOP_RANKING_CHECK_TTL = 300
+# Ключ pg_try_advisory_xact_lock: REFRESH выполняет один воркер, остальные его пропускают
+TOP_RANKING_LOCK_KEY = 720_001
+
+
+def with_headlines(rows: list, columns: Optional[List[str]]) -> list:
+    """Строки (фильм, headline) -> фильмы с атрибутом headline; при выборке колонок это уже поле строки"""
+    if columns is not None:
+        return rows
+    movies = []
+    for movie, headline in rows:
+        movie.headline = headline
+        movies.append(movie)
+    return movies
 
 
 class MovieRepository:
+    # Есть ли movie_top_ranking в БД и когда это проверялось (time.monotonic): общее на процесс
+    _top_ranking_exists: Optional[Tuple[bool, float]] = None
+
     def __init__(self, db: Session):
         self.db = db
 
-    def list_movies(
+    def has_top_ranking(self) -> bool:
+        if not is_postgresql(self.db):
+            return False
+        checked = MovieRepository._top_ranking_exists
+        if checked is None or time.monotonic() - checked[1] >= TOP_RANKING_CHECK_TTL:
+            exists = self.db.execute(text("SELECT to_regclass('movie_top_ranking') IS NOT NULL")).scalar()
+            checked = MovieRepository._top_ranking_exists = (bool(exists), time.monotonic())
+        return checked[0]
+
+    @staticmethod
+    def forget_top_ranking() -> None:
+        """Следующий запрос заново проверит, есть ли представление"""
+        MovieRepository._top_ranking_exists = None
+
+    def refresh_top_ranking(self) -> bool:
+        """Пересчитывает movie_top_ranking, не блокируя чтение.
+
+        False - представления нет или его прямо сейчас пересчитывает другой процесс:
+        блокировка снимается вместе с транзакцией, и воркеры не делают одну работу параллельно.
+        """
+        if not self.has_top_ranking():
+            return False
+        if not self.db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": TOP_RANKING_LOCK_KEY}).scalar():
+            self.db.rollback()
+            return False
+        self.db.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY movie_top_ranking"))
+        self.db.commit()
+        return True
+
+    def catalog_query(
             self,
             *,
-            skip: int = 0,
-            limit: int = 250,
-            genre: Optional[str] = None,
+            genre: Union[str, List[str], None] = None,
+            genre_mode: str = "and",
             year: Optional[int] = None,
             min_rating: Optional[float] = None,
-            order_by_top: bool = False,
-            sort_by: Optional[str] = None,
             search_q: Optional[str] = None,
-    ) -> List[Movie]:
+            fuzzy: bool = True,
+    ):
+        """Фильмы каталога под фильтрами, без сортировки: общая часть list_movies и get_facets"""
         query = self.db.query(Movie)
 
-        if genre:
-            if hasattr(Movie, "genres"):
-                query = query.filter(
-                    func.lower(cast(Movie.genres, TEXT)).like(f"%{genre.lower()}%")
-                )
-            else:
-                query = query.filter(Movie.genre.ilike(f"%{genre}%"))
+        genres = parse_genres(genre)
+        if genres:
+            query = query.filter(genre_filter(self.db, genres, genre_mode))
         if year:
             query = query.filter(
                 Movie.year_release == year if hasattr(Movie, "year_release") else Movie.year == year
@@ -39,9 +229,107 @@ class MovieRepository:
             if rating_column is not None:
                 query = query.filter(rating_column >= min_rating)
         if search_q:
-            query = query.filter(Movie.title.ilike(f"%{search_q}%"))
+            query = query.filter(title_search_filter(self.db, search_q, fuzzy))
+
+        return query.filter(Movie.sum_votes >= 50_000)
+
+    def get_facets(
+            self,
+            *,
+            genre: Union[str, List[str], None] = None,
+            genre_mode: str = "and",
+            year: Optional[int] = None,
+            min_rating: Optional[float] = None,
+            search_q: Optional[str] = None,
+            fuzzy: bool = True,
+    ) -> List[tuple]:
+        """(фасет, значение, количество фильмов) для жанров, стран, годов и рейтинга под фильтрами.
 
-        query = query.filter(Movie.sum_votes >= 50_000)
+        Один запрос: отфильтрованные фильмы - CTE, который PostgreSQL читает один раз,
+        а счетчики каждого фасета - GROUP BY по нему (по элементам массивов через unnest),
+        склеенные UNION ALL. Значения - строки, рейтинг - целая часть combined_rating.
+        """
+        filtered = self.catalog_query(
+            genre=genre, genre_mode=genre_mode, year=year, min_rating=min_rating, search_q=search_q, fuzzy=fuzzy
+        ).with_entities(Movie.genres, Movie.countries, Movie.year_release, Movie.combined_rating).cte("filtered")
+
+        def counts(facet: str, values):
+            value = values.c.value
+            return (
+                select(literal(facet).label("facet"), cast(value, String).label("value"), func.count().label("count"))
+                .where(value.isnot(None))
+                .group_by(value)
+            )
+
+        def elements(column):
+            if is_postgresql(self.db):
+                return select(func.unnest(column).label("value")).subquery()
+            # SQLite в тестах: массив хранится как JSON
+            values = func.json_each(func.json_extract(column, "$")).table_valued("value")
+            return select(values.c.value.label("value")).select_from(filtered).join(values, true()).subquery()
+
+        rating = filtered.c.combined_rating
+        # Целая часть: CAST в PostgreSQL округляет, в SQLite отбрасывает дробную часть
+        rating_bucket = cast(func.floor(rating), Integer) if is_postgresql(self.db) else cast(rating, Integer)
+        facets = union_all(
+            counts("genres", elements(filtered.c.genres)),
+            counts("countries", elements(filtered.c.countries)),
+            counts("years", select(filtered.c.year_release.label("value")).subquery()),
+            counts("ratings", select(rating_bucket.label("value")).subquery()),
+        )
+        return self.db.execute(facets).all()
+
+    def list_movies(
+            self,
+            *,
+            skip: int = 0,
+            limit: int = 250,
+            genre: Union[str, List[str], None] = None,
+            genre_mode: str = "and",
+            year: Optional[int] = None,
+            min_rating: Optional[float] = None,
+            order_by_top: bool = False,
+            sort_by: Optional[str] = None,
+            search_q: Optional[str] = None,
+            fuzzy: bool = True,
+            cursor: Optional[str] = None,
+            columns: Optional[List[str]] = None,
+    ) -> List[Movie]:
+        """Фильмы каталога.
+
+        cursor - постраничный вывод по ключу вместо skip: пустая строка - первая страница,
+        дальше - курсор из next_cursor. Глубокие страницы стоят столько же, сколько первая,
+        и вставки между запросами не дают повторов и пропусков.
+        columns - выбрать только эти поля (строки Row вместо Movie) для карточек и fields=.
+        fuzzy=False - поиск search_q только по подстроке, без нечетких совпадений pg_trgm.
+
+        Raises:
+            InvalidCursorError: курсор поврежден или выдан для другой сортировки
+        """
+        query = self.catalog_query(
+            genre=genre, genre_mode=genre_mode, year=year, min_rating=min_rating, search_q=search_q, fuzzy=fuzzy
+        )
+
+        if cursor is not None:
+            if columns is not None:
+                # Курсор следующей страницы строится по полям ключа последней строки
+                sort = KEYSET_SORTS[keyset_sort_name(sort_by, order_by_top)]
+                columns = list(dict.fromkeys([*columns, *sort.fields]))
+            query = apply_keyset(query, cursor, sort_by, order_by_top)
+            return select_columns(query, columns).limit(limit).all()
+
+        # Представление отстает от таблицы до следующего пересчета, поэтому оно только для
+        # самой частой страницы - /top без фильтров. Остальное сортируется по таблице (и индексу)
+        unfiltered = not (parse_genres(genre) or year or min_rating or search_q)
+        if order_by_top and sort_by in (None, "rating") and unfiltered and self.has_top_ranking():
+            ranked = query.join(top_ranking, top_ranking.c.movie_id == Movie.id).order_by(top_ranking.c.position)
+            try:
+                return select_columns(ranked, columns).offset(skip).limit(limit).all()
+            except DBAPIError as e:
+                # Представление удалили (откат миграции): до следующей проверки - сортировка таблицы
+                print(f"movie_top_ranking недоступно: {e}")
+                self.db.rollback()
+                MovieRepository.forget_top_ranking()
 
         if order_by_top or sort_by:
             combined = getattr(Movie, "combined_rating", getattr(Movie, "rating", None))
@@ -58,17 +346,68 @@ class MovieRepository:
             else:
                 if combined is not None:
                     query = query.order_by(combined.desc(), sum_votes.desc() if sum_votes is not None else None)
+        elif search_q and fuzzy and is_postgresql(self.db):
+            query = query.order_by(trigram_title_rank(search_q).desc(), Movie.id)
 
-        return query.offset(skip).limit(limit).all()
+        return select_columns(query, columns).offset(skip).limit(limit).all()
 
-    def search_movies(self, *, q: str, skip: int = 0, limit: int = 50) -> List[Movie]:
-        return (
-            self.db.query(Movie)
-            .filter(Movie.title.contains(q))
+    def search_movies(
+        self, *, q: str, skip: int = 0, limit: int = 50, fuzzy: bool = True, columns: Optional[List[str]] = None
+    ) -> List[Movie]:
+        """Поиск по названию.
+
+        На PostgreSQL при fuzzy - тот же фильтр, что у q каталога: pg_trgm или подстрока без учета
+        регистра, лучшие совпадения первыми. Опечатки не мешают, а короткие куски слов ("три" в
+        "Матрица") по-прежнему находятся. Иначе (и на SQLite в тестах) - подстрока в title, как раньше.
+        """
+        query = self.db.query(Movie)
+        if fuzzy and is_postgresql(self.db):
+            query = query.filter(title_search_filter(self.db, q)).order_by(
+                trigram_title_rank(q).desc(), Movie.sum_votes.desc().nulls_last(), Movie.id
+            )
+        else:
+            query = query.filter(Movie.title.contains(q))
+        return select_columns(query, columns).offset(skip).limit(limit).all()
+
+    def fulltext_search_movies(
+        self, *, q: str, skip: int = 0, limit: int = 50, columns: Optional[List[str]] = None
+    ) -> List[Movie]:
+        """Полнотекстовый поиск по названиям, описанию, режиссеру и актерам.
+
+        На PostgreSQL - search_vector @@ запрос по GIN индексу, порядок по ts_rank, у каждого
+        фильма в headline фрагменты описания с подсвеченными словами. ts_headline читает текст
+        описания целиком, поэтому считается только для строк уже выбранной страницы.
+        На SQLite - подстрока в тех же текстовых полях, headline пустой.
+        """
+        if not is_postgresql(self.db):
+            query = self.db.query(Movie).filter(or_(
+                Movie.title.contains(q), Movie.english_title.contains(q),
+                Movie.description.contains(q), Movie.director.contains(q),
+            )).order_by(Movie.sum_votes.desc(), Movie.id)
+            query = select_columns(query, columns).add_columns(literal_column("NULL").label("headline"))
+            return with_headlines(query.offset(skip).limit(limit).all(), columns)
+
+        tsquery = fulltext_query(q)
+        rank = func.ts_rank(SEARCH_VECTOR, tsquery)
+        page = (
+            self.db.query(Movie.id, rank.label("rank"))
+            .filter(SEARCH_VECTOR.op("@@")(tsquery))
+            .order_by(rank.desc(), Movie.sum_votes.desc().nulls_last(), Movie.id)
             .offset(skip)
             .limit(limit)
-            .all()
+            .subquery()
         )
+        headline = func.ts_headline(
+            literal_column("'russian'"), func.coalesce(Movie.description, Movie.title), tsquery,
+            HEADLINE_OPTIONS,
+        )
+        query = (
+            select_columns(self.db.query(Movie), columns)
+            .add_columns(headline.label("headline"))
+            .join(page, page.c.id == Movie.id)
+            .order_by(page.c.rank.desc(), Movie.sum_votes.desc().nulls_last(), Movie.id)
+        )
+        return with_headlines(query.all(), columns)
 
     def get_movie(self, movie_id: int) -> Optional[Movie]:
         return self.db.query(Movie).filter(Movie.id == movie_id).first()
@@ -82,30 +421,64 @@ class MovieRepository:
     def get_by_kp_id(self, kp_id: int) -> Optional[Movie]:
         return self.db.query(Movie).filter(Movie.kp_id == kp_id).first()
 
-    def get_similar_movies(self, movie: Movie, limit: int = 10) -> List[Movie]:
+    def get_movies_by_ids(self, ids: List[int]) -> List[Movie]:
+        """Фильмы по списку id одним запросом по первичному ключу, в порядке входного списка"""
+        if not ids:
+            return []
+        movies = self.db.query(Movie).filter(Movie.id.in_(ids)).all()
+        id_to_movie = {m.id: m for m in movies}
+        return [id_to_movie[movie_id] for movie_id in ids if movie_id in id_to_movie]
+
+    def get_kp_id_pairs(self) -> List[tuple]:
+        """Пары (kp_id, id) для всех фильмов"""
+        return self.db.query(Movie.kp_id, Movie.id).all()
+
+    def get_rating_rows(self) -> List[tuple]:
+        """(id, genres, combined_rating, sum_votes) для всех фильмов"""
+        return self.db.query(Movie.id, Movie.genres, Movie.combined_rating, Movie.sum_votes).all()
+
+    def get_suggest_rows(self) -> List[tuple]:
+        """(id, title, english_title, year_release, poster_url, sum_votes) для всех фильмов"""
+        return self.db.query(
+            Movie.id, Movie.title, Movie.english_title, Movie.year_release, Movie.poster_url, Movie.sum_votes
+        ).all()
+
+    def get_content_features(self) -> List[tuple]:
+        """(id, genres, countries, persons, director, year_release) для всех фильмов по id"""
+        return (
+            self.db.query(
+                Movie.id, Movie.genres, Movie.countries, Movie.persons, Movie.director, Movie.year_release
+            )
+            .order_by(Movie.id)
+            .all()
+        )
+
+    def get_similar_by_edges(self, movie_id: int, limit: int = 10) -> List[Movie]:
+        """Похожие из movie_similarities одним запросом по индексу (movie_id, rank)"""
         from app.models.movie import movie_similarities
-        
-        similar_ids = (
-            self.db.query(movie_similarities.c.similar_movie_id)
-            .filter(movie_similarities.c.movie_id == movie.id)
+
+        # Связи без rank (загружены до его появления) идут в конце
+        return (
+            self.db.query(Movie)
+            .join(movie_similarities, movie_similarities.c.similar_movie_id == Movie.id)
+            .filter(movie_similarities.c.movie_id == movie_id)
+            .order_by(movie_similarities.c.rank.asc().nulls_last(), movie_similarities.c.similar_movie_id)
             .limit(limit)
             .all()
         )
-        
-        if similar_ids:
-            ids = [row[0] for row in similar_ids]
-            similar_movies = (
-                self.db.query(Movie)
-                .filter(Movie.id.in_(ids))
-                .all()
-            )
-            id_to_movie = {m.id: m for m in similar_movies}
-            return [id_to_movie[id] for id in ids if id in id_to_movie]
-        
+
+    def get_similar_movies(self, movie: Movie, limit: int = 10) -> List[Movie]:
+        similar_movies = self.get_similar_by_edges(movie.id, limit=limit)
+        if similar_movies:
+            return similar_movies
+        return self.get_genre_fallback(movie, limit=limit)
+
+    def get_genre_fallback(self, movie: Movie, limit: int = 10) -> List[Movie]:
+        """Лучшие фильмы первого жанра фильма (или всего каталога) без него самого - когда связей нет"""
         if movie.genres:
             first_genre = movie.genres[0] if isinstance(movie.genres, list) else str(movie.genres).split(",")[0].strip()
             query = self.db.query(Movie).filter(
-                Movie.genres.contains([first_genre]) if hasattr(Movie, "genres") else Movie.genre.contains(first_genre),
+                genre_filter(self.db, parse_genres(first_genre)),
                 Movie.id != movie.id,
             )
         else:
@@ -0,0 +1,111 @@
+import io
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.db.utils import is_postgresql
+from app.models.movie import movie_similarities
+
+# (movie_id, similar_movie_id, rank, score); rank и score можно не указывать
+SimilarityEdge = Tuple[int, int, Optional[int], Optional[float]]
+COLUMNS = ("movie_id", "similar_movie_id", "rank", "score")
+
+# Строк в одном INSERT ... ON CONFLICT DO NOTHING
+INSERT_BATCH_SIZE = 5000
+STAGE_TABLE = "movie_similarities_stage"
+
+
+def unique_edges(edges: Iterable[Sequence]) -> List[SimilarityEdge]:
+    """Убирает повторы пары (movie_id, similar_movie_id): остается первое появление с его rank и score"""
+    unique = {}
+    for movie_id, similar_id, *rest in edges:
+        rank, score = (list(rest) + [None, None])[:2]
+        unique.setdefault((int(movie_id), int(similar_id)), (rank, score))
+    return [(movie_id, similar_id, rank, score) for (movie_id, similar_id), (rank, score) in unique.items()]
+
+
+def copy_value(value) -> str:
+    return "\\N" if value is None else str(value)
+
+
+class SimilarityRepository:
+    """Массовая запись связей movie_similarities: повторный запуск не создает дублей"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def count(self) -> int:
+        return self.db.execute(select(func.count()).select_from(movie_similarities)).scalar_one()
+
+    def movie_ids_with_edges(self) -> Set[int]:
+        return set(self.db.execute(select(movie_similarities.c.movie_id).distinct()).scalars())
+
+    def _copy_edges(self, edges: List[SimilarityEdge]) -> int:
+        """PostgreSQL: COPY во временную таблицу и один INSERT ... SELECT ... ON CONFLICT DO NOTHING"""
+        columns = ", ".join(COLUMNS)
+        self.db.execute(text(
+            f"CREATE TEMP TABLE {STAGE_TABLE} "
+            f"(movie_id integer, similar_movie_id integer, rank integer, score double precision) ON COMMIT DROP"
+        ))
+        buffer = io.StringIO("".join("\t".join(map(copy_value, edge)) + "\n" for edge in edges))
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {STAGE_TABLE} ({columns}) FROM STDIN", buffer)
+        finally:
+            cursor.close()
+        return self.db.execute(text(
+            f"INSERT INTO movie_similarities ({columns}) "
+            f"SELECT {columns} FROM {STAGE_TABLE} "
+            f"ON CONFLICT DO NOTHING"
+        )).rowcount
+
+    def _insert_batches(self, edges: List[SimilarityEdge], batch_size: int) -> int:
+        insert = pg_insert if is_postgresql(self.db) else sqlite_insert
+        added = 0
+        for start in range(0, len(edges), batch_size):
+            batch = edges[start:start + batch_size]
+            # Пропущенные ON CONFLICT DO NOTHING строки в rowcount не входят
+            added += self.db.execute(
+                insert(movie_similarities).on_conflict_do_nothing(),
+                [dict(zip(COLUMNS, edge)) for edge in batch],
+            ).rowcount
+        return added
+
+    def _write(self, edges: List[SimilarityEdge], batch_size: int) -> int:
+        """Записывает связи, возвращает количество реально вставленных строк"""
+        if not edges:
+            return 0
+        if is_postgresql(self.db):
+            return self._copy_edges(edges)
+        return self._insert_batches(edges, batch_size)
+
+    def insert_edges(self, edges: Iterable[Sequence], batch_size: int = INSERT_BATCH_SIZE) -> int:
+        """Добавляет связи, которых еще нет; возвращает количество добавленных.
+
+        rank и score уже существующих связей не меняются - для этого есть replace_edges.
+        """
+        edges = unique_edges(edges)
+        try:
+            # Количество - из самой вставки: пересчет всей таблицы до и после стоил бы два полных прохода
+            added = self._write(edges, batch_size)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return added
+
+    def replace_edges(self, edges: Iterable[Sequence], batch_size: int = INSERT_BATCH_SIZE) -> int:
+        """Заменяет весь набор связей одной транзакцией; читатели видят либо старый, либо новый набор"""
+        edges = unique_edges(edges)
+        try:
+            self.db.execute(movie_similarities.delete())
+            # Таблица пуста, поэтому вставленные строки - это весь новый набор
+            total = self._write(edges, batch_size)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return total
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import date
-from typing import Optional
+from typing import Annotated, Any, Dict, List, Optional, Union
 
 
 class MovieBase(BaseModel):
@@ -48,6 +48,66 @@ class MovieResponse(MovieBase):
         from_attributes = True
 
 
+class MovieSearchResult(MovieResponse):
+    # Фрагменты описания с подсвеченными словами запроса (полнотекстовый поиск)
+    headline: Optional[str] = None
+
+
+class MovieCard(BaseModel):
+    """Карточка фильма в сетке каталога: только то, что на ней показывается"""
+    id: int
+    kp_id: int
+    title: str
+    english_title: Optional[str] = None
+    poster_url: Optional[str] = None
+    year_release: Optional[int] = None
+    genres: Optional[list[str]] = None
+    combined_rating: Optional[float] = 0.0
+    kp_rating: Optional[float] = 0.0
+    imdb_rating: Optional[float] = 0.0
+
+    class Config:
+        from_attributes = True
+
+
+# Фильм при fields=: только запрошенные поля MovieResponse и всегда id
+MovieFields = Annotated[
+    Dict[str, Any], Field(description="только поля MovieResponse из параметра fields и id")
+]
+
+# Ответ списков фильмов по view и fields. Полный ответ проверяется как MovieResponse:
+# варианты перебираются по порядку, а не подбираются по форме объекта
+MovieList = Annotated[
+    Union[List[MovieResponse], List[MovieCard], List[MovieFields]], Field(union_mode="left_to_right")
+]
+MovieSearchList = Annotated[
+    Union[List[MovieSearchResult], List[MovieCard], List[MovieFields]], Field(union_mode="left_to_right")
+]
+
+
+class MovieSuggestion(BaseModel):
+    """Подсказка в строке поиска"""
+    id: int
+    title: str
+    english_title: Optional[str] = None
+    year_release: Optional[int] = None
+    poster_url: Optional[str] = None
+
+
+class FacetCount(BaseModel):
+    value: int | str
+    count: int
+
+
+class MovieFacets(BaseModel):
+    """Счетчики для панели фильтров каталога под текущим фильтром"""
+    genres: list[FacetCount]
+    countries: list[FacetCount]
+    years: list[FacetCount]
+    # Сколько фильмов с рейтингом не ниже value - как фильтр min_rating
+    ratings: list[FacetCount]
+
+
 class MovieSearchFilters(BaseModel):
     query: Optional[str] = None
     genre: Optional[str] = None
@@ -7,6 +7,9 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 from environs import Env
 
+from app.recommender.cache import recommendation_cache
+from app.recommender.executor import recommender_executor
+from app.recommender.tracing import stage_histograms
 from app.repositories.admin_stats import AdminStatsRepository
 
 env = Env()
@@ -188,6 +191,15 @@ class AdminStatsService:
             ]
         }
 
+    # --- RECOMMENDER ---
+
+    def get_recommender_stats(self) -> Dict[str, Any]:
+        return {
+            "cache": recommendation_cache.stats(),
+            "executor": recommender_executor.stats(),
+            "stages": stage_histograms.stats(),
+        }
+
     # --- COMPOSITE REPORTS ---
 
     async def get_full_report(self) -> Dict[str, Any]:
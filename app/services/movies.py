@@ -1,14 +1,73 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, TEXT
-from app.basic_algorithm import recommend_movies
+from sqlalchemy import insert, literal, select, Integer
+from app.basic_algorithm import recommend_kp_ids
+from app.recommender.answer_table import answer_table
+from app.core.cache import LRUCache
+from app.core.config import CONTENT_SIMILAR_ON_CREATE, FACETS_CACHE_SIZE, FACETS_CACHE_TTL
+from app.recommender.cache import cache_key, recommendation_cache
+from app.recommender.content import content_index
+from app.recommender.executor import recommender_executor
+from app.recommender.leaderboards import genre_leaderboards
+from app.recommender.movie_ids import kp_id_map
+from app.recommender.suggest import Suggestion, movie_suggest
+from app.recommender.registry import genre_registry
+from app.recommender.tracing import stage
 from app.models.movie import Movie
 from app.models.analytics import MovieViewLog, SearchLog
-from app.repositories.movies import MovieRepository
-from app.schemas.movie import MovieCreate
+from app.repositories.movies import MovieRepository, next_cursor, parse_genres
+from app.schemas.movie import MovieCreate, MovieResponse
+from app.services.top_ranking import top_ranking_refresher
 from app.models.user import User
 
+# Счетчики панели фильтров по нормализованной подписи фильтра; короткий TTL вместо точной инвалидации
+facets_cache = LRUCache(maxsize=FACETS_CACHE_SIZE, ttl=FACETS_CACHE_TTL)
+
+
+def facets_key(
+    genre: Optional[List[str]],
+    genre_mode: str,
+    year: Optional[int],
+    min_rating: Optional[float],
+    q: Optional[str],
+    fuzzy: bool = True,
+) -> tuple:
+    """Одинаковые по смыслу фильтры дают один ключ: порядок и регистр жанров, пустые значения"""
+    genres = tuple(sorted(parse_genres(genre)))
+    # С одним жанром and и or фильтруют одинаково
+    mode = genre_mode if len(genres) > 1 else "and"
+    q = (q or "").strip().lower() or None
+    # Без строки поиска fuzzy ни на что не влияет
+    return genres, mode, year or None, min_rating or None, q, fuzzy if q else True
+
+
+def facets_from_rows(rows: List[tuple]) -> Dict[str, List[dict]]:
+    counts: Dict[str, Dict[str, int]] = {"genres": {}, "countries": {}, "years": {}, "ratings": {}}
+    for facet, value, count in rows:
+        counts[facet][value] = count
+
+    def by_count(values: Dict[str, int]) -> List[dict]:
+        return [
+            {"value": value, "count": count}
+            for value, count in sorted(values.items(), key=lambda item: (-item[1], item[0]))
+        ]
+
+    # Рейтинг - накопительно сверху вниз: "8" - все фильмы с рейтингом от 8
+    ratings, total = [], 0
+    for bucket in sorted((int(value) for value in counts["ratings"]), reverse=True):
+        total += counts["ratings"][str(bucket)]
+        ratings.append({"value": bucket, "count": total})
+    return {
+        "genres": by_count(counts["genres"]),
+        "countries": by_count(counts["countries"]),
+        "years": [
+            {"value": int(value), "count": count}
+            for value, count in sorted(counts["years"].items(), key=lambda item: -int(item[0]))
+        ],
+        "ratings": ratings,
+    }
+
 
 class MovieService:
     def __init__(self, db: Session):
@@ -20,21 +79,29 @@ class MovieService:
         *,
         skip: int = 0,
         limit: int = 250,
-        genre: Optional[str] = None,
+        genre: Optional[List[str]] = None,
+        genre_mode: str = "and",
         year: Optional[int] = None,
         min_rating: Optional[float] = None,
         sort_by: Optional[str] = None,
         q: Optional[str] = None,
+        fuzzy: bool = True,
+        cursor: Optional[str] = None,
+        columns: Optional[List[str]] = None,
         current_user: User | None = None,
     ) -> List[Movie]:
         movies = self.movie_repo.list_movies(
             skip=skip,
             limit=limit,
             genre=genre,
+            genre_mode=genre_mode,
             year=year,
             min_rating=min_rating,
             sort_by=sort_by,
             search_q=q,
+            fuzzy=fuzzy,
+            cursor=cursor,
+            columns=columns,
         )
         if q is not None:
             try:
@@ -56,23 +123,30 @@ class MovieService:
         *,
         skip: int = 0,
         limit: int = 250,
-        genre: Optional[str] = None,
+        genre: Optional[List[str]] = None,
+        genre_mode: str = "and",
         year: Optional[int] = None,
         min_rating: Optional[float] = None,
         sort_by: Optional[str] = None,
         q: Optional[str] = None,
+        fuzzy: bool = True,
+        cursor: Optional[str] = None,
+        columns: Optional[List[str]] = None,
         current_user: User | None = None
     ) -> List[Movie]:
         movies = self.movie_repo.list_movies(
             skip=skip,
             limit=limit,
             genre=genre,
+            genre_mode=genre_mode,
             year=year,
             min_rating=min_rating,
             order_by_top=True,
             sort_by=sort_by,
             search_q=q,
-
+            fuzzy=fuzzy,
+            cursor=cursor,
+            columns=columns,
         )
         if q is not None:
             # Логируем поиск
@@ -90,15 +164,27 @@ class MovieService:
                 self.db.rollback()
         return movies
 
+    def next_cursor(
+        self, movies: List[Movie], *, limit: int, sort_by: Optional[str] = None, top: bool = False
+    ) -> Optional[str]:
+        """Курсор следующей страницы для get_movies (top=False) или get_top_movies (top=True)"""
+        return next_cursor(movies, limit, sort_by, order_by_top=top)
+
     def search(
         self,
         *,
         q: str,
         skip: int = 0,
         limit: int = 50,
+        fuzzy: bool = True,
+        mode: str = "title",
+        columns: Optional[List[str]] = None,
         current_user: User | None = None,
     ) -> List[Movie]:
-        movies = self.movie_repo.search_movies(q=q, skip=skip, limit=limit)
+        if mode == "fulltext":
+            movies = self.movie_repo.fulltext_search_movies(q=q, skip=skip, limit=limit, columns=columns)
+        else:
+            movies = self.movie_repo.search_movies(q=q, skip=skip, limit=limit, fuzzy=fuzzy, columns=columns)
 
         # Логируем поиск
         try:
@@ -115,6 +201,31 @@ class MovieService:
 
         return movies
 
+    def get_facets(
+        self,
+        *,
+        genre: Optional[List[str]] = None,
+        genre_mode: str = "and",
+        year: Optional[int] = None,
+        min_rating: Optional[float] = None,
+        q: Optional[str] = None,
+        fuzzy: bool = True,
+    ) -> Dict[str, List[dict]]:
+        key = facets_key(genre, genre_mode, year, min_rating, q, fuzzy)
+        cached = facets_cache.get(key)
+        if cached is not None:
+            return cached
+        rows = self.movie_repo.get_facets(
+            genre=genre, genre_mode=genre_mode, year=year, min_rating=min_rating, search_q=q, fuzzy=fuzzy
+        )
+        facets = facets_from_rows(rows)
+        facets_cache.set(key, facets)
+        return facets
+
+    def suggest(self, q: str, limit: int = 10) -> List[Suggestion]:
+        # Без SearchLog: подсказки запрашиваются на каждое нажатие клавиши
+        return movie_suggest.suggest(self.db, q, limit)
+
     def get_movie(
         self,
         movie_id: int,
@@ -133,18 +244,67 @@ class MovieService:
                 self.db.rollback()
         return movie
 
+    def get_movies_batch(
+        self,
+        ids: List[int],
+        *,
+        log_views: bool = False,
+        current_user: User | None = None,
+    ) -> List[Movie]:
+        """Фильмы по списку id в том же порядке; просмотры пишутся, только если попросили"""
+        if log_views and ids:
+            # Одна вставка на все найденные фильмы и до их выборки: commit после нее
+            # сбросил бы загруженные объекты, и каждый перечитывался бы отдельным запросом
+            user_id = current_user.id if current_user else None
+            try:
+                self.db.execute(
+                    insert(MovieViewLog).from_select(
+                        ["movie_id", "user_id"],
+                        select(Movie.id, literal(user_id, Integer)).where(Movie.id.in_(ids)),
+                    )
+                )
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+        return self.movie_repo.get_movies_by_ids(ids)
+
     def create_movie(self, movie_in: MovieCreate) -> Movie:
         existing = self.movie_repo.get_by_kp_id(movie_in.kp_id)
         if existing:
             raise ValueError("Movie with this Kinopoisk ID already exists")
         db_movie = Movie(**movie_in.model_dump())
-        return self.movie_repo.create_movie(db_movie)
+        movie = self.movie_repo.create_movie(db_movie)
+        kp_id_map.add(movie.kp_id, movie.id)
+        genre_leaderboards.add(movie)
+        movie_suggest.add(movie)
+        # Новый фильм может попасть в рекомендации и счетчики фильтров, которые уже лежат в кэше
+        recommendation_cache.clear()
+        facets_cache.clear()
+        # Готовый порядок /top пересчитывается в фоне, запрос создания его не ждет
+        top_ranking_refresher.request()
+        if CONTENT_SIMILAR_ON_CREATE:
+            # Похожие по содержанию сразу, не дожидаясь пересборки всего каталога
+            try:
+                content_index.add_movie(self.db, movie)
+            except Exception as e:
+                print(f"Content similarity error: {e}")
+                self.db.rollback()
+        return movie
 
     def get_similar(self, movie_id: int, limit: int = 10) -> List[Movie]:
         movie = self.movie_repo.get_movie(movie_id)
         if not movie:
             return []
-        return self.movie_repo.get_similar_movies(movie, limit=limit)
+        similar = self.movie_repo.get_similar_by_edges(movie.id, limit=limit)
+        if similar:
+            return similar
+        # Связей нет: лучшие фильмы первого жанра из таблиц в памяти, без сортировки всей таблицы
+        first_genre = movie.genres[0] if movie.genres else None
+        ids = genre_leaderboards.top(self.db, first_genre, limit, exclude_id=movie.id)
+        if ids is None:
+            # Связей уже нет - только запрос по жанру, без повторного запроса связей
+            return self.movie_repo.get_genre_fallback(movie, limit=limit)
+        return self.movie_repo.get_movies_by_ids(ids)
 
     def recommend_movies(
         self,
@@ -154,7 +314,7 @@ class MovieService:
         subgenre_detail: str,
         time_period: str,
         limit: int = 20,
-    ) -> List[Movie]:
+    ) -> List[MovieResponse]:
         """
         Рекомендует фильмы на основе ответов пользователя из бота вопрос-ответ.
         
@@ -167,16 +327,32 @@ class MovieService:
         
         Returns:
             Список рекомендованных фильмов
+
+        Raises:
+            RecommenderBusyError: пул живого подсчета рекомендаций заполнен
         """
-        print([main_genre, subgenre, subgenre_detail, time_period])
-        movies = recommend_movies([main_genre, subgenre, subgenre_detail, time_period])
-        list_movies = self.db.query(Movie).filter(
-            Movie.title.in_(movies)
-        ).all()
-        order_map = {title: index for index, title in enumerate(movies)}
-
-        # Сортируем список в Python, используя индекс из order_map
-        list_movies.sort(key=lambda movie: order_map.get(movie.title, float('inf')))
-        print(movies)
-        print(list_movies)
-        return list_movies[:limit]
+        # Готовый ответ из кэша, если датасет жанра не менялся с момента расчета
+        key = cache_key(main_genre, subgenre, subgenre_detail, time_period, limit)
+        main_genre, subgenre, subgenre_detail, time_period, limit = key
+        with stage("load"):
+            version = genre_registry.version(main_genre)
+        with stage("cache"):
+            cached = recommendation_cache.get(key, version)
+        if cached is not None:
+            return cached
+
+        user_input = [main_genre, subgenre, subgenre_detail, time_period]
+        # Сначала ищем готовый ответ в предрассчитанной таблице, иначе считаем на лету
+        with stage("lookup"):
+            kp_ids = answer_table.lookup(main_genre, subgenre, subgenre_detail, time_period)
+        if kp_ids is None:
+            # Живой подсчет нагружает CPU, поэтому идет в отдельном ограниченном пуле
+            kp_ids = recommender_executor.run(recommend_kp_ids, user_input)
+
+        # kp_id -> Movie.id из памяти и один запрос по первичному ключу с сохранением порядка
+        with stage("resolve"):
+            movie_ids = kp_id_map.resolve(self.db, kp_ids)
+            movies = self.movie_repo.get_movies_by_ids(movie_ids[:limit])
+            result = [MovieResponse.model_validate(movie) for movie in movies]
+        recommendation_cache.set(key, result, version)
+        return result
@@ -0,0 +1,79 @@
+"""
+Обновление материализованного представления movie_top_ranking.
+
+Порядок /api/movies/top без фильтров хранится готовым и пересчитывается
+REFRESH MATERIALIZED VIEW CONCURRENTLY (чтение в это время не блокируется):
+фоновым потоком раз в TOP_RANKING_REFRESH_INTERVAL секунд, вне очереди после создания
+фильма через API и в конце импорта, а также вручную:
+
+    python -m app.services.top_ranking
+
+Поток есть в каждом воркере, но пересчет под pg_try_advisory_xact_lock: пока один
+воркер обновляет представление, остальные свой раз пропускают.
+"""
+import threading
+import time
+from typing import Optional
+
+from app.core.config import TOP_RANKING_REFRESH_INTERVAL
+from app.db.session import SessionLocal
+from app.repositories.movies import MovieRepository
+
+
+def refresh_top_ranking() -> bool:
+    with SessionLocal() as db:
+        return MovieRepository(db).refresh_top_ranking()
+
+
+class TopRankingRefresher:
+    """Фоновый поток, который пересчитывает рейтинг по расписанию и по запросу; interval <= 0 - только по запросу"""
+
+    def __init__(self, interval: int = TOP_RANKING_REFRESH_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            # Несколько запросов за время ожидания или пересчета дают один пересчет
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                refresh_top_ranking()
+            except Exception as e:
+                print(f"Не удалось обновить movie_top_ranking: {e}")
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="top-ranking-refresh", daemon=True)
+        self._thread.start()
+
+    def request(self) -> None:
+        """Пересчитать вне расписания, не дожидаясь его в потоке запроса"""
+        self._wake.set()
+
+    def stop(self) -> None:
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join()
+
+
+top_ranking_refresher = TopRankingRefresher()
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    if refresh_top_ranking():
+        print(f"movie_top_ranking обновлено за {time.perf_counter() - started:.1f} с")
+    else:
+        print(
+            "movie_top_ranking не обновлено: его сейчас пересчитывает другой процесс "
+            "или его нет (примените миграции: alembic upgrade head)"
+        )
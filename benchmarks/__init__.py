@@ -0,0 +1,11 @@
+"""
+Бенчмарки бота вопрос-ответ и построения похожих фильмов.
+
+Измеряют холодную и прогретую задержку app.basic_algorithm.recommend_movies,
+пропускную способность по жанрам, пик памяти (tracemalloc) и скорость
+create_data/similar_to_csv.find_top_20_similar_movies_for_movie - на файлах
+из app/genre_with_info и на синтетическом жанре на 100 000 строк.
+
+Запуск из корня репозитория, результат - JSON для сравнения между коммитами:
+    python -m benchmarks --output bench.json
+"""
@@ -0,0 +1,98 @@
+"""
+Запуск всех бенчмарков и вывод результата в JSON.
+
+    python -m benchmarks --output bench.json
+    python -m benchmarks --genres Драма Ужасы --synthetic-rows 0 --skip-similarity
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import GENRE_DATA_DIR
+from app.recommender.registry import GenreRegistry
+from benchmarks.recommender import bench_recommender
+from benchmarks.similarity import bench_similarity, genre_paths
+from benchmarks.synthetic import SYNTHETIC_GENRE, generate_genre_file
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(args: argparse.Namespace) -> dict:
+    genres = args.genres or GenreRegistry(args.genres_dir, snapshot_path=None).genres()
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+        },
+        "recommender": bench_recommender(
+            args.genres_dir, genres, iterations=args.iterations, snapshot_path=args.snapshot, seed=args.seed
+        ),
+    }
+    if not args.skip_similarity:
+        result["similarity"] = bench_similarity(
+            genre_paths(args.genres_dir, genres), samples=args.similarity_samples, seed=args.seed
+        )
+
+    if args.synthetic_rows > 0:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = generate_genre_file(
+                os.path.join(tmp_dir, f"{SYNTHETIC_GENRE}.csv"), rows=args.synthetic_rows, seed=args.seed
+            )
+            synthetic = {
+                "rows": args.synthetic_rows,
+                "recommender": bench_recommender(
+                    tmp_dir, [SYNTHETIC_GENRE], iterations=args.iterations, seed=args.seed
+                )["genres"].get(SYNTHETIC_GENRE),
+            }
+            if not args.skip_similarity:
+                synthetic["similarity"] = bench_similarity(
+                    {SYNTHETIC_GENRE: path}, samples=args.synthetic_similarity_samples, seed=args.seed
+                )["files"].get(SYNTHETIC_GENRE)
+        result["synthetic"] = synthetic
+    return result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарки бота вопрос-ответ и похожих фильмов")
+    parser.add_argument("--output", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--genres-dir", default=GENRE_DATA_DIR, help="папка с файлами жанров")
+    parser.add_argument("--genres", nargs="*", help="только эти жанры")
+    parser.add_argument("--iterations", type=int, default=200, help="прогретых вызовов recommend_movies на жанр")
+    parser.add_argument("--snapshot", help="папка бинарного снимка для холодной загрузки жанров")
+    parser.add_argument("--similarity-samples", type=int, default=5, help="фильмов на файл для похожих")
+    parser.add_argument("--skip-similarity", action="store_true", help="не замерять похожие фильмы")
+    parser.add_argument("--synthetic-rows", type=int, default=100_000, help="строк в синтетическом жанре, 0 - без него")
+    parser.add_argument("--synthetic-similarity-samples", type=int, default=1,
+                        help="фильмов синтетического жанра для похожих (один вызов - полный проход по файлу)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    data = json.dumps(run(args), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(data + "\n")
+    else:
+        sys.stdout.write(data + "\n")
+
+
+if __name__ == "__main__":
+    main()
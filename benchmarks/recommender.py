@@ -0,0 +1,84 @@
+"""Замеры app.basic_algorithm.recommend_movies: холодный и прогретый вызов, пропускная способность, память"""
+import contextlib
+import itertools
+import random
+from typing import Any, Dict, List, Optional
+
+import app.recommender.registry as registry_module
+from app.basic_algorithm import recommend_movies
+from app.recommender.registry import GenreDataset, GenreRegistry
+from benchmarks.timing import measure, peak_memory, quiet, summarize, timed
+
+
+@contextlib.contextmanager
+def use_registry(registry: GenreRegistry):
+    """recommend_movies берет датасеты из глобального реестра, подменяем его на время замера"""
+    previous = registry_module.genre_registry
+    registry_module.genre_registry = registry
+    try:
+        yield
+    finally:
+        registry_module.genre_registry = previous
+
+
+def answer_combos(dataset: GenreDataset, count: int, seed: int) -> List[List[str]]:
+    """Случайные ответы бота по значениям из файла жанра; часть ответов не совпадает ни с чем"""
+    rng = random.Random(seed)
+    values = [sorted(set(column)) + ["Нет такого"] for column in dataset.criteria[1:]]
+    return [[dataset.name, *(rng.choice(column) for column in values)] for _ in range(count)]
+
+
+def bench_genre(registry: GenreRegistry, genre: str, iterations: int, seed: int = 0) -> Optional[Dict[str, Any]]:
+    dataset = registry.get(genre)
+    if dataset is None or len(dataset) == 0:
+        return None
+    combos = answer_combos(dataset, max(iterations, 1), seed)
+
+    with use_registry(registry), quiet():
+        # Холодный вызов: файл жанра читается и кодируется заново
+        registry.clear()
+        cold, _ = timed(lambda: recommend_movies(combos[0]))
+        registry.clear()
+        cold_peak, _ = peak_memory(lambda: recommend_movies(combos[0]))
+
+        answers = itertools.cycle(combos)
+        warm = measure(lambda: recommend_movies(next(answers)), iterations)
+        warm_peak, _ = peak_memory(lambda: recommend_movies(combos[0]))
+
+    return {
+        "rows": len(dataset),
+        "cold_ms": round(cold * 1000, 3),
+        "warm": summarize(warm),
+        "cold_memory_peak_kb": round(cold_peak / 1024, 1),
+        "warm_memory_peak_kb": round(warm_peak / 1024, 1),
+    }
+
+
+def bench_recommender(
+    genres_dir: str,
+    genres: Optional[List[str]] = None,
+    iterations: int = 200,
+    snapshot_path: Optional[str] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Замеры по каждому жанру из папки и сводка по всем жанрам"""
+    registry = GenreRegistry(genres_dir, snapshot_path=snapshot_path)
+    results = {}
+    for genre in genres or registry.genres():
+        result = bench_genre(registry, genre, iterations, seed)
+        if result is not None:
+            results[genre] = result
+
+    cold = [result["cold_ms"] for result in results.values()]
+    warm = [result["warm"]["p50_ms"] for result in results.values() if result["warm"]]
+    return {
+        "genres_dir": genres_dir,
+        "snapshot": snapshot_path,
+        "iterations": iterations,
+        "genres": results,
+        "total": {
+            "rows": sum(result["rows"] for result in results.values()),
+            "cold_ms_sum": round(sum(cold), 3),
+            "warm_p50_ms_max": max(warm) if warm else None,
+        },
+    }
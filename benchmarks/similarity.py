@@ -0,0 +1,71 @@
+"""
+Замеры create_data/similar_to_csv.find_top_20_similar_movies_for_movie и векторного
+find_top_20_similar_movies_all.
+
+Покадровая функция перебирает весь файл жанра для каждого фильма, поэтому время меряется
+на выборке фильмов, а время на весь файл оценивается как среднее * количество строк.
+Файлы читаются через read_genre_table: load_original_file рассчитан только на cp1251.
+"""
+import os
+import random
+from typing import Any, Dict, List, Optional
+
+from app.basic_algorithm import read_genre_table
+from benchmarks.timing import peak_memory, quiet, summarize, timed
+from create_data.similar_to_csv import (
+    calculate_average_rating,
+    find_top_20_similar_movies_all,
+    find_top_20_similar_movies_for_movie,
+)
+
+
+def load_similarity_input(path: str):
+    df = read_genre_table(path, verbose=False)
+    if df is None or df.empty:
+        return None, []
+    avg_ratings = [calculate_average_rating(row) for _, row in df.iterrows()]
+    return df, avg_ratings
+
+
+def bench_file(path: str, samples: int, seed: int = 0) -> Optional[Dict[str, Any]]:
+    with quiet():
+        load, (df, avg_ratings) = timed(lambda: load_similarity_input(path))
+    if df is None:
+        return None
+
+    rng = random.Random(seed)
+    indices = rng.sample(range(len(df)), min(max(samples, 1), len(df)))
+    with quiet():
+        first, _ = timed(lambda: find_top_20_similar_movies_for_movie(df, indices[0], avg_ratings))
+        warm = [
+            timed(lambda idx=idx: find_top_20_similar_movies_for_movie(df, idx, avg_ratings))[0]
+            for idx in indices
+        ]
+        peak, _ = peak_memory(lambda: find_top_20_similar_movies_for_movie(df, indices[0], avg_ratings))
+        all_movies, _ = timed(lambda: find_top_20_similar_movies_all(df, avg_ratings))
+        all_peak, _ = peak_memory(lambda: find_top_20_similar_movies_all(df, avg_ratings))
+
+    per_movie = summarize(warm)
+    return {
+        "rows": len(df),
+        "load_ms": round(load * 1000, 3),
+        "first_call_ms": round(first * 1000, 3),
+        "per_movie": per_movie,
+        "estimated_file_s": round(per_movie["mean_ms"] * len(df) / 1000, 1),
+        "memory_peak_kb": round(peak / 1024, 1),
+        "vectorized_file_s": round(all_movies, 3),
+        "vectorized_memory_peak_kb": round(all_peak / 1024, 1),
+    }
+
+
+def bench_similarity(paths: Dict[str, str], samples: int = 5, seed: int = 0) -> Dict[str, Any]:
+    results = {}
+    for name, path in paths.items():
+        result = bench_file(path, samples, seed)
+        if result is not None:
+            results[name] = result
+    return {"samples": samples, "files": results}
+
+
+def genre_paths(genres_dir: str, genres: List[str]) -> Dict[str, str]:
+    return {genre: os.path.join(genres_dir, f"{genre}.csv") for genre in genres}
@@ -0,0 +1,62 @@
+"""
+Генератор синтетического файла жанра в формате app/genre_with_info.
+
+Колонки: название;жанр;поджанр;детализация;период;оценка КП;kp_id;английское название;IMDB;критики.
+Распределение значений близко к реальным файлам: несколько десятков поджанров и детализаций,
+три периода, часть оценок пропущена. Файл пишется в cp1251 - его читают и load_genre_data,
+и load_original_file из create_data/similar_to_csv.py.
+
+Запуск: python -m benchmarks.synthetic --rows 100000 --output /tmp/Синтетика.csv
+"""
+import argparse
+import os
+import random
+
+SYNTHETIC_GENRE = "Синтетика"
+SUBGENRES = [f"Поджанр {i}" for i in range(24)]
+DETAILS = [f"Настроение {i}" for i in range(40)]
+PERIODS = ["Классика (до 2000 года)", "Современное кино (2000–2020)", "Новинки (2020–2025)"]
+
+
+def rating(rng: random.Random, missing: float) -> str:
+    if rng.random() < missing:
+        return ""
+    return f"{rng.uniform(3.0, 9.5):.1f}"
+
+
+def generate_genre_file(
+    path: str,
+    rows: int = 100_000,
+    genre: str = SYNTHETIC_GENRE,
+    seed: int = 0,
+    encoding: str = "cp1251",
+) -> str:
+    """Пишет файл жанра на rows фильмов и возвращает путь к нему"""
+    rng = random.Random(seed)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding=encoding, newline="\n") as f:
+        for i in range(rows):
+            f.write(";".join((
+                f"Фильм {i}",
+                genre,
+                rng.choice(SUBGENRES),
+                rng.choice(DETAILS),
+                rng.choice(PERIODS),
+                rating(rng, 0.05),
+                str(10_000_000 + i),
+                f"Movie {i}",
+                rating(rng, 0.3),
+                rating(rng, 0.6),
+            )) + "\n")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация синтетического файла жанра")
+    parser.add_argument("--rows", type=int, default=100_000, help="количество фильмов")
+    parser.add_argument("--output", default=f"{SYNTHETIC_GENRE}.csv", help="путь к файлу")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(generate_genre_file(args.output, rows=args.rows, seed=args.seed))
@@ -0,0 +1,56 @@
+"""Общие помощники для замеров: время, перцентили, пик памяти и тишина в stdout"""
+import contextlib
+import io
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+
+@contextlib.contextmanager
+def quiet():
+    """Глушит отладочный print измеряемого кода, чтобы он не попадал в замеры и в JSON"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def timed(func: Callable[[], Any]) -> Tuple[float, Any]:
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def measure(func: Callable[[], Any], iterations: int) -> List[float]:
+    """Время каждого из iterations вызовов в секундах"""
+    return [timed(func)[0] for _ in range(iterations)]
+
+
+def summarize(times: List[float]) -> Dict[str, float]:
+    """Статистика замеров в миллисекундах"""
+    if not times:
+        return {}
+    ordered = sorted(times)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "runs": len(times),
+        "mean_ms": round(statistics.fmean(times) * 1000, 3),
+        "p50_ms": round(pick(0.5) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "per_second": round(len(times) / sum(times), 1) if sum(times) > 0 else None,
+    }
+
+
+def peak_memory(func: Callable[[], Any]) -> Tuple[int, Any]:
+    """Пик выделенной Python и numpy памяти (байты) за время выполнения func"""
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
@@ -1,5 +1,6 @@
 import os
 import re
+import sys
 import requests
 import json
 from pathlib import Path
@@ -8,6 +9,12 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from urllib.parse import quote_plus
 
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.models.movie import normalize_genres  # noqa: E402
+from app.repositories.movies import MovieRepository  # noqa: E402
+
 env = Env()
 env.read_env()
 
@@ -219,7 +226,8 @@ def insert_movie_to_db(movie_record, session):
             "world_premiere": movie_record["world_premiere"],
             "budget": movie_record["budget"],
             "year_release": movie_record["year_release"],
-            "genres": movie_record["genres"],          # ← list, не строка!
+            # Сырой INSERT минует валидатор модели, а фильтр по жанрам сравнивает их точно
+            "genres": normalize_genres(movie_record["genres"]),  # ← list, не строка!
             "countries": movie_record["countries"],    # ← list
             "persons": movie_record["persons"],        # ← list of lists
             "director": movie_record["director"],      # ← list
@@ -312,6 +320,14 @@ def main():
     for csv_file in csv_files:
         process_file(csv_file, start_line=1)
 
+    # Новые фильмы и голоса попадают в /top сразу, а не после планового пересчета
+    try:
+        with SessionLocal() as session:
+            if MovieRepository(session).refresh_top_ranking():
+                print("movie_top_ranking обновлено")
+    except Exception as e:
+        print(f"Не удалось обновить movie_top_ranking: {e}")
+
     print("\n✅ Обработка завершена.")
 
 
@@ -2,6 +2,11 @@ import pandas as pd
 import os
 import numpy as np
 import re
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 def is_excel_file(file_path):
     """Проверяет, является ли файл Excel-файлом по сигнатуре"""
@@ -251,6 +256,119 @@ def find_top_20_similar_movies_for_movie(df, movie_idx, avg_ratings):
     
     return ';'.join(similar_movies)
 
+# Сколько похожих фильмов записывается в колонку 20_похожих
+SIMILAR_COUNT = 20
+# Колонки, по которым сравниваются фильмы: жанр и критерии 2-4
+SIMILARITY_COLUMNS = (1, 2, 3, 4)
+
+def build_similarity_primary_keys():
+    """
+    Первичный ключ сортировки для каждой из 16 масок совпадений (бит 0 - жанр, биты 1-3 - критерии).
+    Меньше - лучше: сначала exact_matches по убыванию, затем паттерн "1/2" по возрастанию
+    """
+    primary = np.zeros(1 << len(SIMILARITY_COLUMNS), dtype=np.int64)
+    for mask in range(len(primary)):
+        matched = [(mask >> bit) & 1 for bit in range(len(SIMILARITY_COLUMNS))]
+        # Жанр не считается в exact_matches, но участвует в паттерне первой цифрой
+        exact_matches = sum(matched[1:])
+        pattern_rank = int("".join("0" if m else "1" for m in matched), 2)
+        primary[mask] = (len(SIMILARITY_COLUMNS) - 1 - exact_matches) * len(primary) + pattern_rank
+    return primary
+
+SIMILARITY_PRIMARY_BY_MASK = build_similarity_primary_keys()
+# Сходство для маски: доля совпавших колонок (жанр и критерии 2-4), пишется в 20_похожих_сходство
+SIMILARITY_SCORE_BY_MASK = np.array(
+    [bin(mask).count("1") / len(SIMILARITY_COLUMNS) for mask in range(1 << len(SIMILARITY_COLUMNS))]
+)
+
+def find_top_20_similar_movies_all(df, avg_ratings, count=SIMILAR_COUNT, with_scores=False):
+    """
+    Векторный вариант find_top_20_similar_movies_for_movie сразу для всех фильмов файла.
+
+    Порядок похожих зависит только от значений жанра и критериев исходного фильма, поэтому
+    фильмы группируются по одинаковому набору значений, и для каждой группы ранжирование
+    по всему файлу считается один раз numpy (argpartition вместо полной сортировки).
+    Из общего списка группы остается только исключить сам фильм.
+
+    Returns:
+        Список строк с названиями похожих фильмов через точку с запятой, по позициям фильмов в df.
+        При with_scores - пары (названия, сходство тех же фильмов через точку с запятой)
+    """
+    size = len(df)
+    if size == 0:
+        return []
+
+    # Коды значений колонок; отсутствующая колонка не совпадает ни с чем, как и в исходной функции
+    codes = np.zeros((len(SIMILARITY_COLUMNS), size), dtype=np.int64)
+    present = []
+    for i, col in enumerate(SIMILARITY_COLUMNS):
+        present.append(col in df.columns)
+        if present[-1]:
+            cleaned = np.array([clean_text(value) for value in df[col]], dtype=object)
+            codes[i] = np.unique(cleaned, return_inverse=True)[1].reshape(-1)
+
+    titles = [clean_text(value) for value in df.iloc[:, 0]]
+
+    # Плотный ранг оценки по убыванию (пропуски в конце), затем позиция строки - ключ уникален
+    ratings = pd.to_numeric(pd.Series(list(avg_ratings)), errors='coerce').to_numpy(dtype=np.float64)
+    ratings = np.where(np.isnan(ratings), -np.inf, ratings)
+    levels, rating_inverse = np.unique(ratings, return_inverse=True)
+    rating_order = ((len(levels) - 1) - rating_inverse.reshape(-1)) * size + np.arange(size)
+    scale = len(levels) * size
+
+    # Исходная функция исключает строку с меткой индекса movie_idx
+    label_positions = {label: pos for pos, label in enumerate(df.index)}
+
+    keys, bucket_of = np.unique(codes.T, axis=0, return_inverse=True)
+    bucket_of = bucket_of.reshape(-1)
+    members_order = np.argsort(bucket_of, kind='stable')
+    bounds = np.searchsorted(bucket_of[members_order], np.arange(len(keys) + 1))
+
+    take = min(count + 1, size)
+    results = [""] * size
+    for bucket, key in enumerate(keys):
+        mask = np.zeros(size, dtype=np.int64)
+        for bit in range(len(SIMILARITY_COLUMNS)):
+            if present[bit]:
+                mask |= (codes[bit] == key[bit]).astype(np.int64) << bit
+        order_key = SIMILARITY_PRIMARY_BY_MASK[mask] * scale + rating_order
+
+        top = np.argpartition(order_key, take - 1)[:take] if take < size else np.arange(size)
+        top = top[np.argsort(order_key[top])].tolist()
+        head = set(top[:count])
+        scores = SIMILARITY_SCORE_BY_MASK[mask]
+
+        def join(similar):
+            joined = ';'.join(titles[j] for j in similar if titles[j])
+            if not with_scores:
+                return joined
+            return joined, ';'.join(f"{scores[j]:g}" for j in similar if titles[j])
+
+        default = join(top[:count])
+        for i in members_order[bounds[bucket]:bounds[bucket + 1]].tolist():
+            excluded = label_positions.get(i)
+            if excluded not in head:
+                # Исключаемый фильм не попал в первые count, список общий для всей группы
+                results[i] = default
+                continue
+            results[i] = join([j for j in top if j != excluded][:count])
+    return results
+
+def write_csv_atomic(df, file_path):
+    """
+    Пишет CSV во временный файл рядом и переименовывает его: прерванный запуск
+    не оставляет наполовину записанный _обновленный.csv
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_csv(tmp_path, sep=';', index=False, encoding='cp1251')
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
 def process_genre_file(base_path, genre_name):
     """
     Обрабатывает файл с фильмами определенного жанра и создает обновленную версию
@@ -258,6 +376,9 @@ def process_genre_file(base_path, genre_name):
     Args:
         base_path: Путь к папке с файлами
         genre_name: Название жанра (имя файла без расширения)
+
+    Returns:
+        Путь к созданному файлу или None, если файл не удалось обработать
     """
     file_path = os.path.join(base_path, f"{genre_name}.csv")
     print(f"\nНачинаю обработку файла: {genre_name}.csv")
@@ -266,7 +387,7 @@ def process_genre_file(base_path, genre_name):
     df = load_original_file(file_path)
     if df is None or df.empty:
         print(f"Не удалось загрузить данные из {file_path}")
-        return
+        return None
     
     print(f"Загружено {len(df)} фильмов для обработки")
     
@@ -278,16 +399,15 @@ def process_genre_file(base_path, genre_name):
     
     # Добавляем новую колонку для похожих фильмов
     df['20_похожих'] = ""
+    df['20_похожих_сходство'] = ""
     
-    # Обрабатываем каждый фильм
+    # Топ-20 похожих сразу для всех фильмов (тот же порядок, что у find_top_20_similar_movies_for_movie)
     total_movies = len(df)
-    for i in range(total_movies):
-        if i % 100 == 0:
-            print(f"  Обработано {i} из {total_movies} фильмов в файле {genre_name}.csv")
-        
-        # Находим топ-20 похожих фильмов для текущего фильма
-        similar_movies_str = find_top_20_similar_movies_for_movie(df, i, avg_ratings)
+    print(f"  Подбираю похожие для {total_movies} фильмов в файле {genre_name}.csv")
+    similar = find_top_20_similar_movies_all(df, avg_ratings, with_scores=True)
+    for i, (similar_movies_str, scores_str) in enumerate(similar):
         df.at[i, '20_похожих'] = similar_movies_str
+        df.at[i, '20_похожих_сходство'] = scores_str
     
     print(f"  Завершена обработка всех {total_movies} фильмов в файле {genre_name}.csv")
     
@@ -298,18 +418,38 @@ def process_genre_file(base_path, genre_name):
     # Сохраняем в новый файл
     try:
         # Сохраняем все колонки с разделителем точка с запятой
-        df.to_csv(new_file_path, sep=';', index=False, encoding='cp1251')
+        write_csv_atomic(df, new_file_path)
         print(f"✓ Создан новый файл: {new_file_name}")
-        print(f"  Колонок в файле: {len(df.columns)} (включая новую колонку '20_похожих')")
+        print(f"  Колонок в файле: {len(df.columns)} (включая новые колонки '20_похожих' и '20_похожих_сходство')")
+        return new_file_path
     except Exception as e:
         print(f"✗ Ошибка при сохранении файла {new_file_name}: {e}")
+        return None
 
-def process_all_genre_files(base_path):
+def process_genre_task(base_path, genre_name):
+    """
+    Задача для процесса-воркера: обрабатывает один жанр без подробного вывода,
+    возвращает путь к созданному файлу (или None) и время обработки
+    """
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            result = process_genre_file(base_path, genre_name)
+        finally:
+            sys.stdout = stdout
+    return result, time.perf_counter() - started
+
+def process_all_genre_files(base_path, jobs=1):
     """
     Обрабатывает все CSV файлы в указанной папке
     
     Args:
         base_path: Путь к папке с файлами жанров
+        jobs: Количество процессов (по одному жанру на задачу), 0 - по числу ядер
+
+    Returns:
+        Список путей к созданным файлам
     """
     print("=" * 80)
     print("НАЧАЛО ОБРАБОТКИ ВСЕХ ФАЙЛОВ С ФИЛЬМАМИ")
@@ -317,7 +457,7 @@ def process_all_genre_files(base_path):
     
     if not os.path.exists(base_path):
         print(f"Папка {base_path} не найдена!")
-        return
+        return []
     
     # Получаем список всех CSV файлов в папке (кроме уже обновленных)
     all_files = os.listdir(base_path)
@@ -325,28 +465,52 @@ def process_all_genre_files(base_path):
     
     if not csv_files:
         print(f"В папке {base_path} не найдено CSV файлов для обработки")
-        return
+        return []
     
     print(f"Найдено {len(csv_files)} файлов для обработки:")
     for file in csv_files:
         print(f"  - {file}")
     
     total_files = len(csv_files)
-    
-    for idx, csv_file in enumerate(csv_files, 1):
-        print(f"\n{'='*80}")
-        print(f"Обработка файла {idx} из {total_files}: {csv_file}")
-        print(f"{'='*80}")
-        
-        # Извлекаем название жанра из имени файла (убираем расширение .csv)
-        genre_name = csv_file.replace('.csv', '')
-        
-        # Обрабатываем файл
-        process_genre_file(base_path, genre_name)
+    # Извлекаем названия жанров из имен файлов (убираем расширение .csv)
+    genre_names = [csv_file.replace('.csv', '') for csv_file in csv_files]
+    created = []
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1:
+        print(f"Параллельная обработка: процессов {min(jobs, total_files)}")
+        with ProcessPoolExecutor(max_workers=min(jobs, total_files)) as pool:
+            futures = {
+                pool.submit(process_genre_task, base_path, genre_name): genre_name
+                for genre_name in genre_names
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                genre_name = futures[future]
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    print(f"[{done}/{total_files}] ✗ {genre_name}: ошибка {e}")
+                    continue
+                if result is None:
+                    print(f"[{done}/{total_files}] ✗ {genre_name}: файл не обработан ({elapsed:.1f} с)")
+                else:
+                    created.append(result)
+                    print(f"[{done}/{total_files}] ✓ {genre_name}: {os.path.basename(result)} ({elapsed:.1f} с)")
+    else:
+        for idx, (csv_file, genre_name) in enumerate(zip(csv_files, genre_names), 1):
+            print(f"\n{'='*80}")
+            print(f"Обработка файла {idx} из {total_files}: {csv_file}")
+            print(f"{'='*80}")
+            
+            # Обрабатываем файл
+            result = process_genre_file(base_path, genre_name)
+            if result is not None:
+                created.append(result)
     
     print(f"\n{'='*80}")
-    print("ОБРАБОТКА ВСЕХ ФАЙЛОВ ЗАВЕРШЕНА!")
+    print(f"ОБРАБОТКА ВСЕХ ФАЙЛОВ ЗАВЕРШЕНА! Создано файлов: {len(created)} из {total_files}")
     print(f"{'='*80}")
+    return created
 
 # Тестовая функция для проверки логики
 def test_similarity_logic(genre, movie_title):
@@ -511,8 +675,20 @@ def test_similarity_logic(genre, movie_title):
 
 # Пример использования с заданными параметрами
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подбор 20 похожих фильмов для файлов жанров")
     # Путь к папке с файлами жанров
-    base_path = r"C:\Users\User\Desktop\genre_with_info"
+    parser.add_argument("--base-path", default=r"C:\Users\User\Desktop\genre_with_info",
+                        help="папка с файлами жанров")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="количество процессов, по одному жанру на задачу (0 - по числу ядер)")
+    parser.add_argument("--yes", action="store_true",
+                        help="сразу обработать все файлы, без тестового примера и вопроса")
+    args = parser.parse_args()
+    base_path = args.base_path
+
+    if args.yes:
+        process_all_genre_files(base_path, jobs=args.jobs)
+        sys.exit(0)
     
     # Тестовые примеры для проверки логики
     test_cases = [
@@ -536,5 +712,4 @@ if __name__ == "__main__":
     
     continue_processing = input("Начать обработку всех файлов? (y/n): ")
     if continue_processing.lower() == 'y':
-        process_all_genre_files(base_path)
-    
+        process_all_genre_files(base_path, jobs=args.jobs)
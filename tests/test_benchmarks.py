@@ -0,0 +1,17 @@
+from benchmarks.recommender import bench_recommender
+from benchmarks.similarity import bench_similarity
+from benchmarks.synthetic import SYNTHETIC_GENRE, generate_genre_file
+
+
+def test_benchmarks_run_on_synthetic_genre(tmp_path):
+    """Бенчмарки отрабатывают на маленьком синтетическом жанре и возвращают замеры"""
+    path = generate_genre_file(str(tmp_path / f"{SYNTHETIC_GENRE}.csv"), rows=300)
+
+    recommender = bench_recommender(str(tmp_path), [SYNTHETIC_GENRE], iterations=5)
+    result = recommender["genres"][SYNTHETIC_GENRE]
+    assert result["rows"] == 300
+    assert result["warm"]["runs"] == 5
+    assert result["cold_memory_peak_kb"] > 0
+
+    similarity = bench_similarity({SYNTHETIC_GENRE: path}, samples=2)
+    assert similarity["files"][SYNTHETIC_GENRE]["per_movie"]["runs"] == 2
@@ -0,0 +1,45 @@
+from app.core.cache import LRUCache
+
+
+def test_cache_hit_and_miss():
+    cache = LRUCache(maxsize=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", [1])
+    assert cache.get("a") == [1]
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_invalidates_on_version_change():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1, version=1)
+
+    assert cache.get("a", version=2) is None
+    assert cache.get("a", version=1) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_cache_expires_by_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.core.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    now[0] += 11
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
@@ -0,0 +1,76 @@
+from sqlalchemy import select
+
+from app.models.movie import Movie, movie_similarities
+from app.recommender.content import ContentIndex, build_content_similarities, compute_neighbours, content_index
+from app.repositories import SimilarityRepository
+from app.schemas.movie import MovieCreate
+from app.services.movies import MovieService
+
+
+def add_movies(db):
+    movies = [
+        Movie(kp_id=1, title="Крестный отец", genres=["драма", "криминал"], countries=["США"],
+              director="Коппола", year_release=1972),
+        Movie(kp_id=2, title="Крестный отец 2", genres=["драма", "криминал"], countries=["США"],
+              director="Коппола", year_release=1974),
+        Movie(kp_id=3, title="Славные парни", genres=["драма", "криминал"], countries=["США"],
+              director="Скорсезе", year_release=1990),
+        Movie(kp_id=4, title="Ирония судьбы", genres=["комедия", "мелодрама"], countries=["СССР"],
+              year_release=1985),
+    ]
+    db.add_all(movies)
+    db.commit()
+    return [movie.id for movie in movies]
+
+
+def test_content_neighbours_for_catalog(db):
+    """Соседи по TF-IDF без самого фильма; блоки в процессах дают то же, что без них"""
+    godfather, godfather_2, goodfellas, irony = add_movies(db)
+    index = ContentIndex.build(
+        (movie.id, movie.genres, movie.countries, movie.persons, movie.director, movie.year_release)
+        for movie in db.query(Movie).order_by(Movie.id)
+    )
+
+    edges = compute_neighbours(index, k=2, block_size=1)
+    assert compute_neighbours(index, k=2, block_size=2, jobs=2) == edges
+    assert [edge[1:3] for edge in edges if edge[0] == godfather] == [(godfather_2, 1), (goodfellas, 2)]
+    assert all(edge[0] != edge[1] for edge in edges)
+    assert [edge for edge in edges if edge[0] == irony] == []
+
+    # По умолчанию связи получают только фильмы, у которых их еще нет
+    SimilarityRepository(db).insert_edges([(godfather, irony, 1, 1.0)])
+    build_content_similarities(db, k=2)
+    pairs = db.execute(
+        select(movie_similarities.c.similar_movie_id).where(movie_similarities.c.movie_id == godfather)
+    ).scalars().all()
+    assert pairs == [irony]
+    content_index.clear()
+
+
+def test_created_movie_gets_content_neighbours(db, monkeypatch):
+    """Новый фильм получает похожих по готовому индексу, а до его сборки - сразу после нее"""
+    godfather, godfather_2, goodfellas, irony = add_movies(db)
+    content_index.clear()
+    started = []
+    monkeypatch.setattr(content_index, "load_in_background", lambda: started.append(True))
+
+    def create(kp_id, title):
+        return MovieService(db).create_movie(MovieCreate(
+            kp_id=kp_id, title=title, genres=["драма", "криминал"], countries=["США"], year_release=1990,
+        ))
+
+    # Индекса нет: запрос не строит его, а откладывает фильм до фоновой сборки
+    pending = create(5, "Крестный отец 3")
+    assert started == [True]
+    assert SimilarityRepository(db).count() == 0
+    content_index.load(db)
+
+    # Общее десятилетие только со "Славными парнями", остальные равны и идут по id
+    similar = MovieService(db).get_similar(pending.id, limit=5)
+    assert [m.id for m in similar] == [goodfellas, godfather, godfather_2]
+
+    # С готовым индексом - сразу в запросе, отложенный фильм уже в индексе
+    movie = create(6, "Ирландец")
+    assert [m.id for m in MovieService(db).get_similar(movie.id, limit=2)] == [pending.id, goodfellas]
+    assert started == [True]
+    content_index.clear()
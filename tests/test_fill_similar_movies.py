@@ -0,0 +1,94 @@
+from pathlib import Path
+
+import pytest
+from sqlalchemy import select
+
+from app.fill_similar_movies import MovieTitleIndex, process_csv_file, read_csv_rows, read_similar_rows
+from create_data.similar_to_csv import process_genre_file
+from app.models.movie import Movie, movie_similarities
+from app.repositories import SimilarityRepository
+
+
+# Заголовок файла, который пишет create_data/similar_to_csv.process_genre_file
+SIMILAR_HEADER = [*map(str, range(10)), "20_похожих", "20_похожих_сходство"]
+UPDATE_FILMS_DIR = Path(__file__).parent.parent / "app" / "update_films"
+
+
+def similar_row(title, similar, scores=""):
+    return [title, "Биографический", *[""] * 8, similar, scores]
+
+
+def test_title_index_keeps_first_movie_and_counts_collisions(db):
+    """При одинаковых названиях побеждает первый фильм, как при прежнем переборе"""
+    first = Movie(kp_id=1, title="Дюна", english_title="Dune")
+    second = Movie(kp_id=2, title="Dune", english_title="Дюна")
+    db.add_all([first, second])
+    db.commit()
+
+    index = MovieTitleIndex.build(db)
+    assert index.find("  ДЮНА ").id == first.id
+    assert index.find("dune").id == first.id
+    assert index.collisions == 2
+    assert index.find("Нет такого") is None
+
+
+def test_process_csv_file_uses_index(db):
+    movies = [Movie(kp_id=i, title=title, english_title=english) for i, (title, english) in enumerate(
+        [("Сильнее", "Stronger"), ("Сенна", None), ("Али", "Ali")], start=1
+    )]
+    db.add_all(movies)
+    db.commit()
+
+    rows = [SIMILAR_HEADER, similar_row("Сильнее", "Сенна;ali;Нет такого;Сенна", "1;0.75;0.5;0.5")]
+    process_csv_file(db, Path("Биографический_обновленный.csv"), rows, index=MovieTitleIndex.build(db))
+
+    edges = db.execute(select(movie_similarities).order_by(movie_similarities.c.rank)).all()
+    assert [tuple(edge) for edge in edges] == [
+        (movies[0].id, movies[1].id, 1, 1.0),
+        (movies[0].id, movies[2].id, 2, 0.75),
+    ]
+
+
+def test_similarity_repository_insert_is_idempotent_and_replace_swaps(db, monkeypatch):
+    """Повторная загрузка не дублирует связи, replace оставляет только новый набор"""
+    movies = [Movie(kp_id=i, title=f"Фильм {i}") for i in range(1, 4)]
+    db.add_all(movies)
+    db.commit()
+    a, b, c = (movie.id for movie in movies)
+
+    repository = SimilarityRepository(db)
+    # Количество вставленных берется из самой вставки, без подсчета всей таблицы
+    with monkeypatch.context() as patch:
+        patch.setattr(repository, "count", lambda: pytest.fail("count() on insert"))
+        assert repository.insert_edges([(a, b), (a, c), (a, b)], batch_size=1) == 2
+        assert repository.insert_edges([(a, b), (b, c)]) == 1
+    assert repository.count() == 3
+
+    assert repository.replace_edges([(c, a)]) == 1
+    pairs = db.execute(select(movie_similarities.c.movie_id, movie_similarities.c.similar_movie_id)).all()
+    assert pairs == [(c, a)]
+
+
+def test_builder_output_loads_with_scores(db, tmp_path):
+    """Файл из process_genre_file загружается целиком: колонки похожих и сходства ищутся по заголовку"""
+    titles = [f"Фильм {i}" for i in range(6)]
+    rows = [f"{title};Драма;Поджанр {i % 2};Настроение;Классика;{6 + i}.0" for i, title in enumerate(titles)]
+    (tmp_path / "Драма.csv").write_text("\n".join(rows), encoding="cp1251")
+    path = Path(process_genre_file(str(tmp_path), "Драма"))
+
+    movies = [Movie(kp_id=i, title=title) for i, title in enumerate(titles, start=1)]
+    db.add_all(movies)
+    db.commit()
+    process_csv_file(db, path, index=MovieTitleIndex.build(db), encoding="cp1251")
+
+    edges = db.execute(select(movie_similarities)).all()
+    assert {edge.movie_id for edge in edges} == {movie.id for movie in movies}
+    assert all(edge.score is not None and edge.rank >= 1 for edge in edges)
+
+
+def test_shipped_update_files_have_similar_rows():
+    """В каждом файле app/update_films колонка 20_похожих стоит на своем месте, и строки из нее читаются"""
+    for path in sorted(UPDATE_FILMS_DIR.glob("*.csv")):
+        rows = list(read_similar_rows(read_csv_rows(path)))
+        assert rows, path.name
+        assert all(similar_titles for _, _, similar_titles, _ in rows)
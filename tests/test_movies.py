@@ -27,3 +27,468 @@ def test_search_movies_empty(client):
     response = client.get("/api/movies/search?q=несуществующий+фильм")
     assert response.status_code == status.HTTP_200_OK
     assert isinstance(response.json(), list)
+
+
+def test_recommend_movies_resolves_by_kp_id(client, db):
+    """Рекомендации достаются из БД по kp_id в порядке ранжирования, дубли названий не мешают"""
+    from app.basic_algorithm import recommend_kp_ids
+    from app.models.movie import Movie
+    from app.recommender.cache import recommendation_cache
+    from app.recommender.movie_ids import kp_id_map
+    from app.recommender.registry import genre_registry
+
+    dataset = genre_registry.get("Исторический")
+    user_input = ["Исторический", *(column[0] for column in dataset.criteria[1:])]
+    expected_kp_ids = recommend_kp_ids(user_input)
+    for kp_id in reversed(expected_kp_ids):
+        # Одинаковые названия у всех фильмов: сопоставление идет только по kp_id
+        db.add(Movie(kp_id=kp_id, title="Одно название"))
+    db.commit()
+    kp_id_map.clear()
+    recommendation_cache.clear()
+
+    response = client.post(
+        "/api/movies/recommend",
+        json={
+            "main_genre": user_input[0],
+            "subgenre": user_input[1],
+            "subgenre_detail": user_input[2],
+            "time_period": user_input[3],
+        },
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [movie["kp_id"] for movie in response.json()] == expected_kp_ids
+    assert "resolve;dur=" in response.headers["Server-Timing"]
+    assert "total;dur=" in response.headers["Server-Timing"]
+
+    # Повторный запрос с теми же ответами отдается из кэша
+    hits = recommendation_cache.stats()["hits"]
+    repeat = client.post("/api/movies/recommend", json={
+        "main_genre": user_input[0] + " ",
+        "subgenre": user_input[1],
+        "subgenre_detail": user_input[2],
+        "time_period": user_input[3],
+    })
+    assert repeat.json() == response.json()
+    assert recommendation_cache.stats()["hits"] == hits + 1
+    kp_id_map.clear()
+    recommendation_cache.clear()
+
+
+def test_recommend_movies_returns_503_when_busy(client, monkeypatch):
+    """При заполненном пуле рекомендаций сразу отдается 503 с Retry-After"""
+    from app.recommender.cache import recommendation_cache
+    from app.recommender.executor import RecommenderBusyError
+
+    class BusyExecutor:
+        def run(self, func, *args):
+            raise RecommenderBusyError(retry_after=2)
+
+    monkeypatch.setattr("app.services.movies.recommender_executor", BusyExecutor())
+    monkeypatch.setattr("app.services.movies.answer_table.lookup", lambda *args: None)
+    recommendation_cache.clear()
+
+    response = client.post(
+        "/api/movies/recommend",
+        json={
+            "main_genre": "Драма",
+            "subgenre": "Драма",
+            "subgenre_detail": "Грустное/Трагическое",
+            "time_period": "Классика (до 2000 года)",
+        },
+    )
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_similar_movies_ordered_by_rank(client, db):
+    """Похожие фильмы отдаются по rank, связи без rank - в конце"""
+    from app.models.movie import Movie
+    from app.repositories import SimilarityRepository
+
+    movies = [Movie(kp_id=i, title=f"Фильм {i}") for i in range(1, 5)]
+    db.add_all(movies)
+    db.commit()
+    main, *similar = (movie.id for movie in movies)
+    SimilarityRepository(db).insert_edges([
+        (main, similar[0], None, None),
+        (main, similar[1], 2, 0.5),
+        (main, similar[2], 1, 0.75),
+    ])
+
+    response = client.get(f"/api/movies/{main}/similar?limit=2")
+    assert response.status_code == status.HTTP_200_OK
+    assert [movie["id"] for movie in response.json()] == [similar[2], similar[1]]
+    response = client.get(f"/api/movies/{main}/similar")
+    assert [movie["id"] for movie in response.json()][-1] == similar[0]
+
+
+def test_similar_movies_fallback_uses_genre_leaderboard(client, db):
+    """Без связей похожие - лучшие фильмы первого жанра по рейтингу и голосам, кроме самого фильма"""
+    from app.models.movie import Movie
+    from app.recommender.leaderboards import genre_leaderboards
+
+    movies = [
+        Movie(kp_id=1, title="Без связей", genres=["драма"], combined_rating=9.0, sum_votes=10),
+        Movie(kp_id=2, title="Лучший", genres=["драма", "комедия"], combined_rating=8.5, sum_votes=100),
+        Movie(kp_id=3, title="Больше голосов", genres=["драма"], combined_rating=8.0, sum_votes=500),
+        Movie(kp_id=4, title="Меньше голосов", genres=["драма"], combined_rating=8.0, sum_votes=50),
+        Movie(kp_id=5, title="Без рейтинга", genres=["драма"]),
+        Movie(kp_id=6, title="Другой жанр", genres=["комедия"], combined_rating=9.9, sum_votes=900),
+    ]
+    db.add_all(movies)
+    db.commit()
+    genre_leaderboards.clear()
+
+    response = client.get(f"/api/movies/{movies[0].id}/similar?limit=3")
+    assert [movie["kp_id"] for movie in response.json()] == [2, 3, 4]
+
+    genre_leaderboards.add(Movie(id=100, kp_id=100, genres=["драма"], combined_rating=8.7, sum_votes=1))
+    assert genre_leaderboards.top(db, "драма", 2, exclude_id=movies[0].id) == [100, movies[1].id]
+    genre_leaderboards.clear()
+
+
+def test_search_movies_falls_back_to_substring_on_sqlite(client, db):
+    """Без pg_trgm поиск остается поиском подстроки в названии"""
+    from app.models.movie import Movie
+
+    db.add_all([Movie(kp_id=1, title="Крестный отец"), Movie(kp_id=2, title="Отец невесты")])
+    db.commit()
+
+    response = client.get("/api/movies/search?q=Крестный")
+    assert [movie["kp_id"] for movie in response.json()] == [1]
+    response = client.get("/api/movies/search?q=отец&fuzzy=false")
+    assert [movie["kp_id"] for movie in response.json()] == [1]
+
+
+def test_catalog_search_keeps_substring_match_on_postgresql():
+    """Фильтр q каталога на PostgreSQL: нечеткое совпадение или подстрока; fuzzy=false - только подстрока"""
+    from unittest.mock import Mock
+
+    from sqlalchemy.dialects import postgresql
+
+    from app.repositories.movies import title_search_filter
+
+    db = Mock()
+    db.get_bind.return_value.dialect.name = "postgresql"
+
+    def sql(fuzzy):
+        return str(title_search_filter(db, "отец", fuzzy).compile(dialect=postgresql.dialect()))
+
+    assert "%>" in sql(True) and "ILIKE" in sql(True)
+    assert "%>" not in sql(False) and "ILIKE" in sql(False)
+
+
+def test_search_uses_catalog_title_filter_on_postgresql(monkeypatch):
+    """/search при fuzzy ищет так же, как q каталога (pg_trgm или подстрока), порядок - по близости"""
+    from unittest.mock import MagicMock
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.orm import Session
+
+    from app.repositories.movies import MovieRepository
+
+    queries = []
+    monkeypatch.setattr(
+        "app.repositories.movies.select_columns", lambda query, columns: queries.append(query) or MagicMock()
+    )
+    # Запрос только собирается, соединения с БД нет
+    MovieRepository(Session(bind=create_engine("postgresql://"))).search_movies(q="три")
+    sql = str(queries[0].statement.compile(dialect=postgresql.dialect()))
+    assert "%>" in sql and "ILIKE" in sql
+    assert "ORDER BY greatest(word_similarity" in sql
+
+
+def test_get_movies_filters_genres_exactly(client, db):
+    """Жанры сравниваются целиком и без учета регистра; and - все жанры, or - любой"""
+    from app.models.movie import Movie
+
+    db.add_all([
+        Movie(kp_id=1, title="Драма", genres=[" Драма", "криминал"], sum_votes=60_000),
+        Movie(kp_id=2, title="Мелодрама", genres=["мелодрама"], sum_votes=60_000),
+        Movie(kp_id=3, title="Криминал", genres=["КРИМИНАЛ", "комедия"], sum_votes=60_000),
+    ])
+    db.commit()
+
+    def kp_ids(query):
+        return sorted(movie["kp_id"] for movie in client.get(f"/api/movies/?{query}").json())
+
+    assert db.query(Movie).filter(Movie.kp_id == 1).one().genres == ["драма", "криминал"]
+    assert kp_ids("genre=Драма") == [1]
+    assert kp_ids("genre=драма&genre=криминал") == [1]
+    assert kp_ids("genre=драма,комедия&genre_mode=or") == [1, 3]
+
+
+def test_cursor_pagination_walks_all_pages_without_duplicates(client, db):
+    """Страницы по курсору идут подряд без повторов, даже если между ними вставлен фильм"""
+    from app.models.movie import Movie
+
+    ratings = [8.0, 8.0, 9.1, None, 7.5, 8.0, 6.0]
+    db.add_all([
+        Movie(kp_id=i, title=f"Фильм {i}", combined_rating=rating, sum_votes=60_000 + i % 2)
+        for i, rating in enumerate(ratings, start=1)
+    ])
+    db.commit()
+
+    def walk(path, inserted):
+        pages, cursor = [], ""
+        while cursor is not None:
+            response = client.get(path, params={"cursor": cursor, "limit": 3})
+            assert response.status_code == status.HTTP_200_OK
+            pages.append([movie["kp_id"] for movie in response.json()])
+            cursor = response.headers.get("X-Next-Cursor")
+            if len(pages) == 1:
+                # Вставка между запросами не сдвигает следующие страницы
+                db.add(inserted)
+                db.commit()
+        return pages
+
+    # Рейтинг, затем голоса, затем id (все по убыванию); фильм без рейтинга - в конце
+    best = Movie(kp_id=100, title="Новый", combined_rating=9.9, sum_votes=70_000)
+    assert walk("/api/movies/top", best) == [[3, 1, 6], [2, 5, 7], [4]]
+    last = Movie(kp_id=101, title="Я последний", sum_votes=70_000)
+    assert walk("/api/movies/?sort_by=title", last) == [[100, 1, 2], [3, 4, 5], [6, 7, 101], []]
+
+    first = client.get("/api/movies/top", params={"cursor": "", "limit": 1}).headers["X-Next-Cursor"]
+    assert client.get("/api/movies/", params={"cursor": first, "sort_by": "year"}).status_code == 400
+    assert client.get("/api/movies/", params={"cursor": "не курсор"}).status_code == 400
+
+
+def test_top_ranking_refresher_runs_on_schedule(monkeypatch):
+    """Фоновый пересчет movie_top_ranking идет по расписанию и останавливается; на SQLite представления нет"""
+    import threading
+
+    from app.services.top_ranking import TopRankingRefresher
+
+    refreshed = threading.Event()
+    monkeypatch.setattr("app.services.top_ranking.refresh_top_ranking", refreshed.set)
+    refresher = TopRankingRefresher(interval=0.01)
+    refresher.start()
+    assert refreshed.wait(5)
+    refresher.stop()
+    assert refresher._thread is None
+
+    # Без расписания пересчет идет только по запросу, например после создания фильма
+    refreshed.clear()
+    refresher = TopRankingRefresher(interval=0)
+    refresher.start()
+    assert not refreshed.wait(0.05)
+    refresher.request()
+    assert refreshed.wait(5)
+    refresher.stop()
+
+
+def test_top_ranking_refresh_skipped_while_another_worker_holds_lock(monkeypatch):
+    """REFRESH только под advisory lock; наличие представления перепроверяется по TTL"""
+    from unittest.mock import Mock
+
+    from app.repositories.movies import MovieRepository
+
+    db = Mock()
+    db.get_bind.return_value.dialect.name = "postgresql"
+    # Представление есть, блокировку держит другой воркер
+    db.execute.return_value.scalar.side_effect = [True, False, False]
+    MovieRepository.forget_top_ranking()
+
+    assert MovieRepository(db).refresh_top_ranking() is False
+    assert not any("REFRESH" in str(call.args[0]) for call in db.execute.call_args_list)
+
+    # Представление удалили: после TTL это видно без перезапуска
+    monkeypatch.setattr("app.repositories.movies.TOP_RANKING_CHECK_TTL", 0)
+    assert MovieRepository(db).has_top_ranking() is False
+    MovieRepository.forget_top_ranking()
+
+
+def test_top_movies_without_ranking_view_on_sqlite(client, db):
+    """Без movie_top_ranking /top сортирует таблицу как раньше"""
+    from app.models.movie import Movie
+    from app.repositories.movies import MovieRepository
+
+    db.add_all([
+        Movie(kp_id=1, title="Второй", combined_rating=8.0, sum_votes=60_000),
+        Movie(kp_id=2, title="Первый", combined_rating=9.0, sum_votes=60_000),
+        Movie(kp_id=3, title="Мало голосов", combined_rating=9.5, sum_votes=10),
+    ])
+    db.commit()
+
+    assert MovieRepository(db).refresh_top_ranking() is False
+    assert [movie["kp_id"] for movie in client.get("/api/movies/top").json()] == [2, 1]
+
+
+def test_list_views_return_only_requested_fields(client, db):
+    """view=card и fields= отдают только выбранные колонки, курсор при этом работает"""
+    from app.models.movie import Movie
+    from app.schemas.movie import MovieCard
+
+    db.add_all([
+        Movie(kp_id=i, title=f"Фильм {i}", year_release=2000 + i, genres=["драма"],
+              combined_rating=7.0 + i, sum_votes=60_000, description="длинное описание")
+        for i in range(1, 4)
+    ])
+    db.commit()
+
+    cards = client.get("/api/movies/top", params={"view": "card"}).json()
+    assert [set(card) for card in cards] == [set(MovieCard.model_fields)] * 3
+    assert cards[0]["genres"] == ["драма"]
+
+    params = {"fields": "title,year_release", "sort_by": "title", "cursor": "", "limit": 2}
+    response = client.get("/api/movies/", params=params)
+    assert [set(movie) for movie in response.json()] == [{"id", "title", "year_release"}] * 2
+    assert [movie["year_release"] for movie in response.json()] == [2001, 2002]
+    assert response.headers["X-Next-Cursor"]
+
+    found = client.get("/api/movies/search", params={"q": "Фильм 2", "view": "card"}).json()
+    assert [movie["kp_id"] for movie in found] == [2]
+    assert client.get("/api/movies/", params={"fields": "title,secret"}).status_code == 400
+
+    # Полный ответ по-прежнему MovieResponse, а в OpenAPI описаны все три формы
+    full = client.get("/api/movies/top").json()
+    assert full[0]["description"] == "длинное описание"
+    schema = client.get("/api/openapi.json").json()["paths"]["/api/movies/top"]["get"]["responses"]["200"]
+    variants = schema["content"]["application/json"]["schema"]["anyOf"]
+    assert [variant["items"].get("$ref", "").rsplit("/", 1)[-1] for variant in variants] == [
+        "MovieResponse", "MovieCard", "",
+    ]
+
+
+def test_fulltext_search_finds_by_description_and_director_on_sqlite(client, db):
+    """mode=fulltext ищет не только в названии; на SQLite - подстрока, фрагментов нет"""
+    from app.models.movie import Movie
+
+    db.add_all([
+        Movie(kp_id=1, title="Начало", director="Кристофер Нолан", description="Кобб крадет сны", sum_votes=10),
+        Movie(kp_id=2, title="Помни", director="Кристофер Нолан", description="Потеря памяти", sum_votes=20),
+        Movie(kp_id=3, title="Сны", description="Другое", sum_votes=5),
+    ])
+    db.commit()
+
+    response = client.get("/api/movies/search", params={"q": "Нолан", "mode": "fulltext"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [(movie["kp_id"], movie["headline"]) for movie in response.json()] == [(2, None), (1, None)]
+
+    found = client.get("/api/movies/search", params={"q": "сны", "mode": "fulltext", "fields": "kp_id"}).json()
+    assert found == [{"id": found[0]["id"], "kp_id": 1, "headline": None}]
+
+
+def test_suggest_matches_word_prefixes_and_transliteration(client, db, monkeypatch):
+    """Подсказки по началу любого слова и по транслиту, популярные выше, без записи SearchLog"""
+    from app.models.analytics import SearchLog
+    from app.models.movie import Movie
+    from app.recommender.suggest import movie_suggest
+
+    db.add_all([
+        Movie(kp_id=1, title="Матрица", english_title="The Matrix", sum_votes=900),
+        Movie(kp_id=2, title="Матрица: Перезагрузка", english_title="The Matrix Reloaded", sum_votes=500),
+        Movie(kp_id=3, title="Матрёшка", sum_votes=1000),
+    ])
+    db.commit()
+    movie_suggest.clear()
+
+    def titles(q):
+        response = client.get("/api/movies/suggest", params={"q": q})
+        assert response.status_code == status.HTTP_200_OK
+        return [movie["title"] for movie in response.json()]
+
+    assert titles("мат") == ["Матрёшка", "Матрица", "Матрица: Перезагрузка"]
+    assert titles("матре") == ["Матрёшка"]
+    assert titles("перез") == ["Матрица: Перезагрузка"]
+    assert titles("matrix rel") == titles("matritsa p") == ["Матрица: Перезагрузка"]
+
+    # Префиксы до SHORT_PREFIX символов - из заранее посчитанных списков, без обхода ключей
+    def scan(*args):
+        raise AssertionError("short prefix scanned the keys")
+
+    monkeypatch.setattr(movie_suggest, "_top", scan)
+    assert titles("мат") == ["Матрёшка", "Матрица", "Матрица: Перезагрузка"]
+    monkeypatch.undo()
+
+    movie_suggest.add(Movie(id=100, kp_id=100, title="Мать", sum_votes=5000))
+    assert titles("ма")[0] == "Мать"
+    assert db.query(SearchLog).count() == 0
+    movie_suggest.clear()
+
+
+def test_facets_count_catalog_under_current_filter(client, db):
+    """Счетчики фасетов одним запросом под фильтром, повтор с тем же фильтром - из кэша"""
+    from app.models.movie import Movie
+    from app.services.movies import facets_cache
+
+    db.add_all([
+        Movie(kp_id=1, title="А", genres=["драма", "криминал"], countries=["США"], year_release=1994,
+              combined_rating=8.9, sum_votes=60_000),
+        Movie(kp_id=2, title="Б", genres=["драма"], countries=["США", "Франция"], year_release=1994,
+              combined_rating=7.6, sum_votes=60_000),
+        Movie(kp_id=3, title="В", genres=["комедия"], countries=["Россия"], year_release=2010,
+              combined_rating=6.1, sum_votes=60_000),
+        Movie(kp_id=4, title="Мало голосов", genres=["драма"], year_release=2020, sum_votes=10),
+    ])
+    db.commit()
+    facets_cache.clear()
+
+    facets = client.get("/api/movies/facets").json()
+    assert facets["genres"] == [
+        {"value": "драма", "count": 2}, {"value": "комедия", "count": 1}, {"value": "криминал", "count": 1},
+    ]
+    assert facets["countries"][0] == {"value": "США", "count": 2}
+    assert facets["years"] == [{"value": 2010, "count": 1}, {"value": 1994, "count": 2}]
+    assert facets["ratings"] == [{"value": 8, "count": 1}, {"value": 7, "count": 2}, {"value": 6, "count": 3}]
+
+    drama = client.get("/api/movies/facets", params={"genre": "Драма"}).json()
+    assert drama["genres"] == [{"value": "драма", "count": 2}, {"value": "криминал", "count": 1}]
+    assert [item["value"] for item in drama["countries"]] == ["США", "Франция"]
+
+    db.add(Movie(kp_id=5, title="Г", genres=["драма"], sum_votes=60_000))
+    db.commit()
+    assert client.get("/api/movies/facets", params={"genre": " драма"}).json() == drama
+    facets_cache.clear()
+
+
+def test_batch_returns_movies_in_requested_order(client, db):
+    """Пакет фильмов в порядке ids без повторов; просмотры пишутся только с log_views"""
+    from app.models.analytics import MovieViewLog
+    from app.models.movie import Movie
+
+    movies = [Movie(kp_id=i, title=f"Фильм {i}") for i in range(1, 4)]
+    db.add_all(movies)
+    db.commit()
+    first, second, third = (movie.id for movie in movies)
+
+    response = client.get("/api/movies/batch", params={"ids": f"{third},{first},99999,{third}"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [movie["kp_id"] for movie in response.json()] == [3, 1]
+    assert db.query(MovieViewLog).count() == 0
+
+    response = client.get(f"/api/movies/batch?ids={second}&ids={first}&log_views=true")
+    assert [movie["kp_id"] for movie in response.json()] == [2, 1]
+    assert sorted(log.movie_id for log in db.query(MovieViewLog)) == [first, second]
+
+    assert client.get("/api/movies/batch", params={"ids": "1,x"}).status_code == 400
+    too_many = ",".join(str(i) for i in range(1, 202))
+    assert client.get("/api/movies/batch", params={"ids": too_many}).status_code == 400
+
+
+def test_similar_movies_sql_fallback_skips_second_edge_query(client, db, monkeypatch):
+    """Без связей и без таблицы жанра в памяти запрос связей не повторяется"""
+    from app.models.movie import Movie
+    from app.repositories.movies import MovieRepository
+
+    movies = [
+        Movie(kp_id=1, title="Без связей", genres=["драма"], combined_rating=7.0),
+        Movie(kp_id=2, title="Лучший", genres=["драма"], combined_rating=9.0),
+    ]
+    db.add_all(movies)
+    db.commit()
+    calls = []
+    original = MovieRepository.get_similar_by_edges
+
+    def get_similar_by_edges(self, *args, **kwargs):
+        calls.append(args)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(MovieRepository, "get_similar_by_edges", get_similar_by_edges)
+    monkeypatch.setattr("app.services.movies.genre_leaderboards.top", lambda *args, **kwargs: None)
+
+    response = client.get(f"/api/movies/{movies[0].id}/similar")
+    assert [movie["kp_id"] for movie in response.json()] == [2]
+    assert len(calls) == 1
@@ -0,0 +1,295 @@
+import itertools
+import os
+import shutil
+import threading
+
+import numpy as np
+import pytest
+
+from app.basic_algorithm import load_genre_data, recommend_kp_ids
+from app.recommender.answer_table import AnswerTable, build_answer_table
+from app.recommender.executor import RecommenderBusyError, RecommenderExecutor
+from app.recommender.registry import GenreRegistry
+from app.recommender.snapshot import build_snapshot, load_snapshot
+from app.recommender.tracing import StageHistograms, stage, traced
+from app.recommender.scoring import encode_criteria, match_masks, rank_movies
+
+GENRE_DIR = os.path.join(os.path.dirname(__file__), "..", "app", "genre_with_info")
+
+
+def test_registry_matches_load_genre_data():
+    """Датасет из реестра совпадает с тем, что возвращает load_genre_data"""
+    registry = GenreRegistry(GENRE_DIR)
+    dataset = registry.get("Драма")
+    expected = load_genre_data(os.path.join(GENRE_DIR, "Драма.csv"))
+
+    assert dataset is not None
+    assert dataset.to_frame().equals(expected)
+
+
+def test_registry_reloads_changed_file(tmp_path):
+    """Файл перечитывается только после изменения mtime"""
+    path = tmp_path / "Жанр.csv"
+    path.write_text("Фильм;Жанр;А;Б;В;7.0;1;Film;8.0;0\n", encoding="utf-8")
+    registry = GenreRegistry(str(tmp_path))
+
+    first = registry.get("Жанр")
+    assert registry.get("Жанр") is first
+    assert first.ratings.tolist() == [7.5]
+    assert first.kp_ids.tolist() == [1]
+
+    path.write_text("Фильм;Жанр;А;Б;В;7.0;1;Film;8.0;0\nДругой;Жанр;А;Б;В;6.0;2;Other;0;0\n", encoding="utf-8")
+    os.utime(path, ns=(first.mtime_ns + 1_000_000, first.mtime_ns + 1_000_000))
+
+    second = registry.get("Жанр")
+    assert second is not first
+    assert len(second) == 2
+
+
+def test_registry_version_does_not_load_dataset(tmp_path):
+    """Версия для ключа кэша - mtime файла, разбор CSV остается пулу рекомендаций"""
+    path = tmp_path / "Жанр.csv"
+    path.write_text("Фильм;Жанр;А;Б;В;7.0;1;Film;8.0;0\n", encoding="utf-8")
+    registry = GenreRegistry(str(tmp_path))
+
+    assert registry.version("Жанр") == os.stat(path).st_mtime_ns
+    assert registry._datasets == {}
+    assert registry.version("Нет такого") is None
+
+
+def test_registry_rejects_paths_outside_data_dir(tmp_path):
+    registry = GenreRegistry(str(tmp_path))
+    assert registry.get("../Драма") is None
+
+
+def reference_recommend(df, user_input, top_n=10):
+    """Прежняя реализация recommend_movies: построчный паттерн и сортировка DataFrame"""
+    df = df.copy()
+    match_patterns = []
+    exact_matches_counts = []
+    for _, row in df.iterrows():
+        pattern = "1"
+        exact_matches = 1 if str(row[1]).strip().strip('"') == user_input[0].strip() else 0
+        for i in range(1, min(len(user_input), 5)):
+            if str(row[i + 1]).strip().strip('"') == user_input[i].strip():
+                pattern += "1"
+                exact_matches += 1
+            else:
+                pattern += "2"
+        match_patterns.append(pattern.ljust(4, "2"))
+        exact_matches_counts.append(exact_matches - 1)
+    df["match_pattern"] = match_patterns
+    df["exact_matches"] = exact_matches_counts
+    df_sorted = df.sort_values(
+        by=["exact_matches", "match_pattern", "Средняя оценка"],
+        ascending=[False, True, False],
+    )
+    return [str(title).strip().strip('"') or "Без названия" for title in df_sorted[0].head(top_n)]
+
+
+@pytest.mark.parametrize("genre", ["Драма", "Комедия", "Ужасы", "Исторический"])
+def test_vectorized_ranking_matches_reference(genre, monkeypatch):
+    """Векторный подсчет дает тот же порядок, что и прежняя сортировка DataFrame"""
+    from app import basic_algorithm
+
+    registry = GenreRegistry(GENRE_DIR)
+    monkeypatch.setattr("app.recommender.registry.genre_registry", registry)
+    dataset = registry.get(genre)
+    df = dataset.to_frame()
+
+    subgenres = sorted(set(dataset.criteria[1]))[:3] + ["Нет такого"]
+    details = sorted(set(dataset.criteria[2]))[:3]
+    periods = sorted(set(dataset.criteria[3]))
+    for user_input in itertools.product([genre], subgenres, details, periods):
+        user_input = list(user_input)
+        expected = reference_recommend(df, user_input, top_n=50)
+        for top_n in (1, 10, 50):
+            assert basic_algorithm.recommend_movies(user_input, top_n=top_n) == expected[:top_n]
+
+
+def test_ranking_counts_genre_mismatch_like_reference():
+    """Несовпадение жанра в строке уменьшает exact_matches, как в прежней реализации"""
+
+    criteria = [
+        np.array(["Драма", "Комедия", "Драма"], dtype=object),
+        np.array(["А", "А", "Б"], dtype=object),
+        np.array(["В", "В", "В"], dtype=object),
+        np.array(["Г", "Г", "Г"], dtype=object),
+    ]
+    ratings = np.array([5.0, 9.0, 7.0])
+    encoded = encode_criteria(criteria, ratings)
+    masks = match_masks(encoded, ["Драма", "А", "В", "Г"])
+
+    # Без учета жанра второй фильм был бы первым: все критерии совпадают и оценка выше
+    assert rank_movies(encoded, masks, 3).tolist() == [0, 1, 2]
+
+
+@pytest.fixture
+def genre_copy(tmp_path):
+    """Копия двух файлов жанров во временной папке"""
+    data_dir = tmp_path / "genres"
+    data_dir.mkdir()
+    for genre in ("Исторический", "Детектив"):
+        shutil.copy(os.path.join(GENRE_DIR, f"{genre}.csv"), data_dir / f"{genre}.csv")
+    return GenreRegistry(str(data_dir))
+
+
+def test_answer_table_matches_live_scorer(genre_copy, tmp_path, monkeypatch):
+    """Готовые ответы совпадают с живым алгоритмом для каждой комбинации"""
+    path = str(tmp_path / "answers.npz")
+    stats = build_answer_table(path, registry=genre_copy, top_n=10)
+    assert stats == {"rebuilt": 2, "kept": 0, "skipped": 0}
+    monkeypatch.setattr("app.recommender.registry.genre_registry", genre_copy)
+
+    table = AnswerTable(path, registry=genre_copy)
+    # В "Детективе" есть строки без kp_id
+    for genre, combo in (
+        (genre, combo)
+        for genre in ("Исторический", "Детектив")
+        for combo in itertools.product(*(sorted(set(column)) for column in genre_copy.get(genre).criteria[1:]))
+    ):
+        dataset = genre_copy.get(genre)
+        user_input = [genre, *combo]
+        # Строки без kp_id пропускаются, а список добирается следующими по рейтингу
+        ranking = rank_movies(dataset.encoded, match_masks(dataset.encoded, user_input), len(dataset))
+        expected = [int(kp_id) for kp_id in dataset.kp_ids[ranking] if kp_id >= 0][:10]
+        assert table.lookup(*user_input) == expected
+        assert recommend_kp_ids(user_input, 10) == expected
+
+
+def test_answer_table_rebuilds_only_changed_genres(genre_copy, tmp_path):
+    path = str(tmp_path / "answers.npz")
+    build_answer_table(path, registry=genre_copy)
+
+    with open(genre_copy.path_for("Детектив"), "a", encoding="utf-8") as f:
+        f.write("Новый фильм;Детектив;Нуар;Мрачное;Новинки (2020–2025);7.0;1;New;7.0;0\n")
+
+    stats = build_answer_table(path, registry=genre_copy)
+    assert stats == {"rebuilt": 1, "kept": 1, "skipped": 0}
+
+
+def test_answer_table_falls_back_for_unknown_or_stale(genre_copy, tmp_path):
+    path = str(tmp_path / "answers.npz")
+    build_answer_table(path, registry=genre_copy)
+    table = AnswerTable(path, registry=genre_copy)
+    dataset = genre_copy.get("Детектив")
+    known = [sorted(set(column))[0] for column in dataset.criteria[1:]]
+
+    assert table.lookup("Детектив", *known)
+    assert table.lookup("Детектив", "Нет такого", *known[1:]) is None
+    assert table.lookup("Нет такого жанра", *known) is None
+
+    # CSV изменили после сборки - таблица для жанра больше не используется
+    with open(genre_copy.path_for("Детектив"), "a", encoding="utf-8") as f:
+        f.write("Новый фильм;Детектив;Нуар;Мрачное;Новинки (2020–2025);7.0;1;New;7.0;0\n")
+    assert table.lookup("Детектив", *known) is None
+
+
+def test_snapshot_matches_csv(genre_copy, tmp_path):
+    """Датасеты и строки файлов похожих из снимка совпадают с разбором CSV"""
+    from app.fill_similar_movies import read_csv_rows
+
+    similar_dir = tmp_path / "similar"
+    similar_dir.mkdir()
+    similar_path = similar_dir / "Детектив_обновленный.csv"
+    similar_path.write_text("0;1;20_похожих\nФильм;Детектив;\"Другой;Третий\"\nКороткая строка\n", encoding="cp1251")
+
+    snapshot_dir = str(tmp_path / "snapshot")
+    stats = build_snapshot(snapshot_dir, genre_copy.base_path, str(similar_dir))
+    assert stats["genres"] == 2
+    assert stats["similar_rows"] == 3
+
+    registry = GenreRegistry(genre_copy.base_path, snapshot_path=snapshot_dir)
+    for genre in ("Исторический", "Детектив"):
+        expected, actual = genre_copy.get(genre), registry.get(genre)
+        # Подсчет идет по кодам из отображенных файлов, строковые колонки не декодируются
+        assert isinstance(actual.encoded.codes, np.memmap)
+        assert actual.encoded.vocabularies == expected.encoded.vocabularies
+        assert actual.encoded.rating_order.tolist() == expected.encoded.rating_order.tolist()
+        user_input = [genre, *(sorted(set(column))[0] for column in expected.criteria[1:])]
+        assert rank_movies(actual.encoded, match_masks(actual.encoded, user_input), 10).tolist() == \
+            rank_movies(expected.encoded, match_masks(expected.encoded, user_input), 10).tolist()
+        assert "columns" not in actual.__dict__
+        assert actual.to_frame().equals(expected.to_frame())
+        assert actual.kp_ids.tolist() == expected.kp_ids.tolist()
+
+    snapshot = load_snapshot(snapshot_dir)
+    entry = snapshot.entry("similar", similar_path.name, str(similar_path))
+    assert list(snapshot.table_rows(entry)) == list(read_csv_rows(similar_path))
+
+    # После изменения CSV снимок для него больше не используется
+    with open(genre_copy.path_for("Детектив"), "a", encoding="utf-8") as f:
+        f.write("Новый фильм;Детектив;Нуар;Мрачное;Новинки (2020–2025);7.0;1;New;7.0;0\n")
+    assert snapshot.entry("genres", "Детектив", genre_copy.path_for("Детектив")) is None
+    assert len(registry.get("Детектив")) == len(genre_copy.get("Детектив"))
+
+
+def test_cached_dataset_survives_snapshot_rebuild(genre_copy, tmp_path):
+    """Пересборка снимка удаляет файлы прошлой сборки, а датасет из нее все еще читает названия"""
+    snapshot_dir = str(tmp_path / "snapshot")
+    build_snapshot(snapshot_dir, genre_copy.base_path, str(tmp_path / "no_similar"))
+    registry = GenreRegistry(genre_copy.base_path, snapshot_path=snapshot_dir)
+    dataset = registry.get("Детектив")
+    assert "columns" not in dataset.__dict__
+    old_files = set(os.listdir(snapshot_dir))
+
+    build_snapshot(snapshot_dir, genre_copy.base_path, str(tmp_path / "no_similar"))
+    assert not old_files & {name for name in os.listdir(snapshot_dir) if name.endswith(".npy")}
+    # CSV не менялся - реестр отдает тот же датасет, его строки декодируются из старой сборки
+    assert registry.get("Детектив") is dataset
+    assert dataset.titles.tolist() == genre_copy.get("Детектив").titles.tolist()
+
+
+def test_executor_rejects_when_queue_is_full():
+    """Сверх workers + queue_depth задач пул сразу отказывает, а не ждет"""
+    executor = RecommenderExecutor(workers=1, queue_depth=0, retry_after=3)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "готово"
+
+    worker = threading.Thread(target=executor.run, args=(slow,))
+    worker.start()
+    started.wait(5)
+    try:
+        with pytest.raises(RecommenderBusyError) as exc:
+            executor.run(lambda: None)
+        assert exc.value.retry_after == 3
+        assert executor.stats()["running"] == 1
+    finally:
+        release.set()
+        worker.join()
+
+    assert executor.run(lambda: 42) == 42
+    stats = executor.stats()
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 2
+    assert stats["in_flight"] == 0
+    executor.shutdown()
+
+
+def test_tracing_collects_stages_including_executor(monkeypatch):
+    """Этапы из пула рекомендаций попадают в трассировку запроса и в гистограммы"""
+    histograms = StageHistograms()
+    monkeypatch.setattr("app.recommender.tracing.stage_histograms", histograms)
+    executor = RecommenderExecutor(workers=1, queue_depth=0)
+
+    def work():
+        with stage("score"):
+            return 1
+
+    with traced(sample_rate=1) as trace:
+        with stage("load"):
+            pass
+        executor.run(work)
+    executor.shutdown()
+
+    assert set(trace.stages) == {"load", "queue", "score"}
+    assert trace.server_timing().endswith(f"total;dur={trace.total * 1000:.3f}")
+    assert histograms.stats()["score"]["count"] == 1
+    assert histograms.stats()["total"]["buckets"]["+Inf"] == 1
+
+    with traced(sample_rate=0) as trace:
+        assert trace is None
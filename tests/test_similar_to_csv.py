@@ -0,0 +1,64 @@
+import os
+import random
+
+import pandas as pd
+
+from app.basic_algorithm import read_genre_table
+from create_data.similar_to_csv import (
+    calculate_average_rating,
+    find_top_20_similar_movies_all,
+    find_top_20_similar_movies_for_movie,
+    process_all_genre_files,
+)
+
+GENRE_DIR = os.path.join(os.path.dirname(__file__), "..", "app", "genre_with_info")
+
+
+def test_vectorized_similar_matches_per_movie_on_genre_file():
+    """Векторный подбор дает те же 20 похожих, что и покадровый, для каждого фильма файла"""
+    df = read_genre_table(os.path.join(GENRE_DIR, "Исторический.csv"), verbose=False)
+    avg_ratings = [calculate_average_rating(row) for _, row in df.iterrows()]
+
+    expected = [find_top_20_similar_movies_for_movie(df, i, avg_ratings) for i in range(len(df))]
+    assert find_top_20_similar_movies_all(df, avg_ratings) == expected
+
+
+def test_vectorized_similar_matches_on_mixed_genres_and_index_gaps():
+    """Разные жанры, пустые названия, равные оценки и пропуски в индексе"""
+    rng = random.Random(1)
+    rows = [
+        [
+            rng.choice(["Фильм A", "Фильм B", "", "Фильм C"]),
+            rng.choice(["Драма", "Комедия"]),
+            rng.choice("ab"),
+            rng.choice("xyz"),
+            rng.choice("pq"),
+        ]
+        for _ in range(60)
+    ]
+    df = pd.DataFrame(rows).drop(index=[3, 10])
+    avg_ratings = [rng.choice([7.0, 7.5, 8.0, 0.0]) for _ in range(len(df))]
+
+    expected = [find_top_20_similar_movies_for_movie(df, i, avg_ratings) for i in range(len(df))]
+    assert find_top_20_similar_movies_all(df, avg_ratings) == expected
+
+    # Сходство идет парой к тем же названиям, по одному значению на фильм
+    for (titles, scores), similar in zip(find_top_20_similar_movies_all(df, avg_ratings, with_scores=True), expected):
+        assert titles == similar
+        values = [float(score) for score in scores.split(";") if score]
+        assert len(values) == len([title for title in similar.split(";") if title])
+        assert all(0 <= value <= 1 for value in values)
+
+
+def test_parallel_build_matches_sequential(tmp_path):
+    """Сборка в несколько процессов дает те же файлы и не оставляет временных"""
+    for genre in ("Драма", "Комедия"):
+        rows = [f"{genre} {i};{genre};Поджанр {i % 3};Настроение {i % 4};Классика;{5 + i % 5}.0" for i in range(30)]
+        (tmp_path / f"{genre}.csv").write_text("\n".join(rows), encoding="cp1251")
+
+    sequential = {os.path.basename(path): open(path, "rb").read() for path in process_all_genre_files(str(tmp_path))}
+    parallel = {os.path.basename(path): open(path, "rb").read() for path in process_all_genre_files(str(tmp_path), jobs=2)}
+
+    assert set(parallel) == {"Драма_обновленный.csv", "Комедия_обновленный.csv"}
+    assert parallel == sequential
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]